@@ -3,45 +3,344 @@ ai_detector.py - AI Inference engine for vehicle detection
 Uses YOLOv8 (Ultralytics) optimized for Raspberry Pi 5.
 """
 
+import time
 import logging
+import threading
+from collections import namedtuple
+import numpy as np
 from ultralytics import YOLO
 
 logger = logging.getLogger(__name__)
 
+# box is (x1, y1, x2, y2) in frame pixels
+Detection = namedtuple("Detection", ["cls_id", "name", "score", "box"])
+
+
+class Detections(list):
+    """Target-class detections; `others` holds the non-target ones when the detector keeps them."""
+    others = ()
+
+
 class AiDetector:
     """
     Handles AI inference on image frames.
+    The model can be hot-swapped: a new one is loaded and warmed up in the
+    background while the current one keeps serving.
+    In client mode frames go to a remote inference server first, with the
+    local model as fallback when the server is slow or down.
     """
-    def __init__(self, model_path='yolov8n.pt', confidence=0.5):
+    def __init__(self, model_path='yolov8n.pt', confidence=0.5, remote=None, imgsz=640, cascade=None):
         self.model = YOLO(model_path)
+        self.model_path = model_path
         self.confidence = confidence
+        self.imgsz = imgsz
         # Classes to detect: 3: 'motorcycle', maybe custom ATV class if model is trained
-        # In standard COCO, motorcycle is index 3. 
+        # In standard COCO, motorcycle is index 3.
         # ATVs are often misclassified as motorcycles or trucks.
         self.target_classes = [3] # Motorcycle
+        # Also return non-target detections as `.others` (for the detection log)
+        self.keep_others = False
+        self.swap_status = {"state": "idle", "model": model_path, "error": None}
+        self._swap_lock = threading.Lock()
+        # Local inference is not re-entrant; callers on different threads take turns
+        self._model_lock = threading.Lock()
+        self._batch_buffers = None
+        self._loader = None
+        self._pending = None
+        self._last_frame = None
+        self._remote = None
+        self._remote_cfg = None
+        self._remote_down_until = 0.0
+        self.remote_stats = {"remote": 0, "fallback": 0}
+        self._cascade = None
+        self._cascade_cfg = None
+        self._screen_model = None
+        self.cascade_stats = {"frames": 0, "screened_out": 0, "escalated": 0, "confirmed": 0,
+                              "audits": 0, "audit_misses": 0, "screen_ms": 0.0, "confirm_ms": 0.0}
         logger.info(f"Modelul YOLOv8 ({model_path}) a fost încărcat.")
+        self.set_remote(remote)
+        self.set_cascade(cascade)
 
-    def detect(self, frame):
+    def set_remote(self, remote_cfg):
+        """Enable/disable client mode from the `ai.remote` config section."""
+        if remote_cfg == self._remote_cfg:
+            return
+        self._remote_cfg = dict(remote_cfg) if remote_cfg else None
+        old, self._remote = self._remote, None
+        if old:
+            old.close()
+        if remote_cfg and remote_cfg.get("enabled"):
+            from inference_server import RemoteInferenceClient
+            self._remote = RemoteInferenceClient(
+                remote_cfg["address"], timeout=remote_cfg["timeout_ms"] / 1000.0,
+                jpeg_quality=remote_cfg["jpeg_quality"], max_side=remote_cfg["max_side"])
+            self._remote_down_until = 0.0
+            logger.info(f"🌐 Mod client inferență: {remote_cfg['address']} "
+                        f"(timeout {remote_cfg['timeout_ms']} ms, rezervă locală).")
+
+    def set_cascade(self, cascade_cfg):
         """
-        Detects target vehicles in a frame.
-        Returns True if a target vehicle is found.
+        Enable/disable the two-stage cascade from the `ai.cascade` config section:
+        a cheap screening pass (small input size, optionally a smaller model) on
+        every frame, and the configured model only on the region it flagged.
+        """
+        if cascade_cfg == self._cascade_cfg:
+            return
+        self._cascade_cfg = dict(cascade_cfg) if cascade_cfg else None
+        if not (cascade_cfg and cascade_cfg.get("enabled")):
+            self._cascade = None
+            self._screen_model = None
+            return
+        screen_path = cascade_cfg.get("screen_model")
+        # Empty screen_model: the configured model itself at screen_imgsz
+        self._screen_model = YOLO(screen_path) if screen_path else None
+        self._cascade = dict(cascade_cfg)
+        logger.info(f"🔎 Cascadă activă: screening {screen_path or self.model_path} la {cascade_cfg['screen_imgsz']}px "
+                    f"(conf {cascade_cfg['screen_conf']}), confirmare cu modelul complet pe regiune.")
+
+    def cascade_active(self):
+        """True while local frames go through the cascade (not batched)."""
+        return self._cascade is not None and not self.remote_active()
+
+    def get_cascade_stats(self):
+        """Escalation rate, screening cost and the audit estimate of the cascade's recall."""
+        s = dict(self.cascade_stats)
+        frames = s["frames"] or 1
+        s["enabled"] = self._cascade is not None
+        s["escalated_frac"] = round(s["escalated"] / frames, 4)
+        s["avg_screen_ms"] = round(s["screen_ms"] / frames, 2)
+        s["avg_confirm_ms"] = round(s["confirm_ms"] / s["escalated"], 2) if s["escalated"] else None
+        # Audited screened-out frames stand for all screened-out frames
+        missed = s["audit_misses"] * s["screened_out"] / s["audits"] if s["audits"] else 0.0
+        positives = s["confirmed"] + missed
+        s["est_recall"] = round(s["confirmed"] / positives, 4) if positives else None
+        return s
+
+    def remote_active(self):
+        """True while frames go to the inference server (not in local fallback)."""
+        return self._remote is not None and time.monotonic() >= self._remote_down_until
+
+    def _detect_remote(self, frame):
+        """Detections from the server, or None to fall back to the local model."""
+        remote = self._remote
+        if remote is None or time.monotonic() < self._remote_down_until:
+            return None
+        try:
+            found = remote.infer(frame, self.confidence, self.target_classes)
+        except Exception as e:
+            self._remote_down_until = time.monotonic() + self._remote_cfg["retry_s"]
+            logger.warning(f"Server inferență indisponibil ({e}). Inferență locală "
+                           f"{self._remote_cfg['retry_s']}s.")
+            return None
+        self.remote_stats["remote"] += 1
+        return [Detection(*d) for d in found]
+
+    def set_confidence(self, confidence):
+        """Takes effect on the next inference call."""
+        self.confidence = float(confidence)
+
+    def set_imgsz(self, imgsz):
+        """Model input size (multiple of 32); takes effect on the next inference call."""
+        self.imgsz = int(imgsz)
+
+    def load_model_async(self, model_path, on_done=None, reload=False):
+        """
+        Load, warm up and sanity-check `model_path` on a background thread, then swap it
+        in between two inference calls. On failure the current model keeps serving.
+        `on_done(ok, model_path, error)` runs on the loader thread. `reload` swaps in a
+        fresh instance even when `model_path` is already serving (memory guard).
+        """
+        with self._swap_lock:
+            self._pending = (model_path, on_done, reload)
+            if self._loader and self._loader.is_alive():
+                return  # Picked up when the running load finishes
+            self._loader = threading.Thread(target=self._load_pending, daemon=True, name="model-loader")
+            self._loader.start()
+
+    def _load_pending(self):
+        while True:
+            with self._swap_lock:
+                if self._pending is None:
+                    return
+                model_path, on_done, reload = self._pending
+                self._pending = None
+            if model_path == self.model_path and not reload:
+                continue
+
+            self.swap_status = {"state": "loading", "model": model_path, "error": None}
+            logger.info(f"⏳ Încărcare model nou în fundal: {model_path}")
+            t0 = time.perf_counter()
+            try:
+                new_model = YOLO(model_path)
+                self._sanity_check(new_model)
+            except Exception as e:
+                self.swap_status = {"state": "failed", "model": model_path, "error": str(e)}
+                logger.error(f"Modelul {model_path} a picat verificarea ({e}). Se păstrează {self.model_path}.")
+                if on_done:
+                    on_done(False, model_path, str(e))
+                continue
+
+            # Single reference assignment: in-flight calls finish on the old model
+            old_path = self.model_path
+            self.model = new_model
+            self.model_path = model_path
+            self.swap_status = {"state": "ready", "model": model_path, "error": None}
+            logger.info(f"✅ Model comutat {old_path} -> {model_path} ({time.perf_counter() - t0:.1f}s, fără întrerupere).")
+            if on_done:
+                on_done(True, model_path, None)
+
+    def _sanity_check(self, model):
+        """Warm-up plus sanity inference; raises if the model is unusable for this system."""
+        names = model.names
+        missing = [c for c in self.target_classes if c not in names]
+        if missing:
+            raise ValueError(f"clase țintă lipsă din model: {missing}")
+        # Warm-up on a blank frame, then a real one if we have seen any
+        model(np.zeros((640, 640, 3), dtype=np.uint8), conf=self.confidence, imgsz=self.imgsz, verbose=False)
+        sample = self._last_frame
+        if sample is not None:
+            results = model(sample, conf=self.confidence, imgsz=self.imgsz, verbose=False)
+            for r in results:
+                _ = r.boxes.cls  # Fails if the output format is not a detection head
+
+    def detect_objects(self, frame):
+        """
+        Runs inference and returns the target-class detections in the frame,
+        highest score first.
         """
         if frame is None:
-            return False
-            
-        results = self.model(frame, conf=self.confidence, verbose=False)
-        
-        found = False
+            return []
+
+        self._last_frame = frame
+        detections = self._detect_remote(frame)
+        if detections is not None:
+            return self._ranked(detections)
+        if self._remote:
+            self.remote_stats["fallback"] += 1
+
+        if self._cascade is not None:
+            detections = self._detect_cascade(frame)
+        else:
+            model = self.model  # Local ref: a hot swap never lands mid-call
+            with self._model_lock:
+                results = model(frame, conf=self.confidence, imgsz=self.imgsz, verbose=False)
+            detections = self._collect(results, model, self.target_classes)
+        return self._ranked(detections)
+
+    @staticmethod
+    def _ranked(detections):
+        """Highest score first; the best one is logged."""
+        detections.sort(key=lambda d: d.score, reverse=True)
+        if detections:
+            logger.warning("DETECȚIE: %s identificat!", detections[0].name)
+        return detections
+
+    def _collect(self, results, model, classes, dx=0, dy=0, letterbox=None):
+        """
+        Detections of `classes` from Ultralytics results; (dx, dy) offsets boxes of a crop,
+        `letterbox` = (scale, left, top, w, h) maps boxes of a letterboxed input back to the frame.
+        """
+        detections, others = Detections(), []
         for r in results:
             for box in r.boxes:
                 cls_id = int(box.cls[0])
-                if cls_id in self.target_classes:
-                    found = True
-                    logger.warning(f"DETECȚIE: {self.model.names[cls_id]} identificat!")
-                    break
-            if found: break
-            
-        return found
+                if cls_id in classes or self.keep_others:
+                    x1, y1, x2, y2 = (float(v) for v in box.xyxy[0])
+                    if letterbox is not None:
+                        scale, left, top, w, h = letterbox
+                        x1 = min(max((x1 - left) / scale, 0.0), w); x2 = min(max((x2 - left) / scale, 0.0), w)
+                        y1 = min(max((y1 - top) / scale, 0.0), h); y2 = min(max((y2 - top) / scale, 0.0), h)
+                    d = Detection(cls_id, model.names[cls_id], float(box.conf[0]),
+                                  (x1 + dx, y1 + dy, x2 + dx, y2 + dy))
+                    (detections if cls_id in classes else others).append(d)
+        if others:
+            detections.others = others
+        return detections
+
+    def _screen_roi(self, frame, candidates):
+        """Union of the screening boxes grown by roi_margin, clamped to the frame."""
+        h, w = frame.shape[:2]
+        margin = self._cascade["roi_margin"]
+        x1 = min(d.box[0] for d in candidates); y1 = min(d.box[1] for d in candidates)
+        x2 = max(d.box[2] for d in candidates); y2 = max(d.box[3] for d in candidates)
+        # Never smaller than the screen input, so the confirm pass keeps some context
+        mx = max((x2 - x1) * margin, (self._cascade["screen_imgsz"] - (x2 - x1)) / 2, 0)
+        my = max((y2 - y1) * margin, (self._cascade["screen_imgsz"] - (y2 - y1)) / 2, 0)
+        return (int(max(0, x1 - mx)), int(max(0, y1 - my)),
+                int(min(w, x2 + mx)), int(min(h, y2 + my)))
+
+    def _detect_cascade(self, frame):
+        cfg = self._cascade
+        stats = self.cascade_stats
+        model = self.model
+        screen = self._screen_model or model
+        t0 = time.perf_counter()
+        with self._model_lock:
+            results = screen(frame, conf=cfg["screen_conf"], imgsz=cfg["screen_imgsz"], verbose=False)
+        candidates = self._collect(results, screen, cfg["screen_classes"])
+        stats["frames"] += 1
+        stats["screen_ms"] += (time.perf_counter() - t0) * 1000
+
+        if not candidates:
+            stats["screened_out"] += 1
+            audit = cfg["audit_every"]
+            if not audit or stats["screened_out"] % audit:
+                return []
+            # Audit: full model on the whole frame now and then, to estimate what the screen misses
+            with self._model_lock:
+                results = model(frame, conf=self.confidence, imgsz=self.imgsz, verbose=False)
+            detections = self._collect(results, model, self.target_classes)
+            stats["audits"] += 1
+            if detections:
+                stats["audit_misses"] += 1
+                logger.info(f"Cascadă: screening-ul a ratat {detections[0].name} "
+                            f"({detections[0].score:.2f}) la audit.")
+            return detections
+
+        stats["escalated"] += 1
+        t0 = time.perf_counter()
+        x1, y1, x2, y2 = self._screen_roi(frame, candidates)
+        with self._model_lock:
+            results = model(frame[y1:y2, x1:x2], conf=self.confidence, imgsz=self.imgsz, verbose=False)
+        detections = self._collect(results, model, self.target_classes, x1, y1)
+        stats["confirm_ms"] += (time.perf_counter() - t0) * 1000
+        if detections:
+            stats["confirmed"] += 1
+        return detections
+
+    def detect_prepared(self, tensor, metas, frames=None):
+        """
+        Batch inference on a letterboxed float32 NCHW batch from preprocess.BatchBuffers.
+        Boxes are mapped back to frame pixels with `metas`; returns one detection
+        list per image, highest score first.
+        """
+        import torch
+        if frames:
+            self._last_frame = frames[-1]
+        model = self.model
+        with self._model_lock:
+            # A tensor input skips Ultralytics' own letterbox/normalise step
+            results = model(torch.from_numpy(tensor), conf=self.confidence, verbose=False)
+
+        # Same parsing and filtering as the single-frame path, one image at a time
+        return [self._ranked(self._collect([r], model, self.target_classes, letterbox=meta))
+                for r, meta in zip(results, metas)]
+
+    def detect_batch(self, frames):
+        """Synchronous batch detection (tools/benchmarks); bays use preprocess.PipelinedDetector."""
+        from preprocess import BatchBuffers
+        if self._batch_buffers is None or self._batch_buffers.imgsz != self.imgsz or \
+                self._batch_buffers.batch < len(frames):
+            self._batch_buffers = BatchBuffers(self.imgsz, len(frames), slots=1)
+        tensor, metas = self._batch_buffers.fill(0, frames)
+        return self.detect_prepared(tensor, metas, frames)
+
+    def detect(self, frame):
+        """
+        Detects target vehicles in a frame.
+        Returns True if a target vehicle is found.
+        """
+        return bool(self.detect_objects(frame))
 
     def get_names(self):
         return self.model.names
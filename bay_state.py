@@ -0,0 +1,108 @@
+"""
+bay_state.py - Crash-safe snapshot of the bays in alarm
+The bays currently in alarm (session start, last snapshot) are written to one
+small JSON file after every alarm transition, atomically (temp file, fsync,
+rename, fsync of the directory), plus an `alive` timestamp refreshed every
+`heartbeat_s`. Writes happen on the store's own thread, so a slow SD card never
+stalls the bay pipelines; a burst of transitions becomes one write. At startup the engine reads it before the first frame: relays of
+bays that were in alarm are cut again immediately, their sessions continue, and
+sessions left open by the crash are closed at the last `alive` time.
+
+    {"version": 1, "alive": 1760870000.5,
+     "bays": {"Boxa 1": {"since": 1760869000.2, "snapshot": "evidence/...jpg"}}}
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+class BayStateStore:
+    def __init__(self, path="state/bays.json", heartbeat_s=60.0):
+        self.path = path
+        self.heartbeat_s = heartbeat_s
+        self._bays = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.writes = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(cfg["path"], cfg["heartbeat_s"])
+
+    def load(self):
+        """(bays, alive) from the last run; ({}, None) when there is no usable snapshot."""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return {}, None
+        except (OSError, ValueError) as e:
+            # The rename is atomic, so this is not a torn write; start clean but say so
+            logger.warning(f"Starea boxelor ({self.path}) nu poate fi citită: {e}")
+            return {}, None
+        if data.get("version") != VERSION:
+            return {}, None
+        with self._lock:
+            self._bays = dict(data.get("bays", {}))
+        return dict(self._bays), data.get("alive")
+
+    def save(self, bays):
+        """Replace the persisted set of bays in alarm ({name: entry}); the write follows on the store thread."""
+        with self._lock:
+            self._bays = {name: dict(entry) for name, entry in bays.items()}
+        self._dirty.set()
+
+    def _write(self):
+        with self._write_lock:  # stop() may overlap a write still running on the thread
+            with self._lock:
+                data = {"version": VERSION, "alive": time.time(), "bays": self._bays}
+            self._write_file(data)
+
+    def _write_file(self, data):
+        tmp = self.path + ".tmp"
+        try:
+            with open(tmp, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            fd = os.open(os.path.dirname(self.path) or ".", os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.writes += 1
+        except OSError as e:
+            logger.error(f"Eroare salvare stare boxe: {e}")
+
+    def _run(self):
+        while True:
+            # Woken by save(); otherwise the timeout is the `alive` heartbeat
+            self._dirty.wait(self.heartbeat_s)
+            if self._stop.is_set():
+                return
+            self._dirty.clear()
+            self._write()  # Always the latest set: saves made meanwhile are coalesced
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="bay-state")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._dirty.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._write()  # Last `alive` = clean shutdown time
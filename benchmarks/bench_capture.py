@@ -0,0 +1,62 @@
+"""
+bench_capture.py - Decode throughput of in-process threads vs decode worker processes
+Feeds N "cameras" from one clip (default: the synthetic 720p clip of
+debug_diagnostic.py --perf) with no frame rate limit and counts the frames
+delivered to the main process per second, plus the main process CPU time, for
+capture.mode "thread" and "process".
+
+    python benchmarks/bench_capture.py --cameras 1,2,4 --seconds 10
+    python benchmarks/bench_capture.py --clip rtsp_dump.mp4 --cameras 4 --per-process 2
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from camera_manager import CameraManager
+from camera_process import ProcessCameraManager
+from debug_diagnostic import _make_test_clip
+
+
+def measure(manager, names, seconds):
+    """Frames/s delivered to this process and CPU seconds it spent per delivered frame."""
+    time.sleep(2)  # Connect and warm up
+    start_ids = {n: manager.read_frame(n)[0] for n in names}
+    cpu0, t0 = time.process_time(), time.perf_counter()
+    time.sleep(seconds)
+    frames = sum(manager.read_frame(n)[0] - start_ids[n] for n in names)
+    elapsed, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+    return frames / elapsed, (cpu / frames * 1000) if frames else None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clip", help="Clip video (implicit: clip sintetic 720p)")
+    parser.add_argument("--cameras", default="1,2,4", help="Număr de camere simulate, listă")
+    parser.add_argument("--per-process", type=int, default=1, help="capture.cameras_per_process")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    clip = args.clip or _make_test_clip()
+    print(f"{'camere':>6}  {'mod':<8}{'cadre/s':>9}{'ms CPU/cadru (proces principal)':>34}")
+    for n in [int(x) for x in args.cameras.split(",")]:
+        cams = [{"name": f"Cam {i + 1}", "url": clip} for i in range(n)]
+        names = [c["name"] for c in cams]
+        for mode in ("thread", "process"):
+            if mode == "thread":
+                manager = CameraManager(cams, max_fps=0)
+            else:
+                manager = ProcessCameraManager(cams, max_fps=0, cameras_per_process=args.per_process)
+            try:
+                fps, cpu_ms = measure(manager, names, args.seconds)
+            finally:
+                manager.stop_all()
+            print(f"{n:>6}  {mode:<8}{fps:>9.1f}{cpu_ms if cpu_ms is not None else float('nan'):>34.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+bench_cascade.py - Cost and recall impact of the two-stage detection cascade
+Runs the configured model alone and then behind the screening pass over a
+labelled clip set (same format as sweep_operating_point.py) and reports the
+fraction of frames escalated to the full model, throughput, and frame/alarm
+recall of both, so the recall given up for speed is explicit.
+
+    python benchmarks/bench_cascade.py clips/ --model yolov8n.pt --imgsz 640 \\
+        --screen-imgsz 256 --screen-conf 0.15
+    python benchmarks/bench_cascade.py clips/ --model yolov8s.pt --screen-model yolov8n.pt --screen-classes 3,7
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_detector import AiDetector
+from config_manager import DEFAULT_CONFIG
+from sweep_operating_point import load_clip_set, sample_frames, evaluate, csv_list, DEFAULT_THRESHOLD
+
+
+def run(detector, clips, fps):
+    """Per-clip (t, best score) lists as sweep_operating_point.evaluate expects, plus seconds spent."""
+    scores, elapsed = [], 0.0
+    for clip in clips:
+        clip_scores = []
+        for t, frame in sample_frames(clip["path"], fps):
+            t0 = time.perf_counter()
+            detections = detector.detect_objects(frame)
+            elapsed += time.perf_counter() - t0
+            clip_scores.append((t, detections[0].score if detections else 0.0))
+        scores.append(clip_scores)
+    return scores, elapsed
+
+
+def main():
+    cascade_defaults = DEFAULT_CONFIG["ai"]["cascade"]
+    parser = argparse.ArgumentParser()
+    parser.add_argument("clips", help="Director cu clipuri și labels.json")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.45)
+    parser.add_argument("--fps", type=float, default=5.0)
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--screen-model", default="", help="Model de screening (implicit: --model)")
+    parser.add_argument("--screen-imgsz", type=int, default=cascade_defaults["screen_imgsz"])
+    parser.add_argument("--screen-conf", type=float, default=cascade_defaults["screen_conf"])
+    parser.add_argument("--screen-classes", type=csv_list(int), default=cascade_defaults["screen_classes"])
+    parser.add_argument("--roi-margin", type=float, default=cascade_defaults["roi_margin"])
+    args = parser.parse_args()
+
+    clips = load_clip_set(args.clips)
+    if not clips:
+        sys.exit("Niciun clip.")
+    detector = AiDetector(model_path=args.model, confidence=args.conf, imgsz=args.imgsz)
+    logging.getLogger("ai_detector").setLevel(logging.ERROR)
+
+    rows = []
+    for label, cascade in (("complet", None),
+                           ("cascadă", {"enabled": True, "screen_model": args.screen_model,
+                                        "screen_imgsz": args.screen_imgsz, "screen_conf": args.screen_conf,
+                                        "screen_classes": args.screen_classes, "roi_margin": args.roi_margin,
+                                        "audit_every": 0})):
+        detector.set_cascade(cascade)
+        run(detector, clips[:1], args.fps)  # Warm-up
+        detector.cascade_stats.update(frames=0, screened_out=0, escalated=0, confirmed=0,
+                                      screen_ms=0.0, confirm_ms=0.0)
+        scores, elapsed = run(detector, clips, args.fps)
+        frames = sum(len(s) for s in scores)
+        row = evaluate(clips, scores, args.conf, args.threshold)
+        row.update(name=label, fps=frames / elapsed if elapsed else 0.0,
+                   escalated=detector.get_cascade_stats()["escalated_frac"] if cascade else 1.0)
+        rows.append(row)
+
+    print(f"\n{'mod':<10}{'escalat':>9}{'fps':>8}{'prec':>7}{'recall':>8}{'alarmR':>8}{'falseA':>7}{'lat_s':>7}")
+    for r in rows:
+        lat = f"{r['alarm_latency_s']:.2f}" if r["alarm_latency_s"] is not None else "-"
+        print(f"{r['name']:<10}{r['escalated'] * 100:>8.1f}%{r['fps']:>8.1f}{r['precision']:>7.3f}"
+              f"{r['recall']:>8.3f}{r['alarm_recall']:>8.3f}{r['false_alarms']:>7}{lat:>7}")
+    full, cascade = rows
+    print(f"\nImpact cascadă: recall cadre {cascade['recall'] - full['recall']:+.3f}, "
+          f"recall alarme {cascade['alarm_recall'] - full['alarm_recall']:+.3f}, "
+          f"viteză x{cascade['fps'] / full['fps']:.2f}" if full["fps"] else "")
+
+
+if __name__ == "__main__":
+    main()
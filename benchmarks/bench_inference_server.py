@@ -0,0 +1,103 @@
+"""
+bench_inference_server.py - Throughput/latency of the batched inference server on one machine
+Starts an InferenceServer in-process (or targets --address) and drives it with
+N concurrent clients, each sending frames back-to-back like a Pi node would.
+
+    python benchmarks/bench_inference_server.py --clients 4 --frames 200
+    python benchmarks/bench_inference_server.py --fake-model-ms 20 --max-batch 1   # no batching baseline
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from inference_server import InferenceServer, RemoteInferenceClient
+
+
+class FakeModel:
+    """Stand-in with a fixed per-batch + per-frame cost, to measure protocol and batching overhead."""
+    names = {3: "motorcycle"}
+
+    class _Result:
+        boxes = []
+
+    def __init__(self, batch_ms, frame_ms):
+        self.batch_ms = batch_ms
+        self.frame_ms = frame_ms
+
+    def __call__(self, frames, **kwargs):
+        time.sleep((self.batch_ms + self.frame_ms * len(frames)) / 1000.0)
+        return [self._Result() for _ in frames]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def run_client(address, frames, frame, timeout, latencies, errors):
+    client = RemoteInferenceClient(address, timeout=timeout)
+    for _ in range(frames):
+        t0 = time.perf_counter()
+        try:
+            client.infer(frame, 0.45, [3])
+            latencies.append((time.perf_counter() - t0) * 1000)
+        except Exception:
+            errors.append(1)
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--address", help="Server existent HOST:PORT (implicit: pornește unul local)")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--fake-model-ms", type=float, help="Model fals: cost fix per batch (ms)")
+    parser.add_argument("--fake-frame-ms", type=float, default=5.0, help="Model fals: cost per cadru (ms)")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=100, help="Cadre per client")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--resolution", default="1280x720")
+    parser.add_argument("--timeout", type=float, default=5.0)
+    args = parser.parse_args()
+
+    server = None
+    address = args.address
+    if not address:
+        model = FakeModel(args.fake_model_ms, args.fake_frame_ms) if args.fake_model_ms is not None else None
+        server = InferenceServer(args.model, "127.0.0.1", 0, args.max_batch, args.max_wait_ms, model=model).start()
+        address = f"127.0.0.1:{server.port}"
+
+    w, h = (int(v) for v in args.resolution.split("x"))
+    frame = np.random.default_rng(0).integers(0, 255, (h, w, 3), dtype=np.uint8)
+
+    # Warm-up (model load, first batch)
+    RemoteInferenceClient(address, timeout=30).infer(frame, 0.45, [3])
+
+    latencies, errors = [], []
+    threads = [threading.Thread(target=run_client, args=(address, args.frames, frame, args.timeout, latencies, errors))
+               for _ in range(args.clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+
+    print(f"clients={args.clients} frames={len(latencies)} errors={len(errors)} elapsed={elapsed:.2f}s")
+    print(f"throughput={len(latencies) / elapsed:.1f} frames/s")
+    print(f"latency ms: p50={percentile(latencies, 50):.1f} p95={percentile(latencies, 95):.1f} "
+          f"p99={percentile(latencies, 99):.1f}")
+    if server:
+        s = server.get_stats()
+        print(f"server: avg_batch={s['avg_batch']:.2f} avg_infer_ms={s['avg_infer_ms']:.1f}")
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
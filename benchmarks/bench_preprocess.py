@@ -0,0 +1,117 @@
+"""
+bench_preprocess.py - Loop time of pipelined vs serial preprocessing + inference
+N bay threads submit frames to a PipelinedDetector whose model is either the
+real AiDetector or a stand-in with a fixed inference cost. The serial baseline
+preprocesses and infers on the same thread, like the monitoring loop used to.
+The pipelined loop time per frame should approach the pure inference time.
+
+    python benchmarks/bench_preprocess.py --bays 4 --frames 200 --fake-infer-ms 40
+    python benchmarks/bench_preprocess.py --model yolov8n.pt --imgsz 640
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from preprocess import BatchBuffers, PipelinedDetector
+
+
+class FakeDetector:
+    """Inference stand-in: fixed per-batch + per-frame cost, no detections."""
+    def __init__(self, imgsz, batch_ms, frame_ms):
+        self.imgsz = imgsz
+        self.batch_ms = batch_ms
+        self.frame_ms = frame_ms
+
+    def remote_active(self):
+        return False
+
+    def cascade_active(self):
+        return False
+
+    def detect_prepared(self, tensor, metas, frames=None):
+        time.sleep((self.batch_ms + self.frame_ms * len(metas)) / 1000.0)
+        return [[] for _ in metas]
+
+
+def serial(detector, frames, batch):
+    """Preprocess then infer on one thread, `batch` frames at a time."""
+    buffers = BatchBuffers(detector.imgsz, batch, slots=1)
+    t0 = time.perf_counter()
+    for i in range(0, len(frames), batch):
+        tensor, metas = buffers.fill(0, frames[i:i + batch])
+        detector.detect_prepared(tensor, metas)
+    return time.perf_counter() - t0
+
+
+def pipelined(detector, frames, bays, max_batch):
+    inference = PipelinedDetector(detector, max_batch)
+    per_bay = [frames[i::bays] for i in range(bays)]
+
+    def bay(own):
+        for frame in own:
+            inference.detect_objects(frame)
+
+    threads = [threading.Thread(target=bay, args=(own,)) for own in per_bay]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    stats = inference.get_stats()
+    inference.stop()
+    return elapsed, stats
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bays", type=int, default=4)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--max-batch", type=int, default=4)
+    parser.add_argument("--model", help="Model real (implicit: inferență falsă)")
+    parser.add_argument("--fake-infer-ms", type=float, default=20.0, help="Cost fix per batch (ms)")
+    parser.add_argument("--fake-frame-ms", type=float, default=10.0, help="Cost per cadru (ms)")
+    args = parser.parse_args()
+
+    if args.model:
+        from ai_detector import AiDetector
+        import logging
+        logging.getLogger("ai_detector").setLevel(logging.ERROR)
+        detector = AiDetector(model_path=args.model, imgsz=args.imgsz)
+    else:
+        detector = FakeDetector(args.imgsz, args.fake_infer_ms, args.fake_frame_ms)
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8) for _ in range(args.frames)]
+
+    # Warm-up (buffers, model)
+    serial(detector, frames[:args.max_batch], args.max_batch)
+
+    buffers = BatchBuffers(args.imgsz, args.max_batch, slots=1)
+    t0 = time.perf_counter()
+    for i in range(0, len(frames), args.max_batch):
+        buffers.fill(0, frames[i:i + args.max_batch])
+    prep = time.perf_counter() - t0
+
+    t_serial = serial(detector, frames, args.max_batch)
+    t_pipe, stats = pipelined(detector, frames, args.bays, args.max_batch)
+    infer_only = stats["infer_ms"] / 1000.0
+    n = len(frames)
+
+    print(f"{n} cadre, {args.bays} boxe, batch ≤ {args.max_batch}, imgsz {args.imgsz}")
+    print(f"Doar preprocesare:  {prep / n * 1000:7.2f} ms/cadru")
+    print(f"Doar inferență:     {infer_only / n * 1000:7.2f} ms/cadru (în modul pipeline)")
+    print(f"Serial:             {t_serial / n * 1000:7.2f} ms/cadru")
+    print(f"Pipeline:           {t_pipe / n * 1000:7.2f} ms/cadru  (batch mediu {stats['avg_batch']:.2f}, "
+          f"{infer_only / t_pipe * 100:.0f}% din timp în inferență)")
+
+
+if __name__ == "__main__":
+    main()
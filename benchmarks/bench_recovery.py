@@ -0,0 +1,126 @@
+"""
+bench_recovery.py - Fault recovery time of the supervised bay pipelines
+Runs PipelineSupervisor over fake cameras and a fake detector, injects faults
+into one bay and measures how long until the fault is detected and the bay
+processes frames again, and whether the other bays kept running meanwhile.
+
+    python benchmarks/bench_recovery.py --bays 4 --trials 5
+    python benchmarks/bench_recovery.py --fault hang --stall-after 3
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pipeline import PipelineSupervisor
+
+
+class FakeCameras:
+    """Every bay gets a new frame id every 1/fps seconds."""
+    def __init__(self, fps):
+        self.fps = fps
+        self.start = time.monotonic()
+
+    def read_frame(self, name):
+        return int((time.monotonic() - self.start) * self.fps) + 1, object()
+
+    def frame_age(self, name):
+        return 0.0
+
+
+class FakeEngine:
+    def __init__(self, bays, fps, infer_ms):
+        self.active_cameras = [{"id": i, "name": f"Boxa {i + 1}"} for i in range(bays)]
+        self.cameras = FakeCameras(fps)
+        self.infer_s = infer_ms / 1000.0
+        self.processed = {c["name"]: 0 for c in self.active_cameras}
+        self.fault = {}  # bay -> "exception" | "hang"
+        self._lock = threading.Lock()
+
+    def _process_bay(self, cam, index, frame):
+        name = cam["name"]
+        fault = self.fault.pop(name, None)
+        if fault == "exception":
+            raise RuntimeError("defect injectat")
+        if fault == "hang":
+            time.sleep(3600)
+        with self._lock:  # Inference is serialised like under AIWashGuard._apply_lock
+            time.sleep(self.infer_s)
+        self.processed[name] += 1
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def run_trial(engine, supervisor, bay, fault, timeout):
+    others = [n for n in engine.processed if n != bay]
+    before = {n: engine.processed[n] for n in others}
+    count_before = engine.processed[bay]
+    t0 = time.monotonic()
+    engine.fault[bay] = fault
+
+    detected = recovered = None
+    while time.monotonic() - t0 < timeout:
+        now = time.monotonic()
+        if detected is None and bay in supervisor.degraded_bays():
+            detected = now - t0
+        # Recovered: a restarted worker processed frames after the fault was seen
+        if detected is not None and engine.processed[bay] > count_before and bay not in supervisor.degraded_bays():
+            recovered = now - t0
+            break
+        time.sleep(0.01)
+    elapsed = time.monotonic() - t0
+    others_fps = sum(engine.processed[n] - before[n] for n in others) / max(1, len(others)) / elapsed
+    return detected, recovered, others_fps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bays", type=int, default=4)
+    parser.add_argument("--fps", type=float, default=5.0)
+    parser.add_argument("--infer-ms", type=float, default=30.0, help="Cost inferență falsă per cadru")
+    parser.add_argument("--fault", choices=["exception", "hang"], default="exception")
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--stall-after", type=float, default=3.0)
+    parser.add_argument("--backoff-min", type=float, default=1.0)
+    parser.add_argument("--check-interval", type=float, default=0.2)
+    args = parser.parse_args()
+
+    engine = FakeEngine(args.bays, args.fps, args.infer_ms)
+    # Fixed backoff so every trial measures the same restart delay
+    supervisor = PipelineSupervisor(engine, frame_timeout_s=10, stall_after_s=args.stall_after,
+                                    backoff_s=(args.backoff_min, args.backoff_min))
+    running = True
+    threading.Thread(target=supervisor.run, args=(lambda: running, args.check_interval), daemon=True).start()
+    time.sleep(1.0)
+
+    bay = engine.active_cameras[0]["name"]
+    detect_s, recover_s, others = [], [], []
+    for trial in range(args.trials):
+        detected, recovered, others_fps = run_trial(engine, supervisor, bay, args.fault,
+                                                   timeout=args.stall_after + args.backoff_min + 10)
+        print(f"trial {trial + 1}: detectat {detected if detected is not None else float('nan'):.2f}s, "
+              f"recuperat {recovered if recovered is not None else float('nan'):.2f}s, "
+              f"celelalte boxe {others_fps:.1f} FPS")
+        if recovered is not None:
+            detect_s.append(detected)
+            recover_s.append(recovered)
+        others.append(others_fps)
+        time.sleep(1.0)
+    running = False
+
+    print(f"\nDefect: {args.fault}, {args.bays} boxe, stall_after {args.stall_after}s, backoff {args.backoff_min}s")
+    print(f"Recuperări reușite: {len(recover_s)}/{args.trials}")
+    if recover_s:
+        print(f"Detecție p50 {percentile(detect_s, 50):.2f}s  max {max(detect_s):.2f}s")
+        print(f"Recuperare p50 {percentile(recover_s, 50):.2f}s  max {max(recover_s):.2f}s")
+    print(f"Celelalte boxe în timpul defectului: {min(others):.1f}-{max(others):.1f} FPS (țintă {args.fps:.1f})")
+
+
+if __name__ == "__main__":
+    main()
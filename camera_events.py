@@ -0,0 +1,405 @@
+"""
+camera_events.py - Camera-side motion events to wake inference
+Hikvision cameras detect motion / line crossing themselves and publish it on the
+ISAPI alert stream. With an event listener per camera, a quiet bay is analysed
+at `idle_fps` only and switches to full rate for `hold_s` seconds after each
+event. A listener that has heard nothing (not even the camera's heartbeats) for
+`silence_s` seconds puts its bay back on continuous inference.
+
+Sources (`camera_events.source`):
+    isapi  GET http://<camera>/ISAPI/Event/notification/alertStream (digest auth,
+           host and credentials taken from the RTSP URL)
+    http   any URL (`http_url`, {name}/{host} placeholders) streaming JSON lines:
+           {"type": "motion", "active": true}
+    mqtt   JSON messages of the same shape on `mqtt.topic` ({name} placeholder)
+
+A camera's `events_url` overrides the derived URL; `"events": false` opts it out.
+A stand-in ISAPI server for testing without cameras:
+    python camera_events.py --serve --port 8099 --motion-every 20
+"""
+
+import re
+import json
+import time
+import socket
+import logging
+import argparse
+import threading
+from urllib.parse import urlsplit, quote, unquote
+from urllib.request import (HTTPDigestAuthHandler, HTTPBasicAuthHandler, HTTPPasswordMgrWithDefaultRealm,
+                            build_opener)
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+try:
+    import paho.mqtt.client as mqtt
+    HAS_MQTT = True
+except ImportError:
+    HAS_MQTT = False
+
+logger = logging.getLogger(__name__)
+
+_ALERT = re.compile(rb"<EventNotificationAlert.*?</EventNotificationAlert>", re.S)
+_EVENT_TYPE = re.compile(rb"<eventType>\s*([^<]*?)\s*</eventType>")
+_EVENT_STATE = re.compile(rb"<eventState>\s*([^<]*?)\s*</eventState>")
+
+
+def parse_isapi_alerts(buf):
+    """(events, rest): [(type, active)] for every complete alert in `buf`, and the unparsed tail."""
+    events, end = [], 0
+    for m in _ALERT.finditer(buf):
+        block = m.group(0)
+        etype = _EVENT_TYPE.search(block)
+        state = _EVENT_STATE.search(block)
+        if etype:
+            events.append((etype.group(1).decode(errors="replace"),
+                           state is None or state.group(1).strip().lower() == b"active"))
+        end = m.end()
+    rest = buf[end:]
+    # No alert ever grows this large; drop garbage between parts
+    return events, rest[-65536:]
+
+
+class CameraEventListener:
+    """Reads one camera's event stream on its own thread; reconnects with backoff."""
+    def __init__(self, name, url, on_event, user="", password="", fmt="isapi", timeout_s=30.0):
+        self.name = name
+        self.url = url
+        self.on_event = on_event  # on_event(name, type, active); type None = heartbeat / any data
+        self.user = user
+        self.password = password
+        self.fmt = fmt
+        self.timeout = timeout_s
+        self.connected = False
+        self.events = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._resp = None  # Open streaming response, cut by stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"events-{self.name}")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Also unblocks the read in progress, so a replaced listener never reports again."""
+        self._stop.set()
+        resp = self._resp
+        sock = getattr(getattr(getattr(resp, "fp", None), "raw", None), "_sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def _opener(self):
+        if not self.user:
+            return build_opener()
+        passwords = HTTPPasswordMgrWithDefaultRealm()
+        passwords.add_password(None, self.url, self.user, self.password)
+        return build_opener(HTTPDigestAuthHandler(passwords), HTTPBasicAuthHandler(passwords))
+
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            try:
+                with self._opener().open(self.url, timeout=self.timeout) as resp:
+                    self._resp = resp
+                    if self._stop.is_set():
+                        break  # stop() ran while connecting
+                    self.connected = True
+                    backoff = 1.0
+                    logger.info(f"📡 Flux evenimente conectat: {self.name}")
+                    self._consume(resp)
+            except Exception as e:
+                if not self._stop.is_set():
+                    logger.warning(f"Flux evenimente {self.name} întrerupt ({e}). Reîncercare în {backoff:.0f}s.")
+            self._resp = None
+            self.connected = False
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    def _consume(self, resp):
+        buf = b""
+        while not self._stop.is_set():
+            chunk = resp.read1(4096)
+            if not chunk or self._stop.is_set():
+                return
+            self.on_event(self.name, None, False)  # Any byte proves the stream is alive
+            buf += chunk
+            if self.fmt == "isapi":
+                events, buf = parse_isapi_alerts(buf)
+            else:
+                *lines, buf = buf.split(b"\n")
+                events = []
+                for line in filter(None, (l.strip() for l in lines)):
+                    try:
+                        msg = json.loads(line)
+                        events.append((msg.get("type", "motion"), bool(msg.get("active", True))))
+                    except ValueError:
+                        continue
+            for etype, active in events:
+                self.events += 1
+                self.on_event(self.name, etype, active)
+
+
+class CameraEventGate:
+    """
+    Per-bay switch between idle mode (`idle_fps`) and full rate, driven by the
+    camera events. Bays without a listener, with a silent stream or in alarm
+    always run at full rate.
+    """
+    def __init__(self, cameras, source="isapi", types=("VMD", "linedetection", "fielddetection", "motion"),
+                 idle_fps=0.5, hold_s=15.0, silence_s=60.0, http_url="", mqtt_cfg=None):
+        self.source = source
+        self.types = {t.lower() for t in types}
+        self.idle_interval = 1.0 / idle_fps if idle_fps else float("inf")
+        self.hold_s = hold_s
+        self.silence_s = silence_s
+        self.http_url = http_url
+        self.mqtt_cfg = mqtt_cfg or {}
+        self._bays = {}  # name -> {"alive": t, "until": t, "processed": t, "silent": bool}
+        self._lock = threading.Lock()
+        self.listeners = {}
+        self._mqtt = None
+        self.stats = {"idle_skipped": 0, "events": 0}
+        self._start(cameras)
+
+    @classmethod
+    def from_config(cls, cameras, cfg):
+        return cls(cameras, cfg["source"], cfg["types"], cfg["idle_fps"], cfg["hold_s"], cfg["silence_s"],
+                   cfg["http_url"], cfg["mqtt"])
+
+    def _start(self, cameras):
+        now = time.monotonic()
+        for cam in cameras:
+            if not cam.get("enabled", True) or cam.get("events") is False:
+                continue
+            name = cam["name"]
+            # Until the stream proves itself the bay runs continuously
+            self._bays[name] = {"alive": now - self.silence_s, "until": 0.0, "processed": 0.0, "silent": True}
+            if self.source == "mqtt":
+                continue
+            parts = urlsplit(cam.get("url", ""))
+            if cam.get("events_url"):
+                url = cam["events_url"]  # Explicit override (NVR, stand-in server)
+            elif self.source == "isapi":
+                if not parts.hostname:
+                    continue
+                url = f"http://{parts.hostname}/ISAPI/Event/notification/alertStream"
+            else:
+                url = self.http_url.format(name=quote(name), host=parts.hostname or "")
+            self.listeners[name] = CameraEventListener(
+                name, url, self.on_event, unquote(parts.username or ""), unquote(parts.password or ""),
+                fmt=self.source, timeout_s=self.silence_s).start()
+        if self.source == "mqtt" and self._bays:
+            self._start_mqtt()
+
+    def _start_mqtt(self):
+        if not HAS_MQTT:
+            logger.error("camera_events.source = mqtt, dar paho-mqtt nu este instalat. Inferență continuă.")
+            return
+        cfg = self.mqtt_cfg
+        topics = {cfg["topic"].format(name=name): name for name in self._bays}
+
+        def on_message(client, userdata, msg):
+            name = topics.get(msg.topic)
+            if name is None:
+                return
+            self.on_event(name, None, False)
+            try:
+                data = json.loads(msg.payload)
+                self.on_event(name, data.get("type", "motion"), bool(data.get("active", True)))
+            except ValueError:
+                pass
+
+        def on_connect(client, userdata, flags, rc, *args):
+            for topic in topics:
+                client.subscribe(topic)
+
+        client = mqtt.Client()
+        client.on_message = on_message
+        client.on_connect = on_connect
+        client.connect_async(cfg["host"], cfg["port"])
+        client.loop_start()
+        self._mqtt = client
+
+    def on_event(self, name, etype, active):
+        now = time.monotonic()
+        with self._lock:
+            bay = self._bays.get(name)
+            if bay is None:
+                return
+            bay["alive"] = now
+            if etype is None:
+                return
+            self.stats["events"] += 1
+            if etype.lower() not in self.types:
+                return  # Heartbeats (videoloss inactive...) only keep the stream alive
+            # Full rate only for `hold_s` after the last active event: many cameras
+            # (VMD, http/mqtt feeds) never send the matching "inactive"
+            if active:
+                bay["until"] = now + self.hold_s
+                logger.debug(f"Eveniment cameră {name}: {etype} -> rată completă")
+            else:
+                bay["until"] = now
+
+    def should_process(self, name, idle):
+        """False when an idle bay's frame can be skipped (no recent camera event, idle slot not due)."""
+        now = time.monotonic()
+        with self._lock:
+            bay = self._bays.get(name)
+            if bay is None:
+                return True
+            silent = now - bay["alive"] > self.silence_s
+            if silent != bay["silent"]:
+                bay["silent"] = silent
+                if silent:
+                    logger.warning(f"⚠️ Flux evenimente {name} tăcut de {self.silence_s:.0f}s: inferență continuă.")
+                else:
+                    logger.info(f"Flux evenimente {name} activ: inferență la cerere.")
+            if silent or not idle or now < bay["until"]:
+                bay["processed"] = now
+                return True
+            if now - bay["processed"] >= self.idle_interval:
+                bay["processed"] = now
+                return True
+            self.stats["idle_skipped"] += 1
+            return False
+
+    def get_status(self):
+        now = time.monotonic()
+        with self._lock:
+            bays = {name: {"mode": "continuu" if b["silent"] else
+                           "complet" if now < b["until"] else "repaus",
+                           "connected": self.listeners[name].connected if name in self.listeners else None}
+                    for name, b in self._bays.items()}
+        return dict(self.stats, bays=bays)
+
+    def stop(self):
+        for listener in self.listeners.values():
+            listener.stop()
+        if self._mqtt is not None:
+            self._mqtt.loop_stop()
+            self._mqtt.disconnect()
+
+
+# ── Stand-in ISAPI event server (tests, demos) ───────────────────────────────
+_BOUNDARY = "boundary"
+_ALERT_XML = ("<EventNotificationAlert version=\"2.0\" xmlns=\"http://www.hikvision.com/ver20/XMLSchema\">"
+              "<channelID>1</channelID><dateTime>{time}</dateTime><activePostCount>1</activePostCount>"
+              "<eventType>{type}</eventType><eventState>{state}</eventState>"
+              "<eventDescription>{type} alarm</eventDescription></EventNotificationAlert>")
+
+
+class StandInEventServer:
+    """
+    Serves /ISAPI/Event/notification/alertStream like a Hikvision camera: a
+    `videoloss inactive` heartbeat every `heartbeat_s`, plus whatever `trigger()`
+    queues (or a VMD event every `motion_every` seconds). `silence()` stops all
+    output while keeping connections open, to exercise the fallback.
+    """
+    def __init__(self, port=8099, heartbeat_s=10.0, motion_every=0.0):
+        self.port = port
+        self.heartbeat_s = heartbeat_s
+        self.motion_every = motion_every
+        self.silent = False
+        self._cond = threading.Condition()
+        self._events = []  # (seq, type, state)
+        self._seq = 0
+        self._httpd = None
+
+    def trigger(self, etype="VMD", active=True):
+        with self._cond:
+            self._seq += 1
+            self._events = (self._events + [(self._seq, etype, "active" if active else "inactive")])[-100:]
+            self._cond.notify_all()
+
+    def silence(self, on=True):
+        self.silent = on
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                logger.debug(fmt % args)
+
+            def do_GET(self):
+                if not self.path.startswith("/ISAPI/Event/notification/alertStream"):
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", f"multipart/mixed; boundary={_BOUNDARY}")
+                self.end_headers()
+                try:
+                    server._stream(self.wfile)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        threading.Thread(target=self._httpd.serve_forever, daemon=True, name="isapi-standin").start()
+        if self.motion_every:
+            threading.Thread(target=self._motion_loop, daemon=True).start()
+        return self
+
+    def _motion_loop(self):
+        while self._httpd is not None:
+            time.sleep(self.motion_every)
+            self.trigger("VMD", True)
+
+    def _stream(self, out):
+        with self._cond:
+            seen = self._seq
+        last_beat = 0.0
+        while self._httpd is not None:
+            with self._cond:
+                self._cond.wait(1.0)
+                pending = [e for e in self._events if e[0] > seen]
+                seen = self._seq
+            now = time.monotonic()
+            if now - last_beat >= self.heartbeat_s:
+                pending.append((0, "videoloss", "inactive"))
+                last_beat = now
+            if self.silent:
+                continue
+            for _, etype, state in pending:
+                xml = _ALERT_XML.format(time=time.strftime("%Y-%m-%dT%H:%M:%S"), type=etype, state=state).encode()
+                out.write(f"--{_BOUNDARY}\r\nContent-Type: application/xml; charset=\"UTF-8\"\r\n"
+                          f"Content-Length: {len(xml)}\r\n\r\n".encode() + xml + b"\r\n")
+                out.flush()
+
+    def stop(self):
+        if self._httpd:
+            httpd, self._httpd = self._httpd, None
+            httpd.shutdown()
+            httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server ISAPI de test (evenimente cameră)")
+    parser.add_argument("--serve", action="store_true", required=True)
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--heartbeat", type=float, default=10.0)
+    parser.add_argument("--motion-every", type=float, default=20.0, help="Eveniment VMD la fiecare N secunde (0 = niciodată)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    server = StandInEventServer(args.port, args.heartbeat, args.motion_every).start()
+    logger.info(f"Server ISAPI de test pe http://127.0.0.1:{server.port}/ISAPI/Event/notification/alertStream "
+                f"(Enter = eveniment VMD, s = tăcere on/off, Ctrl+C = ieșire)")
+    try:
+        while True:
+            cmd = input().strip().lower()
+            if cmd == "s":
+                server.silence(not server.silent)
+                logger.info(f"Tăcere: {server.silent}")
+            else:
+                server.trigger("VMD", True)
+                logger.info("Eveniment VMD trimis.")
+    except (KeyboardInterrupt, EOFError):
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,25 @@ import threading
 import time
 import logging
 
+from thread_budget import pin_current_thread
+
 logger = logging.getLogger(__name__)
 
 class CameraStream:
-    def __init__(self, name, url):
+    """
+    Captures one RTSP stream. Every packet is grabbed (decoder stays in sync, GIL
+    released inside OpenCV) but only up to `max_fps` frames per second are
+    retrieved into numpy arrays, which keeps per-camera Python work flat.
+    """
+    def __init__(self, name, url, max_fps=5):
         self.name = name
         self.url = url
+        self.max_fps = max_fps
+        self.fps_cap = None  # Runtime limit below max_fps (thermal governor)
         self.frame = None
+        self.frame_id = 0
+        self.frame_time = 0.0
+        self.alive_time = time.monotonic()  # Last sign of progress of the capture loop
         self.stopped = False
         self.thread = None
         self.lock = threading.Lock()
@@ -27,7 +39,9 @@ class CameraStream:
         return self
 
     def _update(self):
+        pin_current_thread("capture")
         while not self.stopped:
+            self.alive_time = time.monotonic()
             cap = cv2.VideoCapture(self.url)
             # Short timeout check
             if not cap.isOpened():
@@ -37,33 +51,57 @@ class CameraStream:
                 continue
 
             logger.info(f"Conectat la fluxul: {self.name}")
+            next_retrieve = 0.0
             while not self.stopped:
-                ret, frame = cap.read()
-                if not ret:
+                # grab() blocks on the stream, so no sleep is needed to pace the loop
+                if not cap.grab():
                     logger.warning(f"S-a pierdut conexiunea cu {self.name}. Re-conectare...")
                     break
-                
-                with self.lock:
-                    self.frame = frame
-                
-                # Prevent CPU bottleneck
-                time.sleep(0.01)
+                now = self.alive_time = time.monotonic()
+                if now < next_retrieve:
+                    continue
+                frame = self._retrieve(cap)
+                if frame is None:
+                    continue
+                next_retrieve = now + self.min_interval()
+                self._publish(frame, now)
             
             cap.release()
             time.sleep(2)
 
+    def _retrieve(self, cap):
+        ret, frame = cap.retrieve()
+        return frame if ret else None
+
+    def _publish(self, frame, now):
+        with self.lock:
+            self.frame = frame
+            self.frame_id += 1
+            self.frame_time = now
+
+    def min_interval(self):
+        limits = [f for f in (self.max_fps, self.fps_cap) if f]
+        return 1.0 / min(limits) if limits else 0.0
+
     def read(self):
         with self.lock:
             return self.frame
 
+    def read_with_id(self):
+        """Returns (frame_id, frame); the id increases with every new frame."""
+        with self.lock:
+            return self.frame_id, self.frame
+
     def stop(self):
         self.stopped = True
         if self.thread:
             self.thread.join(timeout=2)
 
 class CameraManager:
-    def __init__(self, cameras_config):
+    def __init__(self, cameras_config, max_fps=5):
         self.streams = {}
+        self.max_fps = max_fps
+        self.fps_cap = None
         self.update_config(cameras_config)
 
     def update_config(self, cameras_config):
@@ -84,31 +122,106 @@ class CameraManager:
                 
             name = cam['name']
             url = cam['url']
+            max_fps = cam.get('max_fps', self.max_fps)
             
             if name in self.streams:
-                if self.streams[name].url != url:
-                    logger.info(f"Actualizare URL pentru {name}")
+                if self.streams[name].url != url or self.streams[name].max_fps != max_fps:
+                    logger.info(f"Actualizare flux pentru {name}")
                     self.streams[name].stop()
-                    self.streams[name] = CameraStream(name, url).start()
+                    self.streams[name] = self._new_stream(name, url, max_fps)
             else:
                 logger.info(f"Inițializare flux camera: {name}")
-                self.streams[name] = CameraStream(name, url).start()
+                self.streams[name] = self._new_stream(name, url, max_fps)
+
+    def _new_stream(self, name, url, max_fps):
+        stream = CameraStream(name, url, max_fps)
+        stream.fps_cap = self.fps_cap
+        return stream.start()
+
+    def set_fps_cap(self, fps):
+        """Temporary per-stream frame rate limit (None = configured max_fps); no reconnect."""
+        self.fps_cap = fps
+        for stream in list(self.streams.values()):
+            stream.fps_cap = fps
 
     def get_latest_frames(self):
-        return {name: stream.read() for name, stream in self.streams.items()}
+        # list(): the config watcher may add/remove streams from another thread
+        return {name: stream.read() for name, stream in list(self.streams.items())}
+
+    def read_frame(self, name):
+        """(frame_id, frame) for one camera, (0, None) if it is not streaming."""
+        stream = self.streams.get(name)
+        return stream.read_with_id() if stream else (0, None)
+
+    def frame_age(self, name):
+        """Seconds since `name` delivered its last frame, None if it never did."""
+        stream = self.streams.get(name)
+        if stream is None or not stream.frame_id:
+            return None
+        return time.monotonic() - stream.frame_time
+
+    def get_new_frames(self, last_ids):
+        """
+        Frames that arrived since the ids in `last_ids` ({name: frame_id}), which is
+        updated in place. Lets consumers skip cameras whose frame has not changed.
+        """
+        new_frames = {}
+        for name, stream in list(self.streams.items()):
+            frame_id, frame = stream.read_with_id()
+            if frame is not None and frame_id != last_ids.get(name):
+                last_ids[name] = frame_id
+                new_frames[name] = frame
+        return new_frames
+
+    def memory_bytes(self):
+        """Bytes held in the latest frame of every stream."""
+        total = 0
+        for stream in list(self.streams.values()):
+            frame = stream.frame
+            total += frame.nbytes if frame is not None else 0
+        return total
+
+    def restart_all(self):
+        """Reconnect every stream with a fresh capture object and buffers."""
+        for name, stream in list(self.streams.items()):
+            stream.stop()
+            self.streams[name] = self._new_stream(name, stream.url, stream.max_fps)
+
+    @staticmethod
+    def probe(url, timeout_s=10.0):
+        """
+        Open `url` and read one frame with FFmpeg open/read timeouts of `timeout_s`.
+        Returns {"ok", "first_frame_s", "width", "height", "error"}.
+        """
+        result = {"ok": False, "first_frame_s": None, "width": None, "height": None, "error": None}
+        t0 = time.monotonic()
+        ms = int(timeout_s * 1000)
+        try:
+            cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG,
+                                   [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, ms])
+        except (TypeError, AttributeError):
+            cap = cv2.VideoCapture(url)  # OpenCV < 4.5.2: FFmpeg default timeouts
+        try:
+            if not cap.isOpened():
+                result["error"] = "fluxul nu s-a putut deschide"
+                return result
+            ret, frame = cap.read()
+            if not ret or frame is None:
+                result["error"] = "niciun cadru primit"
+                return result
+            result.update(ok=True, first_frame_s=time.monotonic() - t0,
+                          height=frame.shape[0], width=frame.shape[1])
+            return result
+        except Exception as e:
+            result["error"] = str(e)
+            return result
+        finally:
+            cap.release()
 
     @staticmethod
     def test_connection(url):
         """Quickly check if a camera URL is reachable."""
-        try:
-            cap = cv2.VideoCapture(url)
-            if cap.isOpened():
-                ret, frame = cap.read()
-                cap.release()
-                return ret
-            return False
-        except Exception:
-            return False
+        return CameraManager.probe(url)["ok"]
 
     def stop_all(self):
         for stream in self.streams.values():
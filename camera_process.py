@@ -0,0 +1,429 @@
+"""
+camera_process.py - Camera decoding in worker processes
+With `capture.mode = "process"` every camera (or group of `cameras_per_process`
+cameras) is grabbed and decoded by its own Python process, so H.264 decoding
+and frame handling no longer compete with inference and Tk for one GIL, and a
+crashing or wedged FFmpeg decoder takes down only its worker, which is
+restarted with backoff.
+
+Frames travel through a shared memory ring per camera (RING_SLOTS frames plus
+the frame id held by each slot): the worker retrieves straight into a slot and
+sends only (camera, slot, id) over a pipe; the main process copies the newest
+slot out once and checks the id again, so a slot overwritten meanwhile is
+dropped instead of handed out torn. The main process owns (unlinks) the rings.
+
+    python camera_process.py --worker FRAMES_FD CTRL_FD   (started by DecodeWorker)
+"""
+
+import os
+import sys
+import time
+import logging
+import argparse
+import threading
+import subprocess
+from multiprocessing import shared_memory, resource_tracker
+from multiprocessing.connection import Connection, Pipe
+
+import numpy as np
+
+from camera_manager import CameraStream, CameraManager
+from thread_budget import role_cores, HAS_AFFINITY
+
+logger = logging.getLogger(__name__)
+
+RING_SLOTS = 3
+_HEADER_BYTES = 64  # Slot frame ids (int64), padded
+
+
+class _FrameRing:
+    """RING_SLOTS frames of one shape in one shared memory block, after the id of the frame in each slot."""
+    def __init__(self, shm, shape, dtype):
+        self.shm = shm
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.ids = np.ndarray((RING_SLOTS,), np.int64, shm.buf)
+        self.frames = np.ndarray((RING_SLOTS,) + self.shape, self.dtype, shm.buf, _HEADER_BYTES)
+
+    @classmethod
+    def create(cls, shape, dtype):
+        size = _HEADER_BYTES + RING_SLOTS * int(np.prod(shape)) * np.dtype(dtype).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        # The main process unlinks it; the worker's own resource tracker must not (it would at worker exit)
+        resource_tracker.unregister(shm._name, "shared_memory")
+        ring = cls(shm, shape, dtype)
+        ring.ids[:] = -1
+        return ring
+
+    @classmethod
+    def attach(cls, name, shape, dtype):
+        return cls(shared_memory.SharedMemory(name=name), shape, dtype)
+
+    def release(self, unlink=False):
+        self.ids = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass  # A view is still referenced; the mapping goes away with it
+        if unlink:
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+# ── Worker process side ─────────────────────────────────────────────────────
+class _SharedFrameWriter(CameraStream):
+    """CameraStream whose frames are retrieved into a shared ring and announced over the pipe."""
+    def __init__(self, name, url, max_fps, send):
+        super().__init__(name, url, max_fps)
+        self.send = send
+        self.ring = None
+        self.seq = 0
+
+    def _retrieve(self, cap):
+        ring = self.ring
+        if ring is None:
+            ret, frame = cap.retrieve()
+            return frame if ret else None
+        slot = self.seq % RING_SLOTS
+        ring.ids[slot] = -1  # Readers drop the slot while it is being overwritten
+        ret, frame = cap.retrieve(ring.frames[slot])
+        return frame if ret else None
+
+    def _publish(self, frame, now):
+        ring = self.ring
+        if ring is None or frame.shape != ring.shape or frame.dtype != ring.dtype:
+            # First frame or a resolution change: new ring, the main process unlinks the old one
+            self.ring = _FrameRing.create(frame.shape, frame.dtype)
+            self.send(("ring", self.name, self.ring.shm.name, frame.shape, frame.dtype.str))
+            if ring is not None:
+                ring.release()
+            ring = self.ring
+        slot = self.seq % RING_SLOTS
+        target = ring.frames[slot]
+        if not np.shares_memory(frame, target):
+            ring.ids[slot] = -1
+            np.copyto(target, frame)
+        ring.ids[slot] = self.seq
+        self.send(("frame", self.name, slot, self.seq))
+        self.seq += 1
+        self.frame_id = self.seq
+        self.frame_time = now
+
+
+class _PipeLogHandler(logging.Handler):
+    """Hands worker log lines to the main process, which logs them through its own handlers."""
+    def __init__(self, send):
+        super().__init__()
+        self.send = send
+
+    def emit(self, record):
+        try:
+            self.send(("log", record.levelno, record.name, record.getMessage()))
+        except Exception:
+            self.handleError(record)
+
+
+def _worker_main(frames_fd, ctrl_fd):
+    frames, ctrl = Connection(frames_fd), Connection(ctrl_fd)
+    send_lock = threading.Lock()
+
+    def send(msg):
+        with send_lock:
+            frames.send(msg)
+
+    root = logging.getLogger()
+    root.handlers[:] = [_PipeLogHandler(send)]
+    root.setLevel(logging.INFO)
+
+    try:
+        _, cams, fps_cap, cores = ctrl.recv()
+    except EOFError:
+        return
+    if cores and HAS_AFFINITY:
+        try:
+            os.sched_setaffinity(0, cores)
+        except OSError:
+            pass
+
+    writers = []
+    for name, url, max_fps in cams:
+        writer = _SharedFrameWriter(name, url, max_fps, send)
+        writer.fps_cap = fps_cap
+        writers.append(writer.start())
+
+    while True:
+        try:
+            if ctrl.poll(1.0):
+                msg = ctrl.recv()
+                if msg[0] == "stop":
+                    break
+                if msg[0] == "fps_cap":
+                    for writer in writers:
+                        writer.fps_cap = msg[1]
+            now = time.monotonic()
+            send(("alive", {w.name: round(now - w.alive_time, 1) for w in writers}))
+        except (EOFError, OSError):
+            break  # Main process gone
+
+    for writer in writers:
+        writer.stopped = True
+    for writer in writers:
+        writer.stop()
+        if writer.ring is not None:
+            writer.ring.release()
+
+
+# ── Main process side ───────────────────────────────────────────────────────
+class _SharedFrameStream(CameraStream):
+    """Read side of a worker-decoded camera; same interface as CameraStream, no thread of its own."""
+    def start(self):
+        return self
+
+    def stop(self):
+        self.stopped = True
+
+
+class DecodeWorker:
+    """
+    One decode process for a group of cameras, restarted with exponential backoff
+    when it exits, or when it (or one of its cameras) stops reporting for `hang_s`.
+    """
+    def __init__(self, cams, fps_cap=None, hang_s=60.0, cores=None):
+        self.cams = [tuple(c) for c in cams]  # (name, url, max_fps)
+        self.streams = [_SharedFrameStream(name, url, max_fps) for name, url, max_fps in self.cams]
+        self._by_name = {s.name: s for s in self.streams}
+        for stream in self.streams:
+            stream.fps_cap = fps_cap
+        self.fps_cap = fps_cap
+        self.hang_s = hang_s
+        self.cores = sorted(cores) if cores else None
+        self.proc = None
+        self._ctrl = None
+        self._ctrl_lock = threading.Lock()
+        self._rings = {}  # Camera name -> attached _FrameRing
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"frames": 0, "stale": 0, "restarts": 0}
+
+    @property
+    def label(self):
+        return ", ".join(name for name, _, _ in self.cams)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"decode-{self.label}")
+        self._thread.start()
+        return self
+
+    def _send(self, msg):
+        with self._ctrl_lock:
+            if self._ctrl is None:
+                return
+            try:
+                self._ctrl.send(msg)
+            except OSError:
+                pass  # Worker gone; the supervisor thread restarts it
+
+    def set_fps_cap(self, fps):
+        self.fps_cap = fps
+        for stream in self.streams:
+            stream.fps_cap = fps
+        self._send(("fps_cap", fps))
+
+    def _spawn(self):
+        frames_r, frames_w = Pipe(duplex=False)
+        ctrl_r, ctrl_w = Pipe(duplex=False)
+        fds = (frames_w.fileno(), ctrl_r.fileno())
+        try:
+            self.proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--worker", *map(str, fds)],
+                                         pass_fds=fds)
+        finally:
+            frames_w.close()
+            ctrl_r.close()
+        with self._ctrl_lock:
+            self._ctrl = ctrl_w
+        # Camera URLs carry credentials: sent over the pipe, not on the command line
+        self._send(("start", self.cams, self.fps_cap, self.cores))
+        return frames_r
+
+    def _run(self):
+        delay = 1.0
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                conn = self._spawn()
+            except OSError as e:
+                reason = f"nu a pornit: {e}"
+            else:
+                logger.info(f"🎞️ Proces decodare [{self.label}] pornit (pid {self.proc.pid}).")
+                reason = self._read(conn)
+                code = self._reap(conn, kill=reason is not None and "blocat" in reason)
+                reason = reason and f"{reason} (cod {code})"
+            if self._stop.is_set():
+                break
+            if time.monotonic() - started > 60:
+                delay = 1.0
+            self.stats["restarts"] += 1
+            logger.warning(f"⚠️ Proces decodare [{self.label}] {reason} — repornire în {delay:.0f}s")
+            self._stop.wait(delay)
+            delay = min(delay * 2, 30.0)
+
+    def _read(self, conn):
+        """Serve frames until the worker exits or hangs; returns the reason, None when stopped."""
+        last_beat = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if not conn.poll(1.0):
+                    if time.monotonic() - last_beat > self.hang_s:
+                        return "blocat (fără semnal)"
+                    continue
+                latest = {}
+                # Drain everything pending: only the newest frame of each camera is copied out
+                while conn.poll():
+                    msg = conn.recv()
+                    kind = msg[0]
+                    if kind == "frame":
+                        latest[msg[1]] = msg[2:]
+                    elif kind == "ring":
+                        latest.pop(msg[1], None)
+                        self._attach(*msg[1:])
+                    elif kind == "alive":
+                        last_beat = now = time.monotonic()
+                        for name, age in msg[1].items():
+                            if name in self._by_name:
+                                self._by_name[name].alive_time = now - age
+                            if age > self.hang_s:
+                                return f"blocat (camera {name})"
+                    elif kind == "log":
+                        logging.getLogger(msg[2]).log(msg[1], msg[3])
+                for name, (slot, seq) in latest.items():
+                    self._copy(name, slot, seq)
+            except (EOFError, OSError):
+                return "s-a oprit"
+        return None
+
+    def _attach(self, name, shm_name, shape, dtype):
+        old = self._rings.pop(name, None)
+        if old is not None:
+            old.release(unlink=True)
+        try:
+            self._rings[name] = _FrameRing.attach(shm_name, shape, dtype)
+        except FileNotFoundError:
+            pass
+
+    def _copy(self, name, slot, seq):
+        ring, stream = self._rings.get(name), self._by_name.get(name)
+        if ring is None or stream is None or ring.ids[slot] != seq:
+            self.stats["stale"] += 1
+            return
+        frame = ring.frames[slot].copy()
+        if ring.ids[slot] != seq:  # Overwritten while copying
+            self.stats["stale"] += 1
+            return
+        stream._publish(frame, time.monotonic())
+        self.stats["frames"] += 1
+
+    def _reap(self, conn, kill=False):
+        """Stop the worker process and free every ring it created; returns its exit code."""
+        proc = self.proc
+        if kill:
+            proc.kill()
+        else:
+            self._send(("stop",))
+        try:
+            proc.wait(timeout=3)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+        with self._ctrl_lock:
+            self._ctrl.close()
+            self._ctrl = None
+        # Rings announced after we stopped reading still need unlinking
+        try:
+            while conn.poll():
+                msg = conn.recv()
+                if msg[0] == "ring":
+                    self._attach(*msg[1:])
+        except (EOFError, OSError):
+            pass
+        conn.close()
+        for ring in self._rings.values():
+            ring.release(unlink=True)
+        self._rings = {}
+        return proc.returncode
+
+    def stop(self):
+        self._stop.set()
+        self._send(("stop",))
+
+    def join(self, timeout=6):
+        if self._thread:
+            self._thread.join(timeout=timeout)
+
+    def get_stats(self):
+        return dict(self.stats, pid=self.proc.pid if self.proc else None,
+                    running=self.proc is not None and self.proc.poll() is None)
+
+
+class ProcessCameraManager(CameraManager):
+    """CameraManager whose streams are decoded by DecodeWorker processes."""
+    def __init__(self, cameras_config, max_fps=5, cameras_per_process=1, hang_s=60.0):
+        self.workers = {}  # Camera group -> DecodeWorker
+        self.cameras_per_process = max(1, int(cameras_per_process))
+        self.hang_s = hang_s
+        super().__init__(cameras_config, max_fps)
+
+    @classmethod
+    def from_config(cls, cameras_config, cfg):
+        return cls(cameras_config, cfg["max_fps"], cfg["cameras_per_process"], cfg["hang_s"])
+
+    def update_config(self, cameras_config):
+        wanted = [(c["name"], c["url"], c.get("max_fps", self.max_fps))
+                  for c in cameras_config if c.get("enabled", True) and c.get("url")]
+        n = self.cameras_per_process
+        groups = [tuple(wanted[i:i + n]) for i in range(0, len(wanted), n)]
+
+        stopped = []
+        for group in [g for g in self.workers if g not in groups]:
+            logger.info(f"Oprire proces decodare: {self.workers[group].label}")
+            worker = self.workers.pop(group)
+            worker.stop()
+            stopped.append(worker)
+        for group in groups:
+            if group not in self.workers:
+                self.workers[group] = DecodeWorker(group, self.fps_cap, self.hang_s, role_cores("capture")).start()
+        self.streams = {s.name: s for w in self.workers.values() for s in w.streams}
+        for worker in stopped:
+            worker.join()
+
+    def set_fps_cap(self, fps):
+        self.fps_cap = fps
+        for worker in list(self.workers.values()):
+            worker.set_fps_cap(fps)
+
+    def restart_all(self):
+        """Fresh decode processes (and rings) for every camera group."""
+        groups = list(self.workers)
+        self.stop_all()
+        for group in groups:
+            self.workers[group] = DecodeWorker(group, self.fps_cap, self.hang_s, role_cores("capture")).start()
+        self.streams = {s.name: s for w in self.workers.values() for s in w.streams}
+
+    def get_stats(self):
+        return {w.label: w.get_stats() for w in list(self.workers.values())}
+
+    def stop_all(self):
+        workers = list(self.workers.values())
+        for worker in workers:
+            worker.stop()
+        for worker in workers:
+            worker.join()
+        self.workers = {}
+        self.streams = {}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Proces de decodare camere (pornit de ProcessCameraManager)")
+    parser.add_argument("--worker", nargs=2, type=int, metavar=("FRAMES_FD", "CTRL_FD"), required=True)
+    _worker_main(*parser.parse_args().worker)
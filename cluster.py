@@ -0,0 +1,419 @@
+"""
+cluster.py - Coordinator/worker sharding of cameras across several nodes
+Workers run CameraManager + AiDetector for the cameras they are assigned and
+stream compact events (bay status, alarms, relay commands) to one coordinator.
+The coordinator owns relays, email, DB, the evidence store and the dashboard,
+assigns cameras and moves them to the surviving nodes when a worker dies.
+Protocol: newline-delimited JSON over TCP (works over loopback for local tests).
+"""
+
+import json
+import time
+import base64
+import socket
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 9870
+
+
+class MessageChannel:
+    """Newline-delimited JSON over a socket. `send` is thread-safe."""
+    def __init__(self, sock):
+        self.sock = sock
+        self._rfile = sock.makefile("rb")
+        self._lock = threading.Lock()
+
+    def send(self, msg):
+        data = (json.dumps(msg, separators=(",", ":")) + "\n").encode()
+        with self._lock:
+            self.sock.sendall(data)
+
+    def receive(self):
+        """Next message, or None when the peer closed the connection."""
+        line = self._rfile.readline()
+        if not line:
+            return None
+        return json.loads(line)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+def parse_address(address, default_port=DEFAULT_PORT):
+    host, _, port = address.rpartition(":")
+    if not host:
+        return address, default_port
+    return host, int(port)
+
+
+# ── Coordinator side ─────────────────────────────────────────────────────────
+class NodeState:
+    def __init__(self, node_id, channel, capacity, address):
+        self.node_id = node_id
+        self.channel = channel
+        self.capacity = max(1, int(capacity))
+        self.address = address
+        self.cameras = []
+        self.last_seen = time.monotonic()
+        self.connected_at = time.time()
+
+    @property
+    def load(self):
+        return len(self.cameras) / self.capacity
+
+
+class ClusterCoordinator:
+    """
+    Accepts worker nodes, assigns them cameras and relays their events to the
+    engine callbacks:
+      on_relays({relay_idx: on}), on_alarm_start(cam, image_bytes, ext),
+      on_alarm_end(cam), on_status(cam, detection_count)
+    Callbacks run on the node's connection thread.
+    """
+    def __init__(self, config_mgr, on_relays, on_alarm_start, on_alarm_end, on_status,
+                 host="0.0.0.0", port=DEFAULT_PORT, heartbeat_timeout=5.0):
+        self.config_mgr = config_mgr
+        self.on_relays = on_relays
+        self.on_alarm_start = on_alarm_start
+        self.on_alarm_end = on_alarm_end
+        self.on_status = on_status
+        self.host = host
+        self.port = port
+        self.heartbeat_timeout = heartbeat_timeout
+        self.nodes = {}
+        self.assignment = {}      # camera name -> node_id
+        self.bay_status = {}      # camera name -> last status reported by its node
+        self._thumbnails = {}     # camera name -> (seq, jpeg bytes)
+        self._decoded = {}        # camera name -> (seq, frame)
+        self._thumb_seq = 0
+        self._lock = threading.RLock()
+        self._server = None
+        self.running = False
+        config_mgr.subscribe(self._on_config_changed)
+
+    def start(self):
+        self._server = socket.create_server((self.host, self.port), reuse_port=False)
+        self.port = self._server.getsockname()[1]
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True, name="cluster-accept").start()
+        threading.Thread(target=self._monitor_loop, daemon=True, name="cluster-monitor").start()
+        logger.info(f"🛰️ Coordonator cluster activ pe portul {self.port}.")
+        return self
+
+    def stop(self):
+        self.running = False
+        if self._server:
+            self._server.close()
+        with self._lock:
+            for node in list(self.nodes.values()):
+                node.channel.close()
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                sock, addr = self._server.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve_node, args=(sock, addr), daemon=True).start()
+
+    def _serve_node(self, sock, addr):
+        channel = MessageChannel(sock)
+        node = None
+        try:
+            hello = channel.receive()
+            if not hello or hello.get("type") != "hello":
+                channel.close()
+                return
+            node = NodeState(hello["node_id"], channel, hello.get("capacity", 4), f"{addr[0]}:{addr[1]}")
+            with self._lock:
+                old = self.nodes.get(node.node_id)
+                if old:
+                    old.channel.close()  # Reconnect replaces the stale session
+                self.nodes[node.node_id] = node
+                logger.info(f"🔗 Nod conectat: {node.node_id} ({node.address}, capacitate {node.capacity}).")
+                self._rebalance()
+
+            while self.running:
+                msg = channel.receive()
+                if msg is None:
+                    break
+                node.last_seen = time.monotonic()
+                self._dispatch(node, msg)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Conexiune nod întreruptă ({addr[0]}): {e}")
+        finally:
+            if node:
+                self._node_lost(node)
+
+    def _dispatch(self, node, msg):
+        kind = msg.get("type")
+        if kind == "status":
+            for cam, status in msg.get("bays", {}).items():
+                if self.assignment.get(cam) != node.node_id:
+                    continue  # Late report for a camera that moved
+                self.bay_status[cam] = dict(status, node=node.node_id)
+                self.on_status(cam, status.get("count", 0))
+            for cam, b64 in msg.get("thumbs", {}).items():
+                self._thumb_seq += 1
+                self._thumbnails[cam] = (self._thumb_seq, base64.b64decode(b64))
+        elif kind == "relay":
+            self.on_relays({int(idx): bool(on) for idx, on in msg["changes"].items()})
+        elif kind == "alarm_start":
+            data = base64.b64decode(msg["image"]) if msg.get("image") else None
+            self.bay_status.setdefault(msg["camera"], {})["alarm"] = True
+            self.on_alarm_start(msg["camera"], data, msg.get("ext", ".jpg"))
+        elif kind == "alarm_end":
+            self.bay_status.setdefault(msg["camera"], {})["alarm"] = False
+            self.on_alarm_end(msg["camera"])
+
+    def _monitor_loop(self):
+        while self.running:
+            time.sleep(1.0)
+            now = time.monotonic()
+            with self._lock:
+                stale = [n for n in self.nodes.values() if now - n.last_seen > self.heartbeat_timeout]
+            for node in stale:
+                logger.error(f"💀 Nodul {node.node_id} nu mai răspunde. Redistribuire camere.")
+                node.channel.close()  # Its serve thread exits and calls _node_lost
+
+    def _node_lost(self, node):
+        with self._lock:
+            if self.nodes.get(node.node_id) is not node:
+                return
+            del self.nodes[node.node_id]
+            logger.warning(f"Nod deconectat: {node.node_id} (camere: {', '.join(node.cameras) or '-'}).")
+            self._rebalance()
+
+    def _on_config_changed(self, diff):
+        if {"cameras", "ai", "capture"} & set(diff):
+            with self._lock:
+                self._rebalance(resend_all=True)
+
+    def _camera_configs(self):
+        cams = []
+        for i, cam in enumerate(self.config_mgr.get_cameras()):
+            if cam.get("enabled", True) and cam.get("url"):
+                # Relay index must stay global, whatever node runs the camera
+                cams.append(dict(cam, id=cam.get("id", i)))
+        return cams
+
+    def _rebalance(self, resend_all=False):
+        """Sticky assignment: cameras only move when their node died or the load is uneven."""
+        cams = {c["name"]: c for c in self._camera_configs()}
+        before = {nid: list(n.cameras) for nid, n in self.nodes.items()}
+        for node in self.nodes.values():
+            node.cameras = []
+
+        assignment = {}
+        for name, nid in self.assignment.items():
+            if name in cams and nid in self.nodes:
+                assignment[name] = nid
+                self.nodes[nid].cameras.append(name)
+
+        if self.nodes:
+            for name in cams:
+                if name not in assignment:
+                    node = min(self.nodes.values(), key=lambda n: n.load)
+                    assignment[name] = node.node_id
+                    node.cameras.append(name)
+            # Even out: move single cameras from the busiest to the idlest node
+            for _ in range(len(cams)):
+                busiest = max(self.nodes.values(), key=lambda n: n.load)
+                idlest = min(self.nodes.values(), key=lambda n: n.load)
+                if busiest is idlest or (len(busiest.cameras) - 1) / busiest.capacity < \
+                        (len(idlest.cameras) + 1) / idlest.capacity:
+                    break
+                name = busiest.cameras.pop()
+                idlest.cameras.append(name)
+                assignment[name] = idlest.node_id
+
+        orphaned = [name for name in cams if name not in assignment]
+        if orphaned:
+            logger.error(f"⚠️ Nicio instanță disponibilă pentru: {', '.join(orphaned)}")
+        self.assignment = assignment
+
+        for nid, node in self.nodes.items():
+            if resend_all or sorted(before.get(nid, [])) != sorted(node.cameras):
+                self._send_assignment(node, cams)
+
+    def _send_assignment(self, node, cams):
+        msg = {
+            "type": "assign",
+            "cameras": [cams[name] for name in node.cameras],
+            # A bay that was in alarm on a dead node stays in alarm on its new node
+            "alarm_state": {name: bool(self.bay_status.get(name, {}).get("alarm")) for name in node.cameras},
+            "ai": self.config_mgr.get_ai_settings(),
+            "capture": self.config_mgr.get_capture_settings(),
+        }
+        try:
+            node.channel.send(msg)
+            logger.info(f"📦 {node.node_id} <- {', '.join(node.cameras) or '(nicio cameră)'}")
+        except OSError as e:
+            logger.error(f"Trimitere alocare către {node.node_id} eșuată: {e}")
+
+    # ── Camera facade used by the dashboard ──────────────────────────────────
+    def read_frame(self, name):
+        """Latest thumbnail sent by the node running `name`, as (seq, frame)."""
+        entry = self._thumbnails.get(name)
+        if not entry:
+            return 0, None
+        seq, data = entry
+        cached = self._decoded.get(name)
+        if cached and cached[0] == seq:
+            return cached
+        import cv2
+        import numpy as np
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+        self._decoded[name] = (seq, frame)
+        return seq, frame
+
+    def get_latest_frames(self):
+        return {name: self.read_frame(name)[1] for name in list(self._thumbnails)}
+
+    def stop_all(self):
+        self.stop()
+
+    def get_status(self):
+        with self._lock:
+            return {
+                "nodes": {nid: {"address": n.address, "cameras": list(n.cameras),
+                                "capacity": n.capacity,
+                                "last_seen_s": round(time.monotonic() - n.last_seen, 1)}
+                          for nid, n in self.nodes.items()},
+                "assignment": dict(self.assignment),
+                "bays": dict(self.bay_status),
+            }
+
+
+# ── Worker side ──────────────────────────────────────────────────────────────
+class CoordinatorLink:
+    """
+    Worker connection to the coordinator, reconnecting forever.
+    `on_assign(msg)` and `on_connect()` (after every (re)connect, before the first
+    assignment) run on the link thread; `status_provider()` is polled every
+    `status_interval` seconds and doubles as the heartbeat.
+    """
+    def __init__(self, address, node_id, capacity, on_assign, status_provider, status_interval=1.0,
+                 on_connect=None):
+        self.host, self.port = parse_address(address)
+        self.node_id = node_id
+        self.capacity = capacity
+        self.on_assign = on_assign
+        self.on_connect = on_connect
+        self.status_provider = status_provider
+        self.status_interval = status_interval
+        self.channel = None
+        self.stopped = False
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True, name="cluster-link").start()
+        threading.Thread(target=self._status_loop, daemon=True, name="cluster-status").start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        if self.channel:
+            self.channel.close()
+
+    def send(self, msg):
+        """Best effort: returns False if the coordinator is unreachable right now."""
+        channel = self.channel
+        if channel is None:
+            return False
+        try:
+            channel.send(msg)
+            return True
+        except OSError:
+            return False
+
+    def _run(self):
+        while not self.stopped:
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=5)
+                sock.settimeout(None)
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                channel = MessageChannel(sock)
+                channel.send({"type": "hello", "node_id": self.node_id, "capacity": self.capacity})
+                self.channel = channel
+                logger.info(f"🔗 Conectat la coordonator {self.host}:{self.port} ca {self.node_id}.")
+                if self.on_connect:
+                    self.on_connect()
+                while not self.stopped:
+                    msg = channel.receive()
+                    if msg is None:
+                        break
+                    if msg.get("type") == "assign":
+                        self.on_assign(msg)
+            except (OSError, ValueError) as e:
+                if not self.stopped:
+                    logger.warning(f"Coordonator indisponibil ({self.host}:{self.port}): {e}")
+            finally:
+                if self.channel:
+                    self.channel.close()
+                self.channel = None
+            if not self.stopped:
+                time.sleep(2)
+
+    def _status_loop(self):
+        while not self.stopped:
+            time.sleep(self.status_interval)
+            if self.channel is None:
+                continue
+            try:
+                self.send(dict(self.status_provider(), type="status"))
+            except Exception as e:
+                logger.error(f"Eroare raport status cluster: {e}")
+
+
+class RemoteRelays:
+    """
+    RelayController stand-in on a worker: transitions are forwarded to the coordinator.
+    `_wanted` is what the bays asked for, `_states` what the coordinator was sent; a
+    failed send leaves them apart, so the next call retries and `resync` repairs the rest.
+    """
+    def __init__(self, link):
+        self.link = link
+        self.pins = []
+        self.active_low = True
+        self._wanted = {}
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def set_initial(self, states):
+        """Adopt states the coordinator already applied (e.g. alarm taken over from a dead node)."""
+        with self._lock:
+            self._wanted.update(states)
+            self._states.update(states)
+
+    def set_relay(self, index, on):
+        return self.set_relays({index: on})
+
+    def _send(self, changes):
+        if changes and self.link.send({"type": "relay", "changes": {str(i): on for i, on in changes.items()}}):
+            self._states.update(changes)
+
+    def set_relays(self, states):
+        with self._lock:
+            self._wanted.update(states)
+            changes = {idx: on for idx, on in states.items() if self._states.get(idx, False) != on}
+            self._send(changes)
+        return len(changes)
+
+    def resync(self, relay_ids):
+        """After a reconnect: send the full wanted state of `relay_ids` (the coordinator may have missed any of it)."""
+        with self._lock:
+            self._send({idx: self._wanted.get(idx, False) for idx in relay_ids})
+
+    def get_stats(self):
+        return {}
+
+    def cleanup(self):
+        pass
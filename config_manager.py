@@ -2,9 +2,16 @@
 config_manager.py - Persistent configuration for AI Wash Guard
 """
 
-import json
 import os
+import copy
+import json
+import time
+import select
+import struct
 import logging
+import threading
+import ctypes
+import ctypes.util
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +28,13 @@ DEFAULT_CONFIG = {
         "app_password": "",
         "recipient": "destinatar@email.com"
     },
+    "alerts": {
+        "per_bay_per_hour": 6,
+        "per_bay_burst": 2,
+        "global_per_hour": 30,
+        "global_burst": 5,
+        "digest_window_s": 300
+    },
     "mysql": {
         "enabled": False,
         "host": "localhost",
@@ -34,33 +48,318 @@ DEFAULT_CONFIG = {
     },
     "ai": {
         "confidence": 0.45,
-        "model": "yolov8n.pt"
+        "model": "yolov8n.pt",
+        "imgsz": 640,
+        "max_batch": 4,
+        "remote": {
+            "enabled": False,
+            "address": "192.168.1.60:9871",
+            "timeout_ms": 400,
+            "retry_s": 10,
+            "jpeg_quality": 80,
+            "max_side": 640
+        },
+        "cascade": {
+            "enabled": False,
+            "screen_model": "",
+            "screen_imgsz": 256,
+            "screen_conf": 0.15,
+            "screen_classes": [3],
+            "roi_margin": 0.5,
+            "audit_every": 50
+        }
+    },
+    "capture": {
+        "max_fps": 5,
+        "mode": "thread",
+        "cameras_per_process": 1,
+        "hang_s": 60
+    },
+    "pipeline": {
+        "frame_timeout_s": 10,
+        "stall_after_s": 15,
+        "backoff_min_s": 1,
+        "backoff_max_s": 60
+    },
+    "ui": {
+        "tiles_per_page": 4,
+        "thumbnail_interval_ms": 2000,
+        "incidents_per_page": 20,
+        "thumb_cache_mb": 16
+    },
+    "cluster": {
+        "port": 9870,
+        "capacity": 4,
+        "heartbeat_timeout": 5.0
+    },
+    "evidence": {
+        "path": "evidence",
+        "format": "jpg",
+        "quality": 80,
+        "max_width": 1280,
+        "crop_margin": 0.25,
+        "workers": 2,
+        "max_size_mb": 2048,
+        "max_age_days": 30
+    },
+    "live": {
+        "enabled": False,
+        "port": 8080,
+        "width": 640,
+        "fps": 5,
+        "quality": 70,
+        "user": "admin",
+        "password": ""
+    },
+    "journal": {
+        "path": "journal",
+        "segment_mb": 4,
+        "flush_interval_ms": 200
+    },
+    "camera_events": {
+        "enabled": False,
+        "source": "isapi",
+        "types": ["VMD", "linedetection", "fielddetection", "motion"],
+        "idle_fps": 0.5,
+        "hold_s": 15,
+        "silence_s": 60,
+        "http_url": "",
+        "mqtt": {"host": "localhost", "port": 1883, "topic": "awg/cameras/{name}/events"}
+    },
+    "logging": {
+        "level": "INFO",
+        "file": "logs/awg.log",
+        "json": False,
+        "max_mb": 10,
+        "backups": 3,
+        "queue_size": 10000,
+        "burst": 5,
+        "window_s": 60
+    },
+    "memory": {
+        "interval_s": 60,
+        "rss_warn_mb": 1500,
+        "rss_limit_mb": 0,
+        "limits_mb": {},
+        "tracemalloc": False,
+        "tracemalloc_frames": 10,
+        "restart": False,
+        "restart_cooldown_s": 900,
+        "top": 15
+    },
+    "state": {
+        "path": "state/bays.json",
+        "heartbeat_s": 60
+    },
+    "thermal": {
+        "enabled": False,
+        "sysfs_root": "/sys",
+        "temp_high_c": 78,
+        "temp_low_c": 70,
+        "latency_high_ms": 400,
+        "latency_low_ms": 200,
+        "step_up_s": 10,
+        "step_down_s": 60,
+        "interval_s": 2,
+        "motion_threshold": 6.0,
+        "motion_refresh_s": 10,
+        "ladder": [
+            {"imgsz": 480},
+            {"imgsz": 480, "max_fps": 3},
+            {"imgsz": 480, "max_fps": 3, "motion_gate": True},
+            {"imgsz": 320, "max_fps": 2, "motion_gate": True}
+        ]
+    },
+    "detection_log": {
+        "enabled": False,
+        "path": "detections",
+        "segment_mb": 64,
+        "rotate_hours": 24,
+        "flush_interval_s": 5
+    },
+    "performance": {
+        "enabled": False,
+        "torch_threads": 2,
+        "opencv_threads": 1,
+        "onnx_threads": 2,
+        "affinity": {"capture": [0], "inference": [1, 2], "ui": [3], "io": [3]}
     }
 }
 
+def diff_configs(old, new):
+    """
+    Structured diff between two configs: {section: set of changed keys}.
+    For "cameras" the set holds the names of cameras that were added, removed
+    or edited, so only those streams and bay states need to be touched.
+    """
+    diff = {}
+    for section in set(old) | set(new):
+        a, b = old.get(section), new.get(section)
+        if a == b:
+            continue
+        if section == "cameras":
+            by_name_a = {c["name"]: c for c in a or []}
+            by_name_b = {c["name"]: c for c in b or []}
+            changed = {n for n in set(by_name_a) | set(by_name_b)
+                       if by_name_a.get(n) != by_name_b.get(n)}
+            diff[section] = changed or {"*"}  # "*": only the order changed
+        elif isinstance(a, dict) and isinstance(b, dict):
+            diff[section] = {k for k in set(a) | set(b) if a.get(k) != b.get(k)}
+        else:
+            diff[section] = {"*"}
+    return diff
+
+
+class ConfigFileWatcher:
+    """
+    Calls `callback()` when the config file is written by anyone (editor, SettingsApp
+    in another process, scp...). Uses inotify on Linux; stat() polling elsewhere.
+    Events are debounced because editors usually write a file in several steps.
+    """
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+
+    def __init__(self, path, callback, debounce=0.3, poll_interval=1.0):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.stopped = False
+        self.thread = None
+
+    def start(self):
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True, name="config-watcher")
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped = True
+        if self.thread:
+            self.thread.join(timeout=2)
+
+    def _run(self):
+        fd = self._inotify_open()
+        try:
+            if fd is None:
+                logger.info("Monitorizare config.json prin interogare periodică (inotify indisponibil).")
+                self._poll_loop()
+            else:
+                self._inotify_loop(fd)
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def _inotify_open(self):
+        if not hasattr(select, "select") or not os.path.isdir(os.path.dirname(self.path)):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            # Watch the directory: editors often replace the file instead of writing in place
+            mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+            if libc.inotify_add_watch(fd, os.path.dirname(self.path).encode(), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _inotify_loop(self, fd):
+        name = os.path.basename(self.path).encode()
+        pending_since = None
+        while not self.stopped:
+            timeout = self.debounce if pending_since else 1.0
+            ready, _, _ = select.select([fd], [], [], timeout)
+            if ready:
+                try:
+                    data = os.read(fd, 4096)
+                except BlockingIOError:
+                    data = b""
+                offset = 0
+                while offset + 16 <= len(data):
+                    _, _, _, length = struct.unpack_from("iIII", data, offset)
+                    event_name = data[offset + 16:offset + 16 + length].rstrip(b"\0")
+                    offset += 16 + length
+                    if event_name == name:
+                        pending_since = time.monotonic()
+            elif pending_since and time.monotonic() - pending_since >= self.debounce:
+                pending_since = None
+                self._fire()
+
+    def _poll_loop(self):
+        last = self._mtime()
+        while not self.stopped:
+            time.sleep(self.poll_interval)
+            current = self._mtime()
+            if current != last:
+                last = current
+                time.sleep(self.debounce)
+                self._fire()
+
+    def _mtime(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def _fire(self):
+        try:
+            self.callback()
+        except Exception as e:
+            logger.error(f"Eroare la reîncărcarea configurației: {e}")
+
+
 class ConfigManager:
-    def __init__(self, config_path="config.json"):
+    """
+    Single shared configuration store. Components subscribe to it and receive a
+    structured diff whenever the config changes (GUI save or external edit).
+    """
+    def __init__(self, config_path="config.json", state_dir=None):
         self.config_path = config_path
-        self.config = DEFAULT_CONFIG.copy()
+        # Relative runtime paths (journal, logs, detections, bay state) live under
+        # `state_dir` when set, so several processes can share one config.json
+        self.state_dir = state_dir
+        self.config = copy.deepcopy(DEFAULT_CONFIG)
+        self._lock = threading.RLock()
+        self._subscribers = []
+        self._watcher = None
         self.load()
 
     def load(self):
         if os.path.exists(self.config_path):
-            try:
-                with open(self.config_path, 'r') as f:
-                    loaded = json.load(f)
-                    # Merge with defaults to ensure all keys exist
-                    self._deep_update(self.config, loaded)
+            loaded = self._read_file()
+            if loaded is not None:
+                self.config = loaded
                 logger.info("Configurație încărcată din fișier.")
-            except Exception as e:
-                logger.error(f"Eroare la încărcarea configurației: {e}")
         else:
             self.save() # Create default file
 
+    def _read_file(self):
+        """Returns defaults merged with the file content, or None if the file is unreadable."""
+        try:
+            with open(self.config_path, 'r') as f:
+                loaded = json.load(f)
+            # Merge with defaults to ensure all keys exist
+            merged = copy.deepcopy(DEFAULT_CONFIG)
+            self._deep_update(merged, loaded)
+            return merged
+        except Exception as e:
+            logger.error(f"Eroare la încărcarea configurației: {e}")
+            return None
+
     def save(self):
         try:
-            with open(self.config_path, 'w') as f:
-                json.dump(self.config, f, indent=4)
+            # Atomic replace so the file watcher never sees a half-written file
+            tmp_path = self.config_path + ".tmp"
+            with self._lock:
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.config, f, indent=4)
+            os.replace(tmp_path, self.config_path)
             logger.info("Configurație salvată.")
         except Exception as e:
             logger.error(f"Eroare la salvarea configurației: {e}")
@@ -72,19 +371,129 @@ class ConfigManager:
             else:
                 base[k] = v
 
+    # ── Change propagation ───────────────────────────────────────────────────
+    def subscribe(self, callback):
+        """Register `callback(diff)`; it runs on the thread that applied the change."""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def _swap(self, new_config):
+        with self._lock:
+            diff = diff_configs(self.config, new_config)
+            if diff:
+                self.config = new_config
+        if diff:
+            logger.info(f"🔄 Configurație modificată: {', '.join(sorted(diff))}")
+            for callback in list(self._subscribers):
+                try:
+                    callback(diff)
+                except Exception as e:
+                    logger.error(f"Eroare la aplicarea configurației ({callback}): {e}")
+        return diff
+
+    def reload(self):
+        """Re-read the file and notify subscribers of what changed. Returns the diff."""
+        loaded = self._read_file()
+        if loaded is None:
+            return {}
+        return self._swap(loaded)
+
+    def apply(self, new_config, persist=True):
+        """
+        Replace the whole config (e.g. from SettingsApp), persist it and notify subscribers.
+        `persist=False` keeps the change in memory only (e.g. cameras assigned to a cluster worker).
+        """
+        diff = self._swap(copy.deepcopy(new_config))
+        if diff and persist:
+            self.save()
+        return diff
+
+    def snapshot(self):
+        """Deep copy that can be edited freely and handed back to `apply`."""
+        with self._lock:
+            return copy.deepcopy(self.config)
+
+    def start_watching(self):
+        if self._watcher is None:
+            self._watcher = ConfigFileWatcher(self.config_path, self.reload).start()
+
+    def stop_watching(self):
+        if self._watcher:
+            self._watcher.stop()
+            self._watcher = None
+
+    # ── Accessors ────────────────────────────────────────────────────────────
     def get_cameras(self):
         return self.config["cameras"]
 
     def get_email_settings(self):
         return self.config["email"]
 
+    def get_alert_settings(self):
+        return self.config["alerts"]
+
     def get_mysql_settings(self):
         return self.config["mysql"]
 
     def get_hardware_settings(self):
         return self.config["hardware"]
 
+    def get_ai_settings(self):
+        return self.config["ai"]
+
+    def get_capture_settings(self):
+        return self.config["capture"]
+
+    def get_pipeline_settings(self):
+        return self.config["pipeline"]
+
+    def get_ui_settings(self):
+        return self.config["ui"]
+
+    def get_cluster_settings(self):
+        return self.config["cluster"]
+
+    def get_evidence_settings(self):
+        return self.config["evidence"]
+
+    def get_live_settings(self):
+        return self.config["live"]
+
+    def _runtime_path(self, path):
+        if self.state_dir and not os.path.isabs(path):
+            return os.path.join(self.state_dir, path)
+        return path
+
+    def get_journal_settings(self):
+        return dict(self.config["journal"], path=self._runtime_path(self.config["journal"]["path"]))
+
+    def get_camera_events_settings(self):
+        return self.config["camera_events"]
+
+    def get_logging_settings(self):
+        cfg = self.config["logging"]
+        return dict(cfg, file=self._runtime_path(cfg["file"])) if cfg.get("file") else cfg
+
+    def get_memory_settings(self):
+        return self.config["memory"]
+
+    def get_state_settings(self):
+        return dict(self.config["state"], path=self._runtime_path(self.config["state"]["path"]))
+
+    def get_thermal_settings(self):
+        return self.config["thermal"]
+
+    def get_detection_log_settings(self):
+        return dict(self.config["detection_log"], path=self._runtime_path(self.config["detection_log"]["path"]))
+
+    def get_performance_settings(self):
+        return self.config["performance"]
+
     def update_settings(self, section, data):
         if section in self.config:
-            self.config[section] = data
-            self.save()
+            new_config = self.snapshot()
+            new_config[section] = data
+            self.apply(new_config)
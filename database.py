@@ -50,9 +50,16 @@ class DatabaseManager:
                     id INT AUTO_INCREMENT PRIMARY KEY,
                     bay_name VARCHAR(100),
                     vehicle_type VARCHAR(100),
-                    timestamp DATETIME
+                    timestamp DATETIME,
+                    image_path VARCHAR(255)
                 )
             """)
+            # Tables created before snapshots were stored on disk lack image_path
+            try:
+                cursor.execute("ALTER TABLE Wash_Incidents ADD COLUMN image_path VARCHAR(255)")
+            except mysql.connector.Error as err:
+                if err.errno != 1060:  # ER_DUP_FIELDNAME: column already there
+                    raise
             cursor.execute("""
                 CREATE TABLE IF NOT EXISTS Wash_Sessions (
                     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -62,34 +69,62 @@ class DatabaseManager:
                     duration_seconds INT
                 )
             """)
+            # Keyset pagination (incident browser) and replay dedup lookups
+            for index in ("CREATE INDEX idx_incidents_time ON Wash_Incidents (timestamp, id)",
+                          "CREATE INDEX idx_sessions_bay_start ON Wash_Sessions (bay_name, start_time)"):
+                try:
+                    cursor.execute(index)
+                except mysql.connector.Error as err:
+                    if err.errno != 1061:  # ER_DUP_KEYNAME: index already there
+                        raise
             self.conn.commit()
             cursor.close()
             logger.info("Baza de date și tabelele sunt pregătite.")
         except mysql.connector.Error as err:
             logger.error(f"Eroare inițializare tabelă: {err}")
 
-    def log_incident(self, bay_name, vehicle_type):
+    def log_incident(self, bay_name, vehicle_type, image_path=None, timestamp=None):
+        """
+        Returns True once the incident is stored. With an explicit `timestamp` (journal
+        replay) an incident already stored for that bay and time is not inserted twice.
+        """
         conn = self._get_connection()
-        if not conn: return
+        if not conn: return False
         
         try:
             cursor = conn.cursor()
-            query = "INSERT INTO Wash_Incidents (bay_name, vehicle_type, timestamp) VALUES (%s, %s, %s)"
-            cursor.execute(query, (bay_name, vehicle_type, datetime.now()))
+            if timestamp is not None:
+                cursor.execute("SELECT id FROM Wash_Incidents WHERE bay_name = %s AND timestamp = %s",
+                               (bay_name, timestamp))
+                if cursor.fetchone():
+                    cursor.close()
+                    return True
+            query = "INSERT INTO Wash_Incidents (bay_name, vehicle_type, timestamp, image_path) VALUES (%s, %s, %s, %s)"
+            cursor.execute(query, (bay_name, vehicle_type, timestamp or datetime.now(), image_path))
             conn.commit()
             cursor.close()
             logger.info(f"Incident salvat în DB pentru {bay_name}.")
+            return True
         except mysql.connector.Error as err:
             logger.error(f"Eroare salvare incident în DB: {err}")
+            return False
 
-    def start_session(self, bay_name):
+    def start_session(self, bay_name, start_time=None):
+        """Returns the session id; an existing session with the same bay and start time is reused."""
         conn = self._get_connection()
         if not conn: return None
         
         try:
             cursor = conn.cursor()
+            if start_time is not None:
+                cursor.execute("SELECT id FROM Wash_Sessions WHERE bay_name = %s AND start_time = %s",
+                               (bay_name, start_time))
+                row = cursor.fetchone()
+                if row:
+                    cursor.close()
+                    return row[0]
             query = "INSERT INTO Wash_Sessions (bay_name, start_time) VALUES (%s, %s)"
-            cursor.execute(query, (bay_name, datetime.now()))
+            cursor.execute(query, (bay_name, start_time or datetime.now()))
             session_id = cursor.lastrowid
             conn.commit()
             cursor.close()
@@ -98,9 +133,9 @@ class DatabaseManager:
             logger.error(f"Eroare pornire sesiune: {err}")
             return None
 
-    def end_session(self, session_id):
+    def end_session(self, session_id, end_time=None):
         conn = self._get_connection()
-        if not conn or session_id is None: return
+        if not conn or session_id is None: return False
         
         try:
             cursor = conn.cursor()
@@ -108,10 +143,10 @@ class DatabaseManager:
             result = cursor.fetchone()
             if not result: 
                 cursor.close()
-                return
+                return True
             
             start_time = result[0]
-            end_time = datetime.now()
+            end_time = end_time or datetime.now()
             duration = int((end_time - start_time).total_seconds())
             
             query = "UPDATE Wash_Sessions SET end_time = %s, duration_seconds = %s WHERE id = %s"
@@ -119,8 +154,89 @@ class DatabaseManager:
             conn.commit()
             cursor.close()
             logger.info(f"Sesiune {session_id} încheiată. Durată: {duration} secunde.")
+            return True
         except mysql.connector.Error as err:
             logger.error(f"Eroare închidere sesiune: {err}")
+            return False
+
+    def close_dangling_sessions(self, keep=(), end_time=None):
+        """
+        Close, in one UPDATE, every session still open except the (bay_name, start_time)
+        pairs in `keep`. They end at `end_time` (never before their start); without it
+        they get zero duration, since when they really ended is unknown.
+        """
+        conn = self._get_connection()
+        if not conn: return False
+
+        query = ("UPDATE Wash_Sessions SET end_time = GREATEST(start_time, COALESCE(%s, start_time)), "
+                 "duration_seconds = TIMESTAMPDIFF(SECOND, start_time, GREATEST(start_time, COALESCE(%s, start_time))) "
+                 "WHERE end_time IS NULL")
+        params = [end_time, end_time]
+        if keep:
+            query += " AND (bay_name, start_time) NOT IN (" + ", ".join(["(%s, %s)"] * len(keep)) + ")"
+            params += [value for pair in keep for value in pair]
+        try:
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            closed = cursor.rowcount
+            conn.commit()
+            cursor.close()
+            if closed:
+                logger.info(f"Sesiuni rămase deschise după oprire, închise: {closed}.")
+            return True
+        except mysql.connector.Error as err:
+            logger.error(f"Eroare închidere sesiuni rămase deschise: {err}")
+            return False
+
+    def list_incidents(self, limit=20, after=None, bay_name=None):
+        """
+        One page of incidents, newest first, with the duration of the matching session.
+        Keyset pagination: `after` = (timestamp, id) of the last row of the previous
+        page, so deep pages cost the same as the first one (no OFFSET scan).
+        Returns a list of dicts, or None if the DB is unreachable.
+        """
+        conn = self._get_connection()
+        if not conn: return None
+
+        where, params = [], []
+        if after is not None:
+            where.append("(i.timestamp < %s OR (i.timestamp = %s AND i.id < %s))")
+            params += [after[0], after[0], after[1]]
+        if bay_name:
+            where.append("i.bay_name = %s")
+            params.append(bay_name)
+        query = (
+            "SELECT i.id, i.bay_name, i.vehicle_type, i.timestamp, i.image_path, s.duration_seconds "
+            "FROM Wash_Incidents i LEFT JOIN Wash_Sessions s "
+            "ON s.bay_name = i.bay_name AND s.start_time = i.timestamp "
+            + ("WHERE " + " AND ".join(where) + " " if where else "")
+            + "ORDER BY i.timestamp DESC, i.id DESC LIMIT %s"
+        )
+        try:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(query, params + [int(limit)])
+            rows = cursor.fetchall()
+            cursor.close()
+            conn.commit()  # End the read snapshot so the next page sees new incidents
+        except mysql.connector.Error as err:
+            logger.error(f"Eroare citire incidente: {err}")
+            return None
+        return rows
+
+    def list_bays(self):
+        """Bay names that have incidents (browser filter)."""
+        conn = self._get_connection()
+        if not conn: return []
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT DISTINCT bay_name FROM Wash_Incidents ORDER BY bay_name")
+            bays = [row[0] for row in cursor.fetchall()]
+            cursor.close()
+            conn.commit()
+            return bays
+        except mysql.connector.Error as err:
+            logger.error(f"Eroare citire boxe: {err}")
+            return []
 
     def update_config(self, host, user, password, database):
         """Updates config. Connection will happen lazily on next use."""
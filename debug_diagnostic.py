@@ -1,7 +1,14 @@
 import sys
 import os
+import time
+import socket
 import logging
+import argparse
+import tempfile
+import threading
 import traceback
+import statistics
+import socketserver
 
 # Setup logging to console
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -69,8 +76,268 @@ def run_diagnostic():
 
     logger.info("=== DIAGNOSTIC FINALIZAT ===")
 
+# ── Performance self-test (--perf) ───────────────────────────────────────────
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+def _time_inference(detector, frame, iterations):
+    latencies = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        detector.detect_objects(frame)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return {"fps": 1000 / statistics.mean(latencies), "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95)}
+
+def perf_inference(model_path, sizes, backends, iterations):
+    """Model load/warm-up time, then FPS per (backend, imgsz) on a synthetic 720p frame."""
+    import numpy as np
+    from ai_detector import AiDetector
+    from sweep_operating_point import export_backend
+    logging.getLogger("ai_detector").setLevel(logging.ERROR)
+    frame = np.random.default_rng(0).integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+
+    t0 = time.perf_counter()
+    detector = AiDetector(model_path=model_path, imgsz=sizes[0])
+    load_s = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    detector.detect_objects(frame)
+    warmup_s = time.perf_counter() - t0
+    logger.info(f"[PERF] Model {model_path}: încărcare {load_s:.2f}s, prima inferență (warm-up) {warmup_s:.2f}s")
+
+    results, exports = [], {}
+    for backend in backends:
+        for imgsz in sizes:
+            try:
+                model_file = export_backend(model_path, backend, imgsz, exports)
+                det = detector if backend == "pt" else AiDetector(model_path=model_file, imgsz=imgsz)
+                det.set_imgsz(imgsz)
+                for _ in range(3):
+                    det.detect_objects(frame)
+                r = _time_inference(det, frame, iterations)
+            except Exception as e:
+                logger.error(f"[FAIL] Inferență {backend}/{imgsz}: {e}")
+                continue
+            r.update(backend=backend, imgsz=imgsz, model=model_file)
+            results.append(r)
+            logger.info(f"[PERF] {backend:<8} imgsz {imgsz:>4}: {r['fps']:6.1f} FPS  "
+                        f"p50 {r['p50']:6.1f} ms  p95 {r['p95']:6.1f} ms")
+    return {"load_s": load_s, "warmup_s": warmup_s, "runs": results}
+
+def _make_test_clip(seconds=10, fps=25):
+    """Synthetic 720p H.264/MP4V clip standing in for a camera when none is reachable."""
+    import cv2
+    import numpy as np
+    path = os.path.join(tempfile.gettempdir(), "awg_perf_clip.mp4")
+    if os.path.exists(path):
+        return path
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (1280, 720))
+    rng = np.random.default_rng(1)
+    background = rng.integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+    for i in range(seconds * fps):
+        frame = background.copy()
+        x = (i * 17) % 1100
+        cv2.rectangle(frame, (x, 300), (x + 180, 460), (0, 0, 255), -1)
+        writer.write(frame)
+    writer.release()
+    return path
+
+def perf_decode(source, seconds):
+    """Open latency and full-rate decode FPS of one stream/clip (every packet decoded)."""
+    import cv2
+    t0 = time.perf_counter()
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened() or not cap.grab():
+        cap.release()
+        return None
+    open_s = time.perf_counter() - t0
+    frames, latencies = 0, []
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        t = time.perf_counter()
+        if not cap.grab():
+            cap.set(cv2.CAP_PROP_POS_FRAMES, 0)  # Loop clips
+            continue
+        cap.retrieve()
+        latencies.append((time.perf_counter() - t) * 1000)
+        frames += 1
+    stream_fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    cap.release()
+    elapsed = time.perf_counter() - start
+    return {"open_s": open_s, "fps": frames / elapsed, "p95_ms": _percentile(latencies, 95),
+            "stream_fps": stream_fps}
+
+class _SmtpStandIn(socketserver.StreamRequestHandler):
+    """Minimal SMTP dialogue (no TLS/auth) to time message build + protocol round trips locally."""
+    def handle(self):
+        self.wfile.write(b"220 awg-perf ESMTP\r\n")
+        in_data = False
+        for line in self.rfile:
+            if in_data:
+                if line in (b".\r\n", b".\n"):
+                    in_data = False
+                    self.wfile.write(b"250 OK\r\n")
+                continue
+            cmd = line[:4].upper()
+            if cmd == b"DATA":
+                in_data = True
+                self.wfile.write(b"354 End data with .\r\n")
+            elif cmd == b"QUIT":
+                self.wfile.write(b"221 Bye\r\n")
+                return
+            elif cmd == b"EHLO":
+                self.wfile.write(b"250-awg-perf\r\n250 SIZE 10485760\r\n")
+            else:
+                self.wfile.write(b"250 OK\r\n")
+
+def perf_smtp(iterations):
+    import smtplib
+    from email.mime.text import MIMEText
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.image import MIMEImage
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SmtpStandIn)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    attachment = os.urandom(150 * 1024)  # Typical snapshot size
+    latencies = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        msg = MIMEMultipart()
+        msg.attach(MIMEText("perf", "plain"))
+        msg.attach(MIMEImage(attachment, _subtype="jpeg"))
+        smtp = smtplib.SMTP("127.0.0.1", port, timeout=5)
+        smtp.sendmail("awg@localhost", ["awg@localhost"], msg.as_string())
+        smtp.quit()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    server.shutdown()
+    server.server_close()
+    return {"p50": _percentile(latencies, 50), "p95": _percentile(latencies, 95)}
+
+def perf_db(mysql_cfg, iterations):
+    """SELECT 1 round trips to the configured MySQL (normally localhost on the Pi)."""
+    import mysql.connector
+    t0 = time.perf_counter()
+    conn = mysql.connector.connect(host=mysql_cfg["host"], user=mysql_cfg["user"],
+                                   password=mysql_cfg["password"], database=mysql_cfg["database"],
+                                   connect_timeout=3)
+    connect_ms = (time.perf_counter() - t0) * 1000
+    cursor = conn.cursor()
+    latencies = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        cursor.execute("SELECT 1")
+        cursor.fetchall()
+        latencies.append((time.perf_counter() - t0) * 1000)
+    cursor.close()
+    conn.close()
+    return {"connect_ms": connect_ms, "p50": _percentile(latencies, 50), "p95": _percentile(latencies, 95)}
+
+def recommend(inference, decodes, max_fps, cores):
+    """
+    Fastest local setting and how many cameras it can analyse at the recommended
+    max_fps: capture.max_fps, or the lower rate a single bay can sustain.
+    """
+    runs = inference["runs"]
+    if not runs:
+        return None
+    # Prefer the largest input size that still leaves room for at least 2 bays
+    viable = [r for r in runs if r["fps"] >= 2 * max_fps] or [max(runs, key=lambda r: r["fps"])]
+    best = max(viable, key=lambda r: (r["imgsz"], r["fps"]))
+    budget_fps = best["fps"] * 0.8  # Headroom for UI, journal, email
+    if budget_fps < max_fps:
+        # Not even one bay at capture.max_fps: recommend the rate one bay can actually get
+        max_fps = max(0.1, int(budget_fps * 10) / 10)
+    by_inference = int(budget_fps // max_fps)
+
+    # Decoding every packet of a stream costs stream_fps / max_decode_fps of a core
+    by_decode = None
+    measured = [d for d in decodes.values() if d]
+    if measured:
+        cost = max((d["stream_fps"] or 25.0) / d["fps"] for d in measured)
+        capture_cores = max(1, cores - 2)  # Rest for inference and UI
+        by_decode = int(capture_cores / cost) if cost > 0 else None
+    # Counted at the max_fps recommended below; 0 = decoding alone exceeds the CPU
+    cameras = min(c for c in (by_inference, by_decode) if c is not None)
+    return {
+        "cameras": cameras,
+        "limited_by": "decodare" if by_decode is not None and by_decode < by_inference else "inferență",
+        "ai": {"model": best["model"], "imgsz": best["imgsz"], "max_batch": min(4, max(1, cameras))},
+        "capture": {"max_fps": max_fps},
+        "performance": {"torch_threads": max(1, min(cores - 1, 3)), "opencv_threads": 1},
+        "inference_fps": round(best["fps"], 1),
+    }
+
+def run_perf(args):
+    logger.info("=== AI WASH GUARD PERF SELF-TEST ===")
+    from config_manager import ConfigManager
+    cm = ConfigManager()
+    cores = os.cpu_count() or 1
+    logger.info(f"[PERF] CPU: {cores} nuclee, platformă {sys.platform}")
+
+    sizes = [int(s) for s in args.sizes.split(",")]
+    backends = args.backends.split(",")
+    inference = perf_inference(args.model or cm.get_ai_settings()["model"], sizes, backends, args.iterations)
+
+    decodes = {}
+    sources = [(c["name"], c["url"]) for c in cm.get_cameras() if c.get("enabled", True) and c.get("url")]
+    if args.clip:
+        sources = [("clip", args.clip)]
+    for name, url in sources:
+        decodes[name] = perf_decode(url, args.seconds)
+        if decodes[name]:
+            d = decodes[name]
+            logger.info(f"[PERF] Decodare {name}: deschidere {d['open_s']:.2f}s, {d['fps']:.1f} FPS maxim "
+                        f"(flux {d['stream_fps']:.0f} FPS), p95 {d['p95_ms']:.1f} ms/cadru")
+        else:
+            logger.error(f"[FAIL] Decodare {name}: flux indisponibil")
+    if not any(decodes.values()):
+        clip = _make_test_clip()
+        logger.info(f"[PERF] Nicio cameră accesibilă; se folosește clipul de test {clip}")
+        decodes["clip"] = perf_decode(clip, args.seconds)
+        if decodes["clip"]:
+            logger.info(f"[PERF] Decodare clip: {decodes['clip']['fps']:.1f} FPS maxim")
+
+    try:
+        smtp = perf_smtp(10)
+        logger.info(f"[PERF] SMTP local (stand-in, 150 KB atașament): p50 {smtp['p50']:.1f} ms, p95 {smtp['p95']:.1f} ms")
+    except Exception as e:
+        logger.error(f"[FAIL] SMTP stand-in: {e}")
+    try:
+        db = perf_db(cm.get_mysql_settings(), 20)
+        logger.info(f"[PERF] MySQL: conectare {db['connect_ms']:.1f} ms, SELECT 1 p50 {db['p50']:.2f} ms, "
+                    f"p95 {db['p95']:.2f} ms")
+    except Exception as e:
+        logger.error(f"[FAIL] MySQL indisponibil: {e}")
+
+    profile = recommend(inference, decodes, cm.get_capture_settings()["max_fps"], cores)
+    if profile is None:
+        logger.error("[FAIL] Nicio măsurătoare de inferență; nu se poate recomanda un profil.")
+        return
+    logger.info(f"=== RECOMANDARE: {profile['cameras']} camere (limitat de {profile['limited_by']}), "
+                f"{profile['inference_fps']} FPS inferență ===")
+    import json
+    print(json.dumps({k: profile[k] for k in ("ai", "capture", "performance")}, indent=4))
+    logger.info("=== PERF FINALIZAT ===")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="AI Wash Guard - diagnostic")
+    parser.add_argument("--perf", action="store_true", help="Test de performanță pe dispozitiv")
+    parser.add_argument("--model", help="Model de testat (implicit: ai.model din config)")
+    parser.add_argument("--sizes", default="320,480,640", help="Dimensiuni de intrare testate")
+    parser.add_argument("--backends", default="pt,onnx", help="pt,onnx,ncnn,openvino...")
+    parser.add_argument("--iterations", type=int, default=30, help="Inferențe per setare")
+    parser.add_argument("--clip", help="Clip video în locul camerelor configurate")
+    parser.add_argument("--seconds", type=float, default=5.0, help="Durata testului de decodare per cameră")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
     try:
-        run_diagnostic()
+        if args.perf:
+            run_perf(args)
+        else:
+            run_diagnostic()
     except Exception:
         traceback.print_exc()
@@ -0,0 +1,321 @@
+"""
+detection_log.py - Compact columnar log of per-frame detections for offline analysis
+Every detection the model reports (all classes, not only the alarm classes) is
+buffered in memory and appended in batches to one raw little-endian file per
+column. A segment directory is closed after `rotate_hours` or `segment_mb`, so a
+time range only touches the segments that overlap it. Readers memory-map the
+column files: scanning months of history reads only the columns a query needs.
+
+    detections/
+        cameras.json                camera name <-> id
+        classes.json                class id <-> model class name
+        seg-1760870000/ts.f8 cam.u2 cls.u2 score.f4 x1.u2 y1.u2 x2.u2 y2.u2 meta.json
+
+    python detection_log.py detections/ --days 30 --camera "Boxa 1" --min-score 0.3
+"""
+
+import os
+import json
+import time
+import logging
+import argparse
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Column name -> dtype (24 bytes per detection)
+COLUMNS = {
+    "ts": "<f8",
+    "cam": "<u2",
+    "cls": "<u2",
+    "score": "<f4",
+    "x1": "<u2", "y1": "<u2", "x2": "<u2", "y2": "<u2",
+}
+ROW_BYTES = sum(np.dtype(t).itemsize for t in COLUMNS.values())
+_SEGMENT_PREFIX = "seg-"
+
+
+def _column_file(segment_dir, name):
+    return os.path.join(segment_dir, f"{name}.{COLUMNS[name][1:]}")
+
+
+def _write_json(path, data):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+class DetectionLog:
+    """
+    Append side. `add()` is called from the bay pipelines and only appends to
+    in-memory lists; a background thread writes them out every `flush_interval_s`.
+    """
+    def __init__(self, path="detections", segment_mb=64, rotate_hours=24, flush_interval_s=5.0):
+        self.path = path
+        self.segment_bytes = int(segment_mb * 1024 * 1024)
+        self.rotate_s = rotate_hours * 3600
+        self.flush_interval = flush_interval_s
+        os.makedirs(path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._pending = {name: [] for name in COLUMNS}
+        self._cameras = self._load_json("cameras.json")
+        self._classes = self._load_json("classes.json")
+        self._segment = None
+        self._segment_start = 0.0
+        self._segment_rows = 0
+        self.stats = {"rows": 0, "flushes": 0, "dropped": 0}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._flush_loop, daemon=True, name="detection-log")
+        self._thread.start()
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(cfg["path"], cfg["segment_mb"], cfg["rotate_hours"], cfg["flush_interval_s"])
+
+    def _load_json(self, name):
+        try:
+            with open(os.path.join(self.path, name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _camera_id(self, name):
+        cam = self._cameras.get(name)
+        if cam is None:
+            cam = self._cameras[name] = len(self._cameras)
+            _write_json(os.path.join(self.path, "cameras.json"), self._cameras)
+        return cam
+
+    def add(self, ts, camera, detections):
+        """Log the detections of one frame (Detection tuples, plus `.others` when present)."""
+        others = getattr(detections, "others", ())
+        if not detections and not others:
+            return
+        with self._lock:
+            cam = self._camera_id(camera)
+            p = self._pending
+            for d in list(detections) + list(others):
+                if str(d.cls_id) not in self._classes:
+                    self._classes[str(d.cls_id)] = d.name
+                    _write_json(os.path.join(self.path, "classes.json"), self._classes)
+                x1, y1, x2, y2 = d.box
+                p["ts"].append(ts)
+                p["cam"].append(cam)
+                p["cls"].append(d.cls_id)
+                p["score"].append(d.score)
+                p["x1"].append(x1); p["y1"].append(y1); p["x2"].append(x2); p["y2"].append(y2)
+
+    # ── Writing ──────────────────────────────────────────────────────────────
+    def _open_segment(self, first_ts):
+        self._segment_start = first_ts
+        self._segment = os.path.join(self.path, f"{_SEGMENT_PREFIX}{int(first_ts)}")
+        os.makedirs(self._segment, exist_ok=True)
+        self._segment_rows = self._rows_on_disk(self._segment)
+        self._truncate(self._segment_rows)
+
+    def _truncate(self, rows):
+        """Cut every column back to `rows` (a write torn by a crash or full disk leaves them uneven)."""
+        for name, dtype in COLUMNS.items():
+            path = _column_file(self._segment, name)
+            if os.path.exists(path) and os.path.getsize(path) > rows * np.dtype(dtype).itemsize:
+                os.truncate(path, rows * np.dtype(dtype).itemsize)
+
+    @staticmethod
+    def _rows_on_disk(segment_dir):
+        sizes = [os.path.getsize(_column_file(segment_dir, n)) // np.dtype(t).itemsize
+                 for n, t in COLUMNS.items() if os.path.exists(_column_file(segment_dir, n))]
+        return min(sizes) if sizes else 0
+
+    def _close_segment(self):
+        if self._segment is None:
+            return
+        ts = np.memmap(_column_file(self._segment, "ts"), dtype=COLUMNS["ts"], mode="r") \
+            if self._segment_rows else None
+        _write_json(os.path.join(self._segment, "meta.json"), {
+            "start": float(ts[0]) if ts is not None else self._segment_start,
+            "end": float(ts[self._segment_rows - 1]) if ts is not None else self._segment_start,
+            "rows": self._segment_rows,
+        })
+        self._segment = None
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {name: [] for name in COLUMNS}
+        n = len(pending["ts"])
+        if not n:
+            return 0
+        first_ts = pending["ts"][0]
+        if self._segment is not None and (first_ts - self._segment_start >= self.rotate_s
+                                          or self._segment_rows * ROW_BYTES >= self.segment_bytes):
+            self._close_segment()
+        if self._segment is None:
+            self._open_segment(first_ts)
+        try:
+            for name, dtype in COLUMNS.items():
+                values = pending[name]
+                if dtype == "<u2" and name[0] in "xy":
+                    values = np.clip(values, 0, 65535)
+                with open(_column_file(self._segment, name), "ab") as f:
+                    np.asarray(values, dtype=dtype).tofile(f)
+        except OSError as e:
+            self.stats["dropped"] += n
+            logger.error(f"Eroare scriere jurnal detecții: {e}")
+            try:
+                self._truncate(self._segment_rows)
+            except OSError:
+                pass
+            return 0
+        self._segment_rows += n
+        self.stats["rows"] += n
+        self.stats["flushes"] += 1
+        return n
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+    def pending_bytes(self):
+        """Size of the rows buffered since the last flush."""
+        return len(self._pending["ts"]) * ROW_BYTES
+
+    def get_stats(self):
+        return dict(self.stats, segment=os.path.basename(self._segment) if self._segment else None)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=self.flush_interval + 1)
+        self.flush()
+        self._close_segment()
+
+
+class DetectionLogReader:
+    """
+    Memory-mapped read side for analysis scripts:
+
+        reader = DetectionLogReader("detections")
+        cols = reader.load(start=time.time() - 30 * 86400, cameras=["Boxa 1"], min_score=0.3)
+        cols["score"], cols["cls"], ...  # numpy arrays, one entry per detection
+    """
+    def __init__(self, path="detections"):
+        self.path = path
+        self.cameras = {}
+        self.class_names = {}
+        try:
+            with open(os.path.join(path, "cameras.json")) as f:
+                self.cameras = json.load(f)
+            with open(os.path.join(path, "classes.json")) as f:
+                self.class_names = {int(k): v for k, v in json.load(f).items()}
+        except (OSError, ValueError):
+            pass
+        self.camera_names = {cam: name for name, cam in self.cameras.items()}
+
+    def segments(self):
+        """Segment directories, oldest first."""
+        if not os.path.isdir(self.path):
+            return []
+        names = [n for n in os.listdir(self.path) if n.startswith(_SEGMENT_PREFIX)]
+        return [os.path.join(self.path, n) for n in sorted(names, key=lambda n: int(n[len(_SEGMENT_PREFIX):]))]
+
+    def _meta(self, segment_dir):
+        try:
+            with open(os.path.join(segment_dir, "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None  # Segment still being written
+
+    def open_segment(self, segment_dir, columns=None):
+        """{column: read-only memmap} trimmed to the rows present in every column."""
+        columns = columns or list(COLUMNS)
+        rows = DetectionLog._rows_on_disk(segment_dir)
+        if not rows:
+            return None
+        return {name: np.memmap(_column_file(segment_dir, name), dtype=COLUMNS[name], mode="r", shape=(rows,))
+                for name in columns}
+
+    def scan(self, start=None, end=None, cameras=None, classes=None, min_score=None, columns=None):
+        """
+        Yields one dict of filtered column arrays per segment. Segments outside
+        [start, end] are skipped by name/metadata without being opened.
+        """
+        columns = list(columns or COLUMNS)
+        needed = set(columns) | {"ts"}
+        if cameras is not None:
+            needed.add("cam")
+            cam_ids = [self.cameras[c] for c in cameras if c in self.cameras]
+        if classes is not None:
+            needed.add("cls")
+        if min_score is not None:
+            needed.add("score")
+
+        segments = self.segments()
+        for i, seg in enumerate(segments):
+            seg_start = int(os.path.basename(seg)[len(_SEGMENT_PREFIX):])
+            if end is not None and seg_start > end:
+                break
+            meta = self._meta(seg)
+            seg_end = meta["end"] if meta else None
+            if seg_end is None and i + 1 < len(segments):
+                seg_end = int(os.path.basename(segments[i + 1])[len(_SEGMENT_PREFIX):])
+            if start is not None and seg_end is not None and seg_end < start:
+                continue
+
+            cols = self.open_segment(seg, needed)
+            if cols is None:
+                continue
+            mask = np.ones(len(cols["ts"]), dtype=bool)
+            if start is not None:
+                mask &= cols["ts"] >= start
+            if end is not None:
+                mask &= cols["ts"] <= end
+            if cameras is not None:
+                mask &= np.isin(cols["cam"], cam_ids)
+            if classes is not None:
+                mask &= np.isin(cols["cls"], classes)
+            if min_score is not None:
+                mask &= cols["score"] >= min_score
+            if mask.any():
+                yield {name: cols[name][mask] for name in columns}
+
+    def load(self, **filters):
+        """`scan()` results concatenated into one array per column."""
+        columns = list(filters.get("columns") or COLUMNS)
+        parts = list(self.scan(**filters))
+        if not parts:
+            return {name: np.empty(0, dtype=COLUMNS[name]) for name in columns}
+        return {name: np.concatenate([p[name] for p in parts]) for name in columns}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rezumat jurnal de detecții")
+    parser.add_argument("path", nargs="?", default="detections")
+    parser.add_argument("--days", type=float, default=7.0)
+    parser.add_argument("--camera", action="append", help="Filtru cameră (se poate repeta)")
+    parser.add_argument("--min-score", type=float)
+    args = parser.parse_args()
+
+    reader = DetectionLogReader(args.path)
+    t0 = time.perf_counter()
+    cols = reader.load(start=time.time() - args.days * 86400, cameras=args.camera, min_score=args.min_score,
+                       columns=["cam", "cls", "score"])
+    elapsed = time.perf_counter() - t0
+    n = len(cols["cam"])
+    print(f"{n} detecții în ultimele {args.days:g} zile ({elapsed * 1000:.0f} ms)")
+    if not n:
+        return
+    bins = np.linspace(0, 1, 11)
+    for cam in np.unique(cols["cam"]):
+        sel = cols["cam"] == cam
+        print(f"\n{reader.camera_names.get(int(cam), cam)}: {int(sel.sum())} detecții")
+        for cls in np.unique(cols["cls"][sel]):
+            scores = cols["score"][sel & (cols["cls"] == cls)]
+            hist, _ = np.histogram(scores, bins=bins)
+            print(f"  {reader.class_names.get(int(cls), int(cls)):<14}{len(scores):>9}  scor median {np.median(scores):.2f}"
+                  f"  histogramă {' '.join(str(int(h)) for h in hist)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+"""
+event_journal.py - Durable append-only event journal with replay to sinks
+Alarm starts/ends, relay transitions and incidents are appended to preallocated,
+memory-mapped segment files first; the DB and email are fed from the journal by
+independent sinks, each with its own persisted cursor (at-least-once delivery).
+
+Record layout: 4-byte length, 4-byte CRC32, JSON payload. A zero length marks the
+end of the written part of a segment; a bad CRC marks a record torn by a power cut.
+Appends are a memcpy into the mapping; a background thread msyncs dirty pages
+every `flush_interval` seconds (group commit), so at most that window is lost.
+"""
+
+import os
+import json
+import mmap
+import time
+import zlib
+import struct
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+_RECORD = struct.Struct("<II")
+_SEGMENT_NAME = "journal-{:08d}.log"
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _decode_at(mm, offset, end):
+    """(payload, next_offset) of the record at `offset`, or None at the end / a torn record."""
+    if offset + _RECORD.size > end:
+        return None
+    length, crc = _RECORD.unpack_from(mm, offset)
+    stop = offset + _RECORD.size + length
+    if length == 0 or stop > end:
+        return None
+    payload = mm[offset + _RECORD.size:stop]
+    if zlib.crc32(payload) != crc:
+        return None
+    return payload, stop
+
+
+class EventJournal:
+    def __init__(self, path="journal", segment_mb=4, flush_interval_ms=200):
+        self.path = path
+        self.segment_size = int(segment_mb * 1024 * 1024)
+        self.flush_interval = flush_interval_ms / 1000.0
+        os.makedirs(path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._appended = threading.Condition(self._lock)
+        self._fd = None
+        self._mm = None
+        self._segment = 0
+        self._offset = 0
+        self._flushed = 0
+        self.seq = 0
+        self._sinks = []
+        self._running = True
+        self._recover()
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True, name="journal-flush")
+        self._flusher.start()
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(cfg["path"], cfg["segment_mb"], cfg["flush_interval_ms"])
+
+    # ── Segments ─────────────────────────────────────────────────────────────
+    def segment_path(self, segment):
+        return os.path.join(self.path, _SEGMENT_NAME.format(segment))
+
+    def segments(self):
+        ids = []
+        for name in os.listdir(self.path):
+            if name.startswith("journal-") and name.endswith(".log"):
+                try:
+                    ids.append(int(name[8:-4]))
+                except ValueError:
+                    pass
+        return sorted(ids)
+
+    def _open_segment(self, segment, create):
+        path = self.segment_path(segment)
+        fd = os.open(path, os.O_RDWR | (os.O_CREAT if create else 0), 0o644)
+        if create:
+            # Preallocated so appends never extend the file (no metadata updates on the hot path)
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, self.segment_size)
+            else:
+                os.ftruncate(fd, self.segment_size)
+            os.fsync(fd)
+            _fsync_dir(self.path)
+        size = os.fstat(fd).st_size
+        self._fd = fd
+        self._mm = mmap.mmap(fd, size)
+        self._segment = segment
+
+    def _recover(self):
+        """Reopen the newest segment and find the end of its last intact record."""
+        existing = self.segments()
+        if not existing:
+            self._open_segment(1, create=True)
+            return
+        self._open_segment(existing[-1], create=False)
+        offset, last = 0, None
+        while True:
+            rec = _decode_at(self._mm, offset, len(self._mm))
+            if rec is None:
+                break
+            last, offset = rec
+        if offset + _RECORD.size <= len(self._mm) and _RECORD.unpack_from(self._mm, offset)[0]:
+            logger.warning(f"Jurnal: înregistrare incompletă la {self._segment}:{offset} ignorată (pană de curent?).")
+            self._mm[offset:offset + _RECORD.size] = b"\0" * _RECORD.size
+        self._offset = self._flushed = offset
+        if last is not None:
+            self.seq = json.loads(last)["seq"]
+        logger.info(f"📒 Jurnal evenimente: segment {self._segment}, poziție {offset}, seq {self.seq}.")
+
+    def _roll(self):
+        with self._flush_lock:
+            self._mm.flush()
+            self._mm.close()
+            os.close(self._fd)
+        self._open_segment(self._segment + 1, create=True)
+        self._offset = self._flushed = 0
+        self._drop_consumed_segments()
+
+    def _drop_consumed_segments(self):
+        if not self._sinks:
+            return
+        oldest_needed = min(sink.cursor[0] for sink in self._sinks)
+        for segment in self.segments():
+            if segment >= min(oldest_needed, self._segment):
+                break
+            try:
+                os.remove(self.segment_path(segment))
+            except OSError:
+                pass
+
+    # ── Writing ──────────────────────────────────────────────────────────────
+    def append(self, event_type, **fields):
+        """Append one event; returns its sequence number. Safe from any thread."""
+        with self._lock:
+            self.seq += 1
+            fields.update(seq=self.seq, type=event_type, ts=fields.get("ts") or time.time())
+            payload = json.dumps(fields, separators=(",", ":")).encode()
+            size = _RECORD.size + len(payload)
+            if size + _RECORD.size > self.segment_size:
+                raise ValueError(f"eveniment prea mare pentru jurnal ({size} octeți)")
+            # Keep room for the zero end marker after the record
+            if self._offset + size + _RECORD.size > len(self._mm):
+                self._roll()
+            start = self._offset
+            self._mm[start + _RECORD.size:start + size] = payload
+            _RECORD.pack_into(self._mm, start, len(payload), zlib.crc32(payload))
+            self._offset = start + size
+            self._appended.notify_all()
+            return self.seq
+
+    def end(self):
+        """Cursor just past the last appended record."""
+        with self._lock:
+            return (self._segment, self._offset)
+
+    def flush(self):
+        with self._lock:
+            mm, start, end = self._mm, self._flushed, self._offset
+        if end <= start:
+            return
+        with self._flush_lock:
+            if mm.closed:
+                return  # Rolled meanwhile; the roll flushed it
+            page_start = start - start % mmap.PAGESIZE
+            mm.flush(page_start, end - page_start)
+        with self._lock:
+            if self._mm is mm:
+                self._flushed = max(self._flushed, end)
+
+    def _flush_loop(self):
+        while self._running:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except (OSError, ValueError) as e:
+                logger.error(f"Eroare sincronizare jurnal: {e}")
+
+    # ── Reading ──────────────────────────────────────────────────────────────
+    def wait_for_append(self, cursor, timeout):
+        with self._appended:
+            if (self._segment, self._offset) == tuple(cursor) and self._running:
+                self._appended.wait(timeout)
+
+    def add_sink(self, name, handler, retry_s=(1.0, 60.0)):
+        sink = JournalSink(self, name, handler, retry_s)
+        self._sinks.append(sink)
+        return sink.start()
+
+    def get_stats(self):
+        end = self.end()
+        return {"seq": self.seq, "segment": end[0], "offset": end[1],
+                "sinks": {s.name: s.get_stats() for s in self._sinks}}
+
+    def close(self):
+        self._running = False
+        with self._appended:
+            self._appended.notify_all()
+        for sink in self._sinks:
+            sink.stop()
+        self.flush()
+        with self._lock, self._flush_lock:
+            self._mm.close()
+            os.close(self._fd)
+
+
+class _SegmentReader:
+    """Read-only mapping of one segment at a time; shares the page cache with the writer."""
+    def __init__(self, journal):
+        self.journal = journal
+        self._segment = None
+        self._mm = None
+
+    def _map(self, segment):
+        if self._segment != segment:
+            self.close()
+            try:
+                with open(self.journal.segment_path(segment), "rb") as f:
+                    self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return None
+            self._segment = segment
+        return self._mm
+
+    def read(self, cursor, limit):
+        """Up to `limit` (next_cursor, event) pairs after `cursor`."""
+        segment, offset = cursor
+        end_segment, end_offset = self.journal.end()
+        out = []
+        while len(out) < limit and (segment, offset) < (end_segment, end_offset):
+            mm = self._map(segment)
+            rec = None
+            if mm is not None:
+                rec = _decode_at(mm, offset, end_offset if segment == end_segment else len(mm))
+            if rec is None:
+                if segment >= end_segment:
+                    break
+                segment, offset = segment + 1, 0  # End of a finished segment
+                continue
+            payload, offset = rec
+            out.append(((segment, offset), json.loads(payload)))
+        return out
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = None
+        self._segment = None
+
+
+class JournalSink:
+    """
+    Replays the journal into `handler(event) -> bool` from a persisted cursor.
+    A False/raising handler is retried with backoff; the cursor only moves past
+    delivered events, so an outage or restart replays everything not yet delivered.
+    """
+    def __init__(self, journal, name, handler, retry_s=(1.0, 60.0), batch=64):
+        self.journal = journal
+        self.name = name
+        self.handler = handler
+        self.min_retry, self.max_retry = retry_s
+        self.batch = batch
+        self._cursor_path = os.path.join(journal.path, f"cursor-{name}.json")
+        self.cursor = self._load_cursor()
+        self._reader = _SegmentReader(journal)
+        self._stop = threading.Event()
+        self._thread = None
+        self.delivered = 0
+        self.failures = 0
+        self.last_error = None
+
+    def _load_cursor(self):
+        try:
+            with open(self._cursor_path) as f:
+                data = json.load(f)
+            return (data["segment"], data["offset"])
+        except (OSError, ValueError, KeyError):
+            # New sink: start at the oldest segment still on disk
+            segments = self.journal.segments()
+            return (segments[0] if segments else 1, 0)
+
+    def _save_cursor(self):
+        tmp = self._cursor_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"segment": self.cursor[0], "offset": self.cursor[1]}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._cursor_path)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"journal-{self.name}")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self._reader.close()
+
+    def _run(self):
+        backoff = self.min_retry
+        while not self._stop.is_set():
+            events = self._reader.read(self.cursor, self.batch)
+            if not events:
+                self.journal.wait_for_append(self.cursor, timeout=1.0)
+                continue
+
+            ok = True
+            start = self.cursor
+            for cursor, event in events:
+                try:
+                    ok = bool(self.handler(event))
+                except Exception as e:
+                    ok = False
+                    self.last_error = str(e)
+                if not ok:
+                    break
+                self.cursor = cursor
+                self.delivered += 1
+            if self.cursor != start:
+                self._save_cursor()
+
+            if ok:
+                if self.failures and backoff > self.min_retry:
+                    logger.info(f"📒 Sink {self.name}: livrare reluată.")
+                backoff = self.min_retry
+            else:
+                self.failures += 1
+                if backoff == self.min_retry:
+                    logger.warning(f"📒 Sink {self.name}: livrare eșuată, reîncerc cu backoff "
+                                   f"(evenimentul rămâne în jurnal).")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.max_retry)
+
+    def get_stats(self):
+        return {"cursor": list(self.cursor), "delivered": self.delivered,
+                "failures": self.failures, "last_error": self.last_error}
@@ -0,0 +1,211 @@
+"""
+evidence_store.py - Snapshot encoding pipeline and on-disk evidence store
+Snapshots are cropped/downscaled to the detection region and encoded in a
+worker pool, so the monitoring loop never pays for JPEG/WebP encoding.
+"""
+
+import os
+import re
+import time
+import shutil
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from thread_budget import pin_current_thread
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    "jpg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+class EvidenceStore:
+    """
+    Date-partitioned directory of snapshots (root/YYYY-MM-DD/<bay>_<time>.<ext>)
+    with size- and age-based retention.
+    """
+    def __init__(self, root="evidence", max_size_mb=2048, max_age_days=30):
+        self.root = root
+        self.max_bytes = int(max_size_mb * 1024 * 1024)
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def new_path(self, bay_name, ext, when=None):
+        """Reserve a unique path for a snapshot. Nothing is written yet."""
+        when = when or datetime.now()
+        day_dir = os.path.join(self.root, when.strftime("%Y-%m-%d"))
+        os.makedirs(day_dir, exist_ok=True)
+        safe_bay = re.sub(r"[^\w-]+", "_", bay_name).strip("_") or "boxa"
+        stem = f"{safe_bay}_{when.strftime('%H%M%S_%f')[:-3]}"
+        path = os.path.join(day_dir, stem + ext)
+        n = 1
+        while os.path.exists(path):
+            path = os.path.join(day_dir, f"{stem}_{n}{ext}")
+            n += 1
+        return path
+
+    def write(self, path, data):
+        """Write atomically so readers (email, dashboard) never see partial files."""
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _day_dirs(self):
+        try:
+            names = sorted(d for d in os.listdir(self.root)
+                           if os.path.isdir(os.path.join(self.root, d)))
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.root, d) for d in names]
+
+    def enforce_retention(self):
+        """Drop whole days older than max_age_days, then oldest files until under max size."""
+        with self._lock:
+            removed = 0
+            cutoff = datetime.now().timestamp() - self.max_age_days * 86400
+            files = []
+            for day_dir in self._day_dirs():
+                try:
+                    day_ts = datetime.strptime(os.path.basename(day_dir), "%Y-%m-%d").timestamp()
+                except ValueError:
+                    continue  # Not one of ours
+                if self.max_age_days and day_ts + 86400 < cutoff:
+                    removed += len(os.listdir(day_dir))
+                    shutil.rmtree(day_dir, ignore_errors=True)
+                    continue
+                for name in os.listdir(day_dir):
+                    p = os.path.join(day_dir, name)
+                    try:
+                        st = os.stat(p)
+                    except FileNotFoundError:
+                        continue
+                    files.append((st.st_mtime, st.st_size, p))
+
+            total = sum(size for _, size, _ in files)
+            if self.max_bytes and total > self.max_bytes:
+                files.sort()
+                for _, size, p in files:
+                    if total <= self.max_bytes:
+                        break
+                    try:
+                        os.remove(p)
+                        total -= size
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+
+            for day_dir in self._day_dirs():
+                if not os.listdir(day_dir):
+                    os.rmdir(day_dir)
+
+            if removed:
+                logger.info(f"🧹 Retenție dovezi: {removed} fișiere șterse.")
+            return removed
+
+
+class SnapshotPipeline:
+    """
+    Crops/downscales frames to the detection region and encodes them on a worker pool.
+    `submit` returns immediately with the final file path and a Future that completes
+    once the file is on disk.
+    """
+    def __init__(self, store, fmt="jpg", quality=80, max_width=1280, crop_margin=0.25,
+                 workers=2, retention_interval=300):
+        self.store = store
+        self.fmt = fmt if fmt in FORMATS else "jpg"
+        self.quality = int(quality)
+        self.max_width = int(max_width)
+        self.crop_margin = float(crop_margin)
+        self.retention_interval = retention_interval
+        self._last_retention = 0.0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot",
+                                            initializer=pin_current_thread, initargs=("io",))
+
+    @classmethod
+    def from_config(cls, cfg):
+        store = EvidenceStore(cfg["path"], cfg["max_size_mb"], cfg["max_age_days"])
+        return cls(store, cfg["format"], cfg["quality"], cfg["max_width"],
+                   cfg["crop_margin"], cfg["workers"])
+
+    def submit(self, bay_name, frame, box=None, when=None, on_stored=None):
+        """
+        Queue a snapshot. `frame` must not be mutated by the caller afterwards
+        (camera streams replace frames, they never write into them).
+        `on_stored(path)` runs on the worker thread once the file is on disk.
+        Returns (path, future).
+        """
+        ext, _ = FORMATS[self.fmt]
+        path = self.store.new_path(bay_name, ext, when)
+        future = self._executor.submit(self._encode_and_store, path, frame, box, on_stored)
+        return path, future
+
+    def _crop(self, frame, box):
+        if box is None:
+            return frame
+        h, w = frame.shape[:2]
+        x1, y1, x2, y2 = box
+        mx = (x2 - x1) * self.crop_margin
+        my = (y2 - y1) * self.crop_margin
+        x1 = max(0, int(x1 - mx)); y1 = max(0, int(y1 - my))
+        x2 = min(w, int(x2 + mx)); y2 = min(h, int(y2 + my))
+        if x2 - x1 < 16 or y2 - y1 < 16:
+            return frame
+        return frame[y1:y2, x1:x2]
+
+    def submit_encoded(self, bay_name, data, ext, when=None, on_stored=None):
+        """Store an image that was already encoded elsewhere (e.g. by a cluster worker)."""
+        path = self.store.new_path(bay_name, ext, when)
+        future = self._executor.submit(self._store, path, data, on_stored)
+        return path, future
+
+    def encode_async(self, frame, box, on_encoded):
+        """Crop and encode only; `on_encoded(data, ext)` runs on the worker thread."""
+        def job():
+            ext, data = self.encode(frame, box)
+            on_encoded(data, ext)
+        return self._executor.submit(job)
+
+    def encode(self, frame, box=None):
+        """Crop/downscale and encode a frame. Returns (ext, bytes)."""
+        img = self._crop(frame, box)
+        h, w = img.shape[:2]
+        if self.max_width and w > self.max_width:
+            scale = self.max_width / w
+            img = cv2.resize(img, (self.max_width, int(h * scale)), interpolation=cv2.INTER_AREA)
+
+        ext, quality_flag = FORMATS[self.fmt]
+        ok, buffer = cv2.imencode(ext, img, [quality_flag, self.quality])
+        if not ok:
+            raise RuntimeError(f"Codare {self.fmt} eșuată")
+        return ext, buffer.tobytes()
+
+    def _encode_and_store(self, path, frame, box, on_stored=None):
+        _, data = self.encode(frame, box)
+        return self._store(path, data, on_stored)
+
+    def _store(self, path, data, on_stored=None):
+        self.store.write(path, data)
+        logger.info(f"📸 Captură salvată: {path} ({len(data) // 1024} KB)")
+
+        now = time.time()
+        if now - self._last_retention > self.retention_interval:
+            self._last_retention = now
+            self.store.enforce_retention()
+
+        if on_stored:
+            try:
+                on_stored(path)
+            except Exception as e:
+                logger.error(f"Eroare la procesarea capturii {path}: {e}")
+        return path
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
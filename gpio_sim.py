@@ -0,0 +1,105 @@
+"""
+gpio_sim.py - Simulated gpiod (v2 API subset) backend
+Used by RelayController in mock mode and for exercising relay logic without a Pi.
+Records every line request write so callers can inspect ioctl counts and values.
+"""
+
+import time
+import threading
+from enum import Enum
+from types import SimpleNamespace
+from collections import namedtuple
+
+
+class Value(Enum):
+    INACTIVE = 0
+    ACTIVE = 1
+
+
+class Direction(Enum):
+    AS_IS = 1
+    INPUT = 2
+    OUTPUT = 3
+
+
+# Mirrors the `gpiod.line` namespace
+line = SimpleNamespace(Value=Value, Direction=Direction)
+
+ChipInfo = namedtuple("ChipInfo", ["name", "label", "num_lines"])
+
+
+class LineSettings:
+    def __init__(self, direction=Direction.AS_IS, output_value=Value.INACTIVE):
+        self.direction = direction
+        self.output_value = output_value
+
+
+class LineRequest:
+    """
+    Simulated line request. Every `set_value`/`set_values` call counts as one
+    ioctl and is appended to `writes` as (monotonic time, {offset: Value}).
+    """
+    def __init__(self, chip, consumer, config):
+        self.chip = chip
+        self.consumer = consumer
+        self.values = {}
+        for offsets, settings in config.items():
+            for offset in (offsets if isinstance(offsets, tuple) else (offsets,)):
+                self.values[offset] = settings.output_value
+        self.writes = []
+        self.released = False
+        self._lock = threading.Lock()
+
+    @property
+    def ioctl_count(self):
+        return len(self.writes)
+
+    def _write(self, values):
+        if self.released:
+            raise RuntimeError("line request released")
+        for offset in values:
+            if offset not in self.values:
+                raise ValueError(f"offset {offset} not requested")
+        if self.chip.write_latency:
+            time.sleep(self.chip.write_latency)
+        with self._lock:
+            self.values.update(values)
+            self.writes.append((time.monotonic(), dict(values)))
+
+    def set_value(self, offset, value):
+        self._write({offset: value})
+
+    def set_values(self, values):
+        self._write(dict(values))
+
+    def get_value(self, offset):
+        return self.values[offset]
+
+    def get_values(self, offsets=None):
+        offsets = offsets if offsets is not None else list(self.values)
+        return [self.values[o] for o in offsets]
+
+    def release(self):
+        self.released = True
+
+
+class Chip:
+    """Simulated GPIO chip. `write_latency` (seconds) emulates the ioctl cost."""
+    def __init__(self, path="/dev/gpiochip-sim", label="rp1-sim", num_lines=54, write_latency=0.0):
+        self.path = path
+        self.label = label
+        self.num_lines = num_lines
+        self.write_latency = write_latency
+        self.requests = []
+        self.closed = False
+
+    def get_info(self):
+        return ChipInfo(self.path.rsplit("/", 1)[-1], self.label, self.num_lines)
+
+    def request_lines(self, consumer=None, config=None):
+        request = LineRequest(self, consumer, config or {})
+        self.requests.append(request)
+        return request
+
+    def close(self):
+        self.closed = True
@@ -1,147 +1,323 @@
 """
-dashboard.py - Main Dashboard for AI Wash Guard with Quad-View
+dashboard.py - Main Dashboard for AI Wash Guard with a paged camera grid
+Only the tiles of the current page receive live frames; the other bays are
+shown as low-rate thumbnails.
 """
 
 import customtkinter as ctk
 import cv2
 from PIL import Image
+import math
+import os
 import threading
 import time
 import logging
 from gui.settings_app import SettingsApp
+from gui.incident_browser import IncidentBrowser
 from config_manager import ConfigManager
 
 logger = logging.getLogger(__name__)
 
+THUMB_WIDTH = 160
+
 class CameraWidget(ctk.CTkFrame):
-    """Component to display a single camera feed."""
+    """Component to display a single camera feed. Tiles are reused across pages."""
     def __init__(self, parent, camera_name, placeholder_v=0):
         super().__init__(parent)
         self.camera_name = camera_name
-        
+        self._last_frame_id = None
+
         self.label_name = ctk.CTkLabel(self, text=camera_name, font=("Arial", 14, "bold"))
         self.label_name.pack(pady=2)
-        
+
         self.video_label = ctk.CTkLabel(self, text="Conectare flux...", bg_color="black")
         self.video_label.pack(expand=True, fill="both", padx=5, pady=5)
-        
+
         self.status_label = ctk.CTkLabel(self, text="Status: IDLE", text_color="gray")
         self.status_label.pack(pady=2)
 
-    def update_frame(self, frame, is_alert=False):
-        """Update the label with a new OpenCV frame."""
-        if frame is not None:
+        self.snapshot_label = ctk.CTkLabel(self, text="", text_color="gray", font=("Arial", 11))
+        self.snapshot_label.pack(pady=(0, 2))
+        self._snapshot_path = None
+
+    def bind_camera(self, camera_name):
+        """Point this tile at another camera (page change)."""
+        self.camera_name = camera_name
+        self._last_frame_id = None
+        self._snapshot_path = None
+        self.label_name.configure(text=camera_name or "")
+        self.video_label.configure(image=None, text="Conectare flux..." if camera_name else "")
+        self.snapshot_label.configure(text="")
+        self.status_label.configure(text="" if not camera_name else "Status: IDLE", text_color="gray")
+        self.configure(border_width=0)
+
+    def set_snapshot(self, path):
+        """Show the last evidence file stored for this bay."""
+        if path == self._snapshot_path:
+            return
+        self._snapshot_path = path
+        text = f"📸 Ultima captură: {os.path.basename(path)}" if path else ""
+        self.snapshot_label.configure(text=text)
+
+    def update_frame(self, frame, is_alert=False, frame_id=None, target_w=400, degraded=None):
+        """
+        Update the label with a new OpenCV frame (skipped if the frame did not change).
+        `degraded` is the reason the bay's pipeline is not running normally, if any.
+        """
+        if frame is not None and (frame_id is None or frame_id != self._last_frame_id):
+            self._last_frame_id = frame_id
             try:
                 # Resize frame to fit widget (approx)
                 h, w = frame.shape[:2]
                 aspect = w / h
-                target_w = 400
                 target_h = int(target_w / aspect)
-                
-                frame_resized = cv2.resize(frame, (target_w, target_h))
+
+                frame_resized = cv2.resize(frame, (target_w, target_h), interpolation=cv2.INTER_AREA)
                 frame_rgb = cv2.cvtColor(frame_resized, cv2.COLOR_BGR2RGB)
                 img = Image.fromarray(frame_rgb)
                 img_tk = ctk.CTkImage(light_image=img, dark_image=img, size=(target_w, target_h))
-                
+
                 self.video_label.configure(image=img_tk, text="")
             except Exception as e:
                 if not hasattr(self, '_import_error_shown'):
                     logger.error(f"Eroare update frame {self.camera_name}: {e}. Asigurați-vă că 'python3-pil.imagetk' este instalat pe Raspberry Pi.")
                     self._import_error_shown = True
-            
+
         if is_alert:
             self.status_label.configure(text="STATUS: !!! ALARMĂ !!!", text_color="red")
             self.configure(border_width=2, border_color="red")
+        elif degraded:
+            # Video may still be live while detection for this bay is down
+            self.status_label.configure(text=f"STATUS: DEGRADAT ({degraded})", text_color="orange")
+            self.configure(border_width=2, border_color="orange")
         else:
             self.status_label.configure(text="STATUS: OK", text_color="green")
             self.configure(border_width=0)
 
+class ThumbnailWidget(ctk.CTkFrame):
+    """Small, low-rate preview of a bay that is not on the current page."""
+    def __init__(self, parent, camera_name, on_click):
+        super().__init__(parent, border_width=0)
+        self.camera_name = camera_name
+        self.image_label = ctk.CTkLabel(self, text="…", width=THUMB_WIDTH, height=90, bg_color="black")
+        self.image_label.pack(padx=2, pady=2)
+        self.name_label = ctk.CTkLabel(self, text=camera_name, font=("Arial", 11))
+        self.name_label.pack()
+        self._alert = None
+        for w in (self, self.image_label, self.name_label):
+            w.bind("<Button-1>", lambda _e: on_click(camera_name))
+
+    def update_frame(self, frame):
+        if frame is None:
+            return
+        h, w = frame.shape[:2]
+        th = int(THUMB_WIDTH * h / w)
+        small = cv2.resize(frame, (THUMB_WIDTH, th), interpolation=cv2.INTER_AREA)
+        img = Image.fromarray(cv2.cvtColor(small, cv2.COLOR_BGR2RGB))
+        self.image_label.configure(image=ctk.CTkImage(light_image=img, dark_image=img, size=(THUMB_WIDTH, th)), text="")
+
+    def set_alert(self, is_alert, degraded=False):
+        """Alarms on other pages are shown immediately, independent of the thumbnail rate."""
+        state = "alert" if is_alert else "degraded" if degraded else None
+        if state != self._alert:
+            self._alert = state
+            self.configure(border_width=2 if state else 0,
+                           border_color="red" if state == "alert" else "orange")
+
 class DashboardApp(ctk.CTk):
     def __init__(self, monitoring_engine):
         super().__init__()
         self.engine = monitoring_engine
-        self.config_mgr = ConfigManager()
-        
+        # Share the engine's config store instead of re-reading config.json
+        self.config_mgr = monitoring_engine.config_mgr if monitoring_engine else ConfigManager()
+        self._config_dirty = False
+        self.config_mgr.subscribe(self._on_config_changed)
+
         logger.info("🎨 Construire interfață Dashboard...")
         self.title("🛡️ AI Wash Guard - Dashboard")
         self.geometry("1100x850")
-        
+
         # UI Setup
         self._build_top_menu()
         logger.info("✅ Meniu superior terminat.")
         self._build_grid()
-        logger.info(f"✅ Grid camere finalizat ({len(self.cam_widgets)} boxe).")
-        
+        logger.info(f"✅ Grid camere finalizat ({len(self.camera_names)} boxe, {len(self.cam_widgets)} pe pagină).")
+
         # Start update loop
         self.update_interval = 30 # ms
+        self._last_thumb_update = 0.0
         self.after(self.update_interval, self._update_loop)
         logger.info("🚀 Buclă update video activă.")
 
     def _build_top_menu(self):
         self.top_frame = ctk.CTkFrame(self, height=50)
         self.top_frame.pack(side="top", fill="x", padx=10, pady=5)
-        
+
         self.title_label = ctk.CTkLabel(self.top_frame, text="🚐 AI WASH GUARD MONITORING", font=("Arial", 18, "bold"))
         self.title_label.pack(side="left", padx=20)
-        
+
         self.settings_btn = ctk.CTkButton(self.top_frame, text="⚙️ Setări", width=100, command=self._open_settings)
         self.settings_btn.pack(side="right", padx=20)
+        self.incidents_btn = ctk.CTkButton(self.top_frame, text="📜 Incidente", width=100, command=self._open_incidents)
+        self.incidents_btn.pack(side="right", padx=4)
+
+        # Thermal governor level (empty while the governor is off)
+        self.thermal_label = ctk.CTkLabel(self.top_frame, text="")
+        self.thermal_label.pack(side="right", padx=10)
+        self._thermal_text = ""
+
+        self.next_btn = ctk.CTkButton(self.top_frame, text="▶", width=40, command=lambda: self._show_page(self.page + 1))
+        self.next_btn.pack(side="right", padx=2)
+        self.page_label = ctk.CTkLabel(self.top_frame, text="")
+        self.page_label.pack(side="right", padx=8)
+        self.prev_btn = ctk.CTkButton(self.top_frame, text="◀", width=40, command=lambda: self._show_page(self.page - 1))
+        self.prev_btn.pack(side="right", padx=2)
 
     def _build_grid(self):
+        ui_cfg = self.config_mgr.get_ui_settings()
+        self.tiles_per_page = max(1, int(ui_cfg["tiles_per_page"]))
+        self.thumb_interval = ui_cfg["thumbnail_interval_ms"] / 1000.0
+        self.camera_names = [c["name"] for c in self.config_mgr.get_cameras()]
+        self.page = 0
+
+        self.thumb_frame = ctk.CTkScrollableFrame(self, orientation="horizontal", height=130)
+        self.thumb_frame.pack(side="bottom", fill="x", padx=10, pady=(0, 10))
+        self.thumb_widgets = {}
+
         self.grid_frame = ctk.CTkFrame(self)
         self.grid_frame.pack(expand=True, fill="both", padx=10, pady=10)
-        
-        # Grid layout 2x2
-        self.grid_frame.grid_columnconfigure((0, 1), weight=1)
-        self.grid_frame.grid_rowconfigure((0, 1), weight=1)
-        
+
+        # Grid layout sized for one page (2x2 for 4 tiles, 3x3 for 9...)
+        self.cols = math.ceil(math.sqrt(self.tiles_per_page))
+        self.rows = math.ceil(self.tiles_per_page / self.cols)
+        self.grid_frame.grid_columnconfigure(tuple(range(self.cols)), weight=1)
+        self.grid_frame.grid_rowconfigure(tuple(range(self.rows)), weight=1)
+
+        # A fixed pool of tiles, re-bound to cameras on page change
+        self.tiles = []
+        for i in range(min(self.tiles_per_page, max(1, len(self.camera_names)))):
+            widget = CameraWidget(self.grid_frame, "")
+            widget.grid(row=i // self.cols, column=i % self.cols, padx=10, pady=10, sticky="nsew")
+            self.tiles.append(widget)
+        self._show_page(0)
+
+    @property
+    def page_count(self):
+        return max(1, math.ceil(len(self.camera_names) / self.tiles_per_page))
+
+    def _show_page(self, page):
+        self.page = page % self.page_count
+        start = self.page * self.tiles_per_page
+        visible = self.camera_names[start:start + self.tiles_per_page]
         self.cam_widgets = {}
-        cam_configs = self.config_mgr.get_cameras()
-        
-        for i in range(4):
-            cfg = cam_configs[i] if i < len(cam_configs) else {"name": f"Boxa {i+1}"}
-            name = cfg["name"]
-            
-            row = i // 2
-            col = i % 2
-            
-            widget = CameraWidget(self.grid_frame, name)
-            widget.grid(row=row, column=col, padx=10, pady=10, sticky="nsew")
-            self.cam_widgets[name] = widget
+        for i, tile in enumerate(self.tiles):
+            name = visible[i] if i < len(visible) else None
+            tile.bind_camera(name)
+            if name:
+                self.cam_widgets[name] = tile
+        self.page_label.configure(text=f"Pagina {self.page + 1}/{self.page_count}")
+        state = "normal" if self.page_count > 1 else "disabled"
+        self.prev_btn.configure(state=state)
+        self.next_btn.configure(state=state)
+        self._rebuild_thumbnails()
+
+    def _rebuild_thumbnails(self):
+        for widget in self.thumb_widgets.values():
+            widget.destroy()
+        self.thumb_widgets = {}
+        for name in self.camera_names:
+            if name in self.cam_widgets:
+                continue
+            widget = ThumbnailWidget(self.thumb_frame, name, self._jump_to_camera)
+            widget.pack(side="left", padx=4, pady=4)
+            self.thumb_widgets[name] = widget
+        self._last_thumb_update = 0.0
+
+    def _jump_to_camera(self, name):
+        if name in self.camera_names:
+            self._show_page(self.camera_names.index(name) // self.tiles_per_page)
+
+    def _on_config_changed(self, diff):
+        # May run on the config watcher thread; Tk work is deferred to the update loop
+        if "cameras" in diff or "ui" in diff:
+            self._config_dirty = True
 
     def refresh_widgets(self):
-        """Re-read config and update camera names/widgets."""
+        """Rebuild pages and tiles from the shared config (camera count may have changed)."""
         logger.info("♻️ Reîmprospătare widget-uri Dashboard...")
-        self.config_mgr.load()
-        cam_configs = self.config_mgr.get_cameras()
-        
-        for i, (old_name, widget) in enumerate(list(self.cam_widgets.items())):
-            cfg = cam_configs[i] if i < len(cam_configs) else {"name": f"Boxa {i+1}"}
-            new_name = cfg["name"]
-            
-            widget.label_name.configure(text=new_name)
-            widget.camera_name = new_name
-            if new_name != old_name:
-                self.cam_widgets[new_name] = self.cam_widgets.pop(old_name)
+        ui_cfg = self.config_mgr.get_ui_settings()
+        new_names = [c["name"] for c in self.config_mgr.get_cameras()]
+        if max(1, int(ui_cfg["tiles_per_page"])) != self.tiles_per_page:
+            for w in self.tiles + list(self.thumb_widgets.values()):
+                w.destroy()
+            self.grid_frame.destroy()
+            self.thumb_frame.destroy()
+            self._build_grid()
+        else:
+            self.camera_names = new_names
+            self.thumb_interval = ui_cfg["thumbnail_interval_ms"] / 1000.0
+            wanted = min(self.tiles_per_page, max(1, len(new_names)))
+            while len(self.tiles) < wanted:
+                i = len(self.tiles)
+                widget = CameraWidget(self.grid_frame, "")
+                widget.grid(row=i // self.cols, column=i % self.cols, padx=10, pady=10, sticky="nsew")
+                self.tiles.append(widget)
+            self._show_page(self.page)
         logger.info("✅ Widget-uri actualizate.")
 
+    def _is_alert(self, name):
+        return self.engine.detection_counters.get(name, 0) >= self.engine.DETECTION_THRESHOLD
+
     def _update_loop(self):
         """Periodically update camera feeds from the monitoring engine."""
         try:
-            frames = self.engine.cameras.get_latest_frames()
-            
+            if self._config_dirty:
+                self._config_dirty = False
+                self.refresh_widgets()
+
+            supervisor = getattr(self.engine, "supervisor", None)
+            degraded = supervisor.degraded_bays() if supervisor else {}
+            self._update_thermal(getattr(self.engine, "governor", None))
+
+            # Full-rate frames only for the tiles on screen
+            tile_w = max(160, self.grid_frame.winfo_width() // self.cols - 40)
             for name, widget in self.cam_widgets.items():
-                frame = frames.get(name)
-                is_alert = self.engine.detection_counters.get(name, 0) >= self.engine.DETECTION_THRESHOLD
-                widget.update_frame(frame, is_alert)
+                frame_id, frame = self.engine.cameras.read_frame(name)
+                widget.update_frame(frame, self._is_alert(name), frame_id=frame_id, target_w=tile_w,
+                                    degraded=degraded.get(name))
+                widget.set_snapshot(self.engine.last_snapshots.get(name))
+
+            now = time.monotonic()
+            refresh_thumbs = now - self._last_thumb_update >= self.thumb_interval
+            if refresh_thumbs:
+                self._last_thumb_update = now
+            for name, widget in self.thumb_widgets.items():
+                widget.set_alert(self._is_alert(name), name in degraded)
+                if refresh_thumbs:
+                    widget.update_frame(self.engine.cameras.read_frame(name)[1])
         except Exception as e:
             logger.error(f"Eroare în bucla de update UI: {e}")
-            
+
         self.after(self.update_interval, self._update_loop)
 
+    def _update_thermal(self, governor):
+        if governor is None:
+            text, color = "", None
+        else:
+            status = governor.get_status()
+            temp = f"{status['temp_c']:.0f}°C" if status.get("temp_c") is not None else "-"
+            text = f"🌡️ {temp}  nivel {status['level']}/{status['max_level']}"
+            color = "orange" if status["level"] else None
+        if text != self._thermal_text:  # Tk label updates only when something changed
+            self._thermal_text = text
+            self.thermal_label.configure(text=text, text_color=color or ("gray10", "gray90"))
+
     def _open_settings(self):
         SettingsApp(self)
 
+    def _open_incidents(self):
+        IncidentBrowser(self, self.config_mgr)
+
 if __name__ == "__main__":
     app = DashboardApp(None)
     app.mainloop()
@@ -0,0 +1,280 @@
+"""
+incident_browser.py - Incident history panel for the Dashboard
+Pages of Wash_Incidents (with the matching Wash_Sessions duration) are fetched
+with keyset pagination on a background thread, so a page costs the same no
+matter how far back it is. Thumbnails are decoded at reduced size on a loader
+thread and kept in a byte-bounded LRU cache; a fixed pool of row widgets is
+re-bound on every page, like the camera tiles.
+"""
+
+import os
+import sys
+import queue
+import logging
+import threading
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import customtkinter as ctk
+from PIL import Image
+
+from database import DatabaseManager
+
+logger = logging.getLogger(__name__)
+
+THUMB_SIZE = (120, 68)
+CLIP_EXTENSIONS = (".mp4", ".mkv", ".avi")
+
+
+class ThumbnailCache:
+    """LRU of downscaled PIL images bounded by their decoded size in bytes."""
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    @staticmethod
+    def _size(img):
+        return img.width * img.height * len(img.getbands())
+
+    def get(self, path):
+        with self._lock:
+            img = self._items.get(path)
+            if img is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(path)
+            self.hits += 1
+            return img
+
+    def put(self, path, img):
+        with self._lock:
+            old = self._items.pop(path, None)
+            if old is not None:
+                self.bytes -= self._size(old)
+            self._items[path] = img
+            self.bytes += self._size(img)
+            while self.bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self.bytes -= self._size(evicted)
+
+    @staticmethod
+    def load(path):
+        """Decode `path` straight to thumbnail size (JPEG draft mode skips most of the IDCT work)."""
+        with Image.open(path) as img:
+            img.draft("RGB", (THUMB_SIZE[0] * 2, THUMB_SIZE[1] * 2))
+            img = img.convert("RGB")
+            img.thumbnail(THUMB_SIZE, Image.BILINEAR)
+            return img
+
+
+def find_clip(image_path):
+    """Video stored next to the snapshot with the same name, if any."""
+    if not image_path:
+        return None
+    stem = os.path.splitext(image_path)[0]
+    return next((stem + ext for ext in CLIP_EXTENSIONS if os.path.exists(stem + ext)), None)
+
+
+def open_external(path):
+    opener = "open" if sys.platform == "darwin" else "xdg-open"
+    try:
+        subprocess.Popen([opener, path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError as e:
+        logger.error(f"Nu se poate deschide {path}: {e}")
+
+
+class IncidentRow(ctk.CTkFrame):
+    """One list row; the pool of rows is re-bound to incidents on every page."""
+    def __init__(self, parent, on_open):
+        super().__init__(parent)
+        self.incident = None
+        self.thumb = ctk.CTkLabel(self, text="", width=THUMB_SIZE[0], height=THUMB_SIZE[1], bg_color="black")
+        self.thumb.pack(side="left", padx=4, pady=4)
+        self.text = ctk.CTkLabel(self, text="", justify="left", anchor="w")
+        self.text.pack(side="left", fill="x", expand=True, padx=8)
+        self.clip_btn = ctk.CTkButton(self, text="🎞️ Clip", width=70)
+        self.open_btn = ctk.CTkButton(self, text="🔍 Captură", width=90, command=lambda: on_open(self.incident))
+        self.open_btn.pack(side="right", padx=4)
+
+    def bind_incident(self, incident, image):
+        self.incident = incident
+        if incident is None:
+            self.pack_forget()
+            return
+        duration = incident.get("duration_seconds")
+        self.text.configure(text=f"{incident['timestamp']:%Y-%m-%d %H:%M:%S}   {incident['bay_name']}\n"
+                                 f"{incident['vehicle_type']}"
+                                 + (f"   ⏱ {duration // 60}m {duration % 60:02d}s" if duration is not None else ""))
+        self.set_image(image)
+        clip = find_clip(incident.get("image_path"))
+        if clip:
+            self.clip_btn.configure(command=lambda: open_external(clip))
+            self.clip_btn.pack(side="right", padx=4, before=self.open_btn)
+        else:
+            self.clip_btn.pack_forget()
+        self.open_btn.configure(state="normal" if incident.get("image_path") else "disabled")
+
+    def set_image(self, image):
+        if image is None:
+            self.thumb.configure(image=None, text="…" if self.incident and self.incident.get("image_path") else "—")
+        else:
+            self.thumb.configure(image=ctk.CTkImage(light_image=image, dark_image=image, size=image.size), text="")
+
+
+class IncidentBrowser(ctk.CTkToplevel):
+    def __init__(self, parent, config_mgr):
+        super().__init__(parent)
+        self.title("📜 Istoric Incidente")
+        self.geometry("760x720")
+        ui_cfg = config_mgr.get_ui_settings()
+        self.page_size = max(1, int(ui_cfg["incidents_per_page"]))
+        self.cache = ThumbnailCache(int(ui_cfg["thumb_cache_mb"] * 1024 * 1024))
+
+        # Own connection: the engine's is used by the journal's DB sink thread
+        db_cfg = config_mgr.get_mysql_settings()
+        self.db = DatabaseManager(db_cfg["host"], db_cfg["user"], db_cfg["password"], db_cfg["database"])
+        self._queries = ThreadPoolExecutor(max_workers=1, thread_name_prefix="incidents-db")
+        self._thumb_jobs = queue.LifoQueue()  # Newest requests (the page on screen) first
+        self._results = queue.Queue()  # (kind, payload) handed to the Tk thread
+        self._closed = False
+        threading.Thread(target=self._thumb_loop, daemon=True, name="incidents-thumbs").start()
+
+        self.rows = []  # Incidents on screen
+        self._history = []  # Cursor of every page before the current one
+        self._current_after = None
+        self._bay = None
+        self._request = 0  # Ignore answers to superseded page requests
+
+        self._build()
+        self.protocol("WM_DELETE_WINDOW", self._close)
+        self._queries.submit(self._fetch_bays)
+        self._load_page(after=None)
+        self.after(50, self._poll)
+
+    def _build(self):
+        top = ctk.CTkFrame(self)
+        top.pack(side="top", fill="x", padx=10, pady=5)
+        ctk.CTkLabel(top, text="Boxa:").pack(side="left", padx=(10, 4))
+        self.bay_menu = ctk.CTkOptionMenu(top, values=["Toate"], command=self._on_bay)
+        self.bay_menu.pack(side="left")
+        self.next_btn = ctk.CTkButton(top, text="Mai vechi ▶", width=100, command=self._older)
+        self.next_btn.pack(side="right", padx=4)
+        self.prev_btn = ctk.CTkButton(top, text="◀ Mai noi", width=100, command=self._newer)
+        self.prev_btn.pack(side="right", padx=4)
+        self.status = ctk.CTkLabel(top, text="")
+        self.status.pack(side="right", padx=10)
+
+        self.list_frame = ctk.CTkScrollableFrame(self)
+        self.list_frame.pack(expand=True, fill="both", padx=10, pady=(0, 10))
+        self.row_widgets = [IncidentRow(self.list_frame, self._open_snapshot) for _ in range(self.page_size)]
+
+    # ── Background work ──────────────────────────────────────────────────────
+    def _fetch_bays(self):
+        self._results.put(("bays", self.db.list_bays()))
+
+    def _fetch_page(self, request, after, bay):
+        rows = self.db.list_incidents(self.page_size, after=after, bay_name=bay)
+        self._results.put(("page", (request, after, rows)))
+
+    def _thumb_loop(self):
+        while not self._closed:
+            path = self._thumb_jobs.get()
+            if path is None or self.cache.get(path) is not None:
+                continue
+            try:
+                img = ThumbnailCache.load(path)
+            except Exception as e:
+                logger.debug(f"Miniatură indisponibilă {path}: {e}")
+                continue
+            self.cache.put(path, img)
+            self._results.put(("thumb", path))
+
+    # ── Paging ───────────────────────────────────────────────────────────────
+    def _load_page(self, after):
+        self._request += 1
+        self.status.configure(text="Se încarcă…")
+        self._queries.submit(self._fetch_page, self._request, after, self._bay)
+
+    def _cursor(self, row):
+        return (row["timestamp"], row["id"])
+
+    def _older(self):
+        if len(self.rows) == self.page_size:
+            self._history.append(self._current_after)
+            self._load_page(after=self._cursor(self.rows[-1]))
+
+    def _newer(self):
+        if self._history:
+            self._load_page(after=self._history.pop())
+
+    def _on_bay(self, choice):
+        self._bay = None if choice == "Toate" else choice
+        self._history = []
+        self._load_page(after=None)
+
+    def _show_page(self, after, rows):
+        self._current_after = after
+        self.rows = rows
+        for widget, incident in zip(self.row_widgets, rows + [None] * (self.page_size - len(rows))):
+            path = incident.get("image_path") if incident else None
+            image = self.cache.get(path) if path else None
+            if incident is not None:
+                widget.pack(fill="x", pady=2)
+            widget.bind_incident(incident, image)
+            if path and image is None:
+                self._thumb_jobs.put(path)
+        self.list_frame._parent_canvas.yview_moveto(0)
+        self.prev_btn.configure(state="normal" if self._history else "disabled")
+        self.next_btn.configure(state="normal" if len(rows) == self.page_size else "disabled")
+        page = len(self._history) + 1
+        self.status.configure(text=f"Pagina {page}" + ("" if rows else " (gol)"))
+
+    def _poll(self):
+        if self._closed:
+            return
+        try:
+            while True:
+                kind, payload = self._results.get_nowait()
+                if kind == "page":
+                    request, after, rows = payload
+                    if request != self._request:
+                        continue
+                    if rows is None:
+                        self.status.configure(text="⚠️ Baza de date indisponibilă")
+                    else:
+                        self._show_page(after, rows)
+                elif kind == "thumb":
+                    image = self.cache.get(payload)
+                    for widget in self.row_widgets:
+                        if widget.incident and widget.incident.get("image_path") == payload:
+                            widget.set_image(image)
+                elif kind == "bays":
+                    self.bay_menu.configure(values=["Toate"] + payload)
+        except queue.Empty:
+            pass
+        self.after(50, self._poll)
+
+    # ── Full snapshot ────────────────────────────────────────────────────────
+    def _open_snapshot(self, incident):
+        path = incident and incident.get("image_path")
+        if not path or not os.path.exists(path):
+            self.status.configure(text="⚠️ Captura nu mai există pe disc")
+            return
+        # Decoded on demand only; full images never enter the cache
+        img = Image.open(path)
+        max_w, max_h = self.winfo_screenwidth() - 100, self.winfo_screenheight() - 150
+        img.thumbnail((max_w, max_h))
+        window = ctk.CTkToplevel(self)
+        window.title(f"{incident['bay_name']} - {incident['timestamp']:%Y-%m-%d %H:%M:%S}")
+        ctk.CTkLabel(window, text="", image=ctk.CTkImage(light_image=img, dark_image=img, size=img.size)).pack()
+
+    def _close(self):
+        self._closed = True
+        self._thumb_jobs.put(None)
+        self._queries.submit(self.db.close)  # After any query still running on that connection
+        self._queries.shutdown(wait=False)
+        self.destroy()
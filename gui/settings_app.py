@@ -2,6 +2,10 @@
 settings_app.py - GUI for configuring AI Wash Guard
 """
 
+import time
+import queue
+import threading
+
 import customtkinter as ctk
 from tkinter import messagebox
 from config_manager import ConfigManager
@@ -13,14 +17,26 @@ from database import DatabaseManager
 ctk.set_appearance_mode("Dark")
 ctk.set_default_color_theme("blue")
 
+# UI deadlines; the SMTP (10 s) and MySQL (5 s) clients enforce their own timeouts below these
+CAMERA_TEST_TIMEOUT_S = 10
+EMAIL_TEST_TIMEOUT_S = 15
+DB_TEST_TIMEOUT_S = 8
+
 class SettingsApp(ctk.CTkToplevel):
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.config_manager = ConfigManager()
+        # Use the running engine's shared store when opened from the dashboard
+        engine = getattr(parent, 'engine', None)
+        self.config_manager = engine.config_mgr if engine else ConfigManager()
         
         self.title("🛡️ AI Wash Guard - Setări")
         self.geometry("700x650")
         self.attributes("-topmost", True)  # Keep on top
+
+        # Connection tests run on daemon threads; results come back through _poll_tests
+        self._test_results = queue.Queue()
+        self._tests = {}  # token -> (on_done, on_progress, started, deadline)
+        self._poll_id = None
         
         # Grid layout
         self.grid_columnconfigure(0, weight=1)
@@ -54,35 +70,67 @@ class SettingsApp(ctk.CTkToplevel):
 
     def _build_camera_tab(self):
         self.cam_entries = []
-        cameras = self.config_manager.get_cameras()
+        # Any number of bays: the list scrolls and rows can be added/removed
+        self.cam_list = ctk.CTkScrollableFrame(self.tab_cam)
+        self.cam_list.pack(fill="both", expand=True, padx=5, pady=5)
         
-        for i, cam in enumerate(cameras):
-            frame = ctk.CTkFrame(self.tab_cam)
-            frame.pack(fill="x", padx=10, pady=5)
-            
-            ctk.CTkLabel(frame, text=f"Boxa {i+1}:", width=60).grid(row=0, column=0, padx=5, pady=5)
-            
-            name_var = ctk.StringVar(value=cam["name"])
-            name_entry = ctk.CTkEntry(frame, textvariable=name_var, width=120)
-            name_entry.grid(row=0, column=1, padx=5, pady=5)
-            
-            url_var = ctk.StringVar(value=cam["url"])
-            url_entry = ctk.CTkEntry(frame, textvariable=url_var, width=320)
-            url_entry.grid(row=0, column=2, padx=5, pady=5)
-            
-            en_var = ctk.BooleanVar(value=cam.get("enabled", True))
-            en_cb = ctk.CTkCheckBox(frame, text="Activ", variable=en_var)
-            en_cb.grid(row=0, column=3, padx=5, pady=5)
+        for i, cam in enumerate(self.config_manager.get_cameras()):
+            # Same fallback id as the engine, so relay mapping survives row deletes
+            self._add_camera_row(dict(cam, id=cam.get("id", i)))
             
-            # Test Button
-            status_label = ctk.CTkLabel(frame, text="", font=("Arial", 16))
-            status_label.grid(row=0, column=5, padx=5, pady=5)
-            
-            test_btn = ctk.CTkButton(frame, text="🔍 Test", width=60, 
-                                    command=lambda u=url_var, l=status_label: self._test_camera(u, l))
-            test_btn.grid(row=0, column=4, padx=5, pady=5)
-            
-            self.cam_entries.append({"name": name_var, "url": url_var, "enabled": en_var, "status_label": status_label})
+        buttons = ctk.CTkFrame(self.tab_cam, fg_color="transparent")
+        buttons.pack(pady=(0, 5))
+        ctk.CTkButton(buttons, text="➕ Adaugă boxă", width=140,
+                      command=self._add_new_camera).pack(side="left", padx=5)
+        self.test_all_btn = ctk.CTkButton(buttons, text="🔍 Testează toate camerele", width=180,
+                                          command=self._test_all_cameras)
+        self.test_all_btn.pack(side="left", padx=5)
+        self.test_all_label = ctk.CTkLabel(self.tab_cam, text="")
+        self.test_all_label.pack(pady=(0, 5))
+
+    def _add_new_camera(self):
+        n = len(self.cam_entries) + 1
+        self._add_camera_row({"name": f"Boxa {n}", "url": "", "enabled": False})
+
+    def _add_camera_row(self, cam):
+        i = len(self.cam_entries)
+        frame = ctk.CTkFrame(self.cam_list)
+        frame.pack(fill="x", padx=5, pady=5)
+        
+        index_label = ctk.CTkLabel(frame, text=f"Boxa {i+1}:", width=60)
+        index_label.grid(row=0, column=0, padx=5, pady=5)
+        
+        name_var = ctk.StringVar(value=cam["name"])
+        name_entry = ctk.CTkEntry(frame, textvariable=name_var, width=110)
+        name_entry.grid(row=0, column=1, padx=5, pady=5)
+        
+        url_var = ctk.StringVar(value=cam["url"])
+        url_entry = ctk.CTkEntry(frame, textvariable=url_var, width=280)
+        url_entry.grid(row=0, column=2, padx=5, pady=5)
+        
+        en_var = ctk.BooleanVar(value=cam.get("enabled", True))
+        en_cb = ctk.CTkCheckBox(frame, text="Activ", variable=en_var, width=60)
+        en_cb.grid(row=0, column=3, padx=5, pady=5)
+        
+        # Test Button
+        status_label = ctk.CTkLabel(frame, text="", font=("Arial", 16))
+        status_label.grid(row=0, column=5, padx=5, pady=5)
+        
+        test_btn = ctk.CTkButton(frame, text="🔍 Test", width=60)
+        test_btn.grid(row=0, column=4, padx=5, pady=5)
+        
+        entry = {"cam": cam, "name": name_var, "url": url_var, "enabled": en_var, "status_label": status_label,
+                 "test_btn": test_btn, "frame": frame, "index_label": index_label}
+        test_btn.configure(command=lambda e=entry: self._test_camera(e))
+        ctk.CTkButton(frame, text="🗑", width=30, fg_color="gray30",
+                      command=lambda e=entry: self._remove_camera_row(e)).grid(row=0, column=6, padx=5, pady=5)
+        self.cam_entries.append(entry)
+
+    def _remove_camera_row(self, entry):
+        entry["frame"].destroy()
+        self.cam_entries.remove(entry)
+        for i, ent in enumerate(self.cam_entries):
+            ent["index_label"].configure(text=f"Boxa {i+1}:")
 
     def _build_email_tab(self):
         email = self.config_manager.get_email_settings()
@@ -150,25 +198,34 @@ class SettingsApp(ctk.CTkToplevel):
         self.ai_conf.insert(0, str(ai["confidence"]))
         self.ai_conf.grid(row=0, column=1, padx=10, pady=10, sticky="w")
         
-        ctk.CTkLabel(f, text="Pini Relee (BCM):").grid(row=1, column=0, padx=10, pady=10, sticky="e")
+        ctk.CTkLabel(f, text="Model AI (.pt/.onnx):").grid(row=1, column=0, padx=10, pady=10, sticky="e")
+        self.ai_model = ctk.CTkEntry(f, width=200)
+        self.ai_model.insert(0, ai["model"])
+        self.ai_model.grid(row=1, column=1, padx=10, pady=10, sticky="w")
+        
+        ctk.CTkLabel(f, text="Pini Relee (BCM):").grid(row=2, column=0, padx=10, pady=10, sticky="e")
         self.hw_pins = ctk.CTkEntry(f, width=200)
         self.hw_pins.insert(0, ", ".join(map(str, hw["relay_pins"])))
-        self.hw_pins.grid(row=1, column=1, padx=10, pady=10, sticky="w")
+        self.hw_pins.grid(row=2, column=1, padx=10, pady=10, sticky="w")
 
     def _save_all(self):
+        new_config = self.config_manager.snapshot()
+
         # 1. Cameras
+        # Edited fields are merged into the stored camera, so keys without a widget
+        # (max_fps, events...) are kept; only new rows get a fresh relay id
         new_cameras = []
-        for i, ent in enumerate(self.cam_entries):
-            new_cameras.append({
-                "id": i,
-                "name": ent["name"].get(),
-                "url": ent["url"].get(),
-                "enabled": ent["enabled"].get()
-            })
-        self.config_manager.config["cameras"] = new_cameras
+        next_id = max((ent["cam"]["id"] for ent in self.cam_entries if "id" in ent["cam"]), default=-1) + 1
+        for ent in self.cam_entries:
+            cam = dict(ent["cam"], name=ent["name"].get(), url=ent["url"].get(), enabled=ent["enabled"].get())
+            if "id" not in cam:
+                cam["id"] = next_id
+                next_id += 1
+            new_cameras.append(cam)
+        new_config["cameras"] = new_cameras
         
         # 2. Email
-        self.config_manager.config["email"] = {
+        new_config["email"] = {
             "enabled": self.email_en_var.get(),
             "sender": self.email_user.get(),
             "app_password": self.email_pass.get(),
@@ -176,7 +233,7 @@ class SettingsApp(ctk.CTkToplevel):
         }
         
         # 3. DB
-        self.config_manager.config["mysql"] = {
+        new_config["mysql"] = {
             "enabled": self.db_en_var.get(),
             "host": self.db_entries["host"].get(),
             "user": self.db_entries["user"].get(),
@@ -187,38 +244,131 @@ class SettingsApp(ctk.CTkToplevel):
         # 4. HW & AI
         try:
             pins = [int(p.strip()) for p in self.hw_pins.get().split(",")]
-            self.config_manager.config["hardware"]["relay_pins"] = pins
-            self.config_manager.config["ai"]["confidence"] = float(self.ai_conf.get())
+            new_config["hardware"]["relay_pins"] = pins
+            new_config["ai"]["confidence"] = float(self.ai_conf.get())
+            if self.ai_model.get().strip():
+                new_config["ai"]["model"] = self.ai_model.get().strip()
         except Exception as e:
             messagebox.showerror("Eroare", f"Format invalid pentru pini sau AI confidence: {e}")
-           # Save to file
-        self.config_manager.save()
-        
-        # Trigger engine reload and UI refresh
-        if self.master and hasattr(self.master, 'engine'):
-            self.master.engine.reload_config()
-            
-        if hasattr(self.master, 'refresh_widgets'):
-            self.master.refresh_widgets()
+
+        # Save to file; subscribers (engine, dashboard) restart only what changed
+        self.config_manager.apply(new_config)
             
         messagebox.showinfo("Succes", "Setările au fost salvate și aplicate!")
         self.destroy()
 
-    def _test_camera(self, url_var, status_label):
-        url = url_var.get()
-        if not url:
+    # ── Connection tests (off the Tk thread) ────────────────────────────────
+    def _run_test(self, fn, on_done, timeout_s, on_progress=None):
+        """
+        Run `fn()` on a daemon thread. `on_done(result)` runs on the Tk thread, with
+        None if `fn` has not returned within `timeout_s` (a late result is dropped).
+        `on_progress(elapsed_s)` is called while it runs.
+        """
+        token = object()
+        started = time.monotonic()
+        self._tests[token] = (on_done, on_progress, started, started + timeout_s)
+
+        def work():
+            try:
+                result = fn()
+            except Exception as e:
+                result = e
+            self._test_results.put((token, result))
+
+        threading.Thread(target=work, daemon=True, name="settings-test").start()
+        if on_progress:
+            on_progress(0.0)
+        if self._poll_id is None:
+            self._poll_id = self.after(100, self._poll_tests)
+
+    def _poll_tests(self):
+        self._poll_id = None
+        while True:
+            try:
+                token, result = self._test_results.get_nowait()
+            except queue.Empty:
+                break
+            test = self._tests.pop(token, None)
+            if test:
+                test[0](result)
+        now = time.monotonic()
+        for token, (on_done, on_progress, started, deadline) in list(self._tests.items()):
+            if now >= deadline:
+                del self._tests[token]
+                on_done(None)
+            elif on_progress:
+                on_progress(now - started)
+        if self._tests:
+            self._poll_id = self.after(100, self._poll_tests)
+
+    def destroy(self):
+        if self._poll_id is not None:
+            self.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._tests.clear()  # Tests still running finish into the void
+        super().destroy()
+
+    def _start_camera_test(self, entry, on_done):
+        url = entry["url"].get().strip()
+        label, btn = entry["status_label"], entry["test_btn"]
+        btn.configure(state="disabled")
+
+        def progress(elapsed):
+            if label.winfo_exists():
+                label.configure(text=f"⏳ {elapsed:.0f}s", text_color="orange", font=("Arial", 12))
+
+        def done(result):
+            if not label.winfo_exists():  # Row removed while testing
+                on_done(result)
+                return
+            btn.configure(state="normal")
+            if isinstance(result, dict) and result["ok"]:
+                label.configure(text=f"✅ {result['first_frame_s']:.1f}s {result['width']}×{result['height']}",
+                                text_color="green", font=("Arial", 12))
+            else:
+                label.configure(text="❌", text_color="red", font=("Arial", 16))
+            on_done(result)
+
+        self._run_test(lambda: CameraManager.probe(url, CAMERA_TEST_TIMEOUT_S), done,
+                       CAMERA_TEST_TIMEOUT_S + 2, progress)
+
+    def _test_camera(self, entry):
+        if not entry["url"].get().strip():
             messagebox.showwarning("Atenție", "Introduceți un URL pentru cameră.")
             return
-            
-        status_label.configure(text="⏳", text_color="orange")
-        self.update_idletasks()
-        
-        success = CameraManager.test_connection(url)
-        if success:
-            status_label.configure(text="✅", text_color="green")
-        else:
-            status_label.configure(text="❌", text_color="red")
-            messagebox.showerror("Eroare", "Nu s-a putut conecta la fluxul RTSP.")
+
+        def done(result):
+            if not isinstance(result, dict) or not result["ok"]:
+                reason = "timeout" if result is None else result["error"] if isinstance(result, dict) else result
+                messagebox.showerror("Eroare", f"Nu s-a putut conecta la fluxul RTSP ({reason}).")
+
+        self._start_camera_test(entry, done)
+
+    def _test_all_cameras(self):
+        """Probe every configured URL in parallel; each row shows time to first frame and resolution."""
+        entries = [e for e in self.cam_entries if e["url"].get().strip()]
+        if not entries:
+            messagebox.showwarning("Atenție", "Nicio cameră cu URL configurat.")
+            return
+        results = {}
+        self.test_all_btn.configure(state="disabled")
+        self.test_all_label.configure(text=f"Se testează {len(entries)} camere în paralel…")
+
+        def done_one(entry, result):
+            results[id(entry)] = (entry["name"].get(), result)
+            if len(results) < len(entries):
+                return
+            ok = [r for _, r in results.values() if isinstance(r, dict) and r["ok"]]
+            slowest = max(ok, key=lambda r: r["first_frame_s"]) if ok else None
+            failed = [name for name, r in results.values() if not (isinstance(r, dict) and r["ok"])]
+            self.test_all_label.configure(
+                text=f"{len(ok)}/{len(entries)} camere OK"
+                     + (f", cel mai lent primul cadru: {slowest['first_frame_s']:.1f}s" if slowest else "")
+                     + (f" — eșuate: {', '.join(failed)}" if failed else ""))
+            self.test_all_btn.configure(state="normal")
+
+        for entry in entries:
+            self._start_camera_test(entry, lambda result, e=entry: done_one(e, result))
 
     def _test_email(self):
         sender = self.email_user.get()
@@ -230,11 +380,20 @@ class SettingsApp(ctk.CTkToplevel):
             return
             
         notifier = EmailNotifier(sender, password, recipient)
-        success, msg = notifier.test_connection()
-        if success:
-            messagebox.showinfo("Succes", msg)
-        else:
-            messagebox.showerror("Eroare", f"Test eșuat: {msg}")
+        self.test_email_btn.configure(state="disabled")
+
+        def progress(elapsed):
+            self.test_email_btn.configure(text=f"⏳ Se trimite emailul de test… {elapsed:.0f}s")
+
+        def done(result):
+            self.test_email_btn.configure(state="normal", text="📧 Trimite Email de Test")
+            success, msg = result if isinstance(result, tuple) else (False, result or "timeout")
+            if success:
+                messagebox.showinfo("Succes", msg)
+            else:
+                messagebox.showerror("Eroare", f"Test eșuat: {msg}")
+
+        self._run_test(notifier.test_connection, done, EMAIL_TEST_TIMEOUT_S, progress)
 
     def _test_database(self):
         host = self.db_entries["host"].get()
@@ -245,12 +404,22 @@ class SettingsApp(ctk.CTkToplevel):
         if not all([host, user, database]):
             messagebox.showwarning("Atenție", "Completați datele conexiunii (host, user, DB).")
             return
-            
-        success, msg = DatabaseManager.test_connection(host, user, password, database)
-        if success:
-            messagebox.showinfo("Succes", msg)
-        else:
-            messagebox.showerror("Eroare", f"Conexiune eșuată: {msg}")
+
+        self.test_db_btn.configure(state="disabled")
+
+        def progress(elapsed):
+            self.test_db_btn.configure(text=f"⏳ Conectare… {elapsed:.0f}s")
+
+        def done(result):
+            self.test_db_btn.configure(state="normal", text="🗄️ Test Conexiune DB")
+            success, msg = result if isinstance(result, tuple) else (False, result or "timeout")
+            if success:
+                messagebox.showinfo("Succes", msg)
+            else:
+                messagebox.showerror("Eroare", f"Conexiune eșuată: {msg}")
+
+        self._run_test(lambda: DatabaseManager.test_connection(host, user, password, database),
+                       done, DB_TEST_TIMEOUT_S, progress)
 
 if __name__ == "__main__":
     app = SettingsApp()
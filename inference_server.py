@@ -0,0 +1,340 @@
+"""
+inference_server.py - Remote batched YOLO inference for offloading weak nodes
+One machine (e.g. an x86 mini-PC) runs the model; Pi nodes send JPEG frames.
+Requests from all clients are batched dynamically (up to --max-batch frames or
+--max-wait-ms, whichever comes first) and answered with structured detections.
+
+Wire format, both directions: 4-byte big-endian header length, JSON header,
+then `header["len"]` payload bytes (the JPEG, requests only).
+
+    python inference_server.py --model yolov8n.pt --port 9871
+"""
+
+import json
+import time
+import queue
+import socket
+import struct
+import logging
+import argparse
+import threading
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 9871
+_HEADER = struct.Struct(">I")
+
+
+def send_message(sock, header, payload=b""):
+    header = dict(header, len=len(payload))
+    raw = json.dumps(header, separators=(",", ":")).encode()
+    sock.sendall(_HEADER.pack(len(raw)) + raw + payload)
+
+
+def _recv_exact(sock, n):
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        k = sock.recv_into(view[got:], n - got)
+        if k == 0:
+            raise ConnectionError("conexiune închisă")
+        got += k
+    return bytes(buf)
+
+
+def recv_message(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    header = json.loads(_recv_exact(sock, size))
+    payload = _recv_exact(sock, header["len"]) if header.get("len") else b""
+    return header, payload
+
+
+class _Request:
+    __slots__ = ("client", "req_id", "frame", "conf", "classes", "received")
+
+    def __init__(self, client, req_id, frame, conf, classes):
+        self.client = client
+        self.req_id = req_id
+        self.frame = frame
+        self.conf = conf
+        self.classes = classes
+        self.received = time.perf_counter()
+
+
+class _Client:
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.lock = threading.Lock()
+
+    def reply(self, header):
+        with self.lock:
+            send_message(self.sock, header)
+
+
+class InferenceServer:
+    """Accepts many clients and runs their frames through the model in shared batches."""
+    def __init__(self, model_path="yolov8n.pt", host="0.0.0.0", port=DEFAULT_PORT,
+                 max_batch=8, max_wait_ms=10, imgsz=640, model=None):
+        if model is None:
+            from ultralytics import YOLO
+            model = YOLO(model_path)
+        self.model = model
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.imgsz = imgsz
+        self._queue = queue.Queue()
+        self._server = None
+        self.running = False
+        self.stats = {"requests": 0, "batches": 0, "frames_in_batches": 0, "infer_ms": 0.0}
+
+    def start(self):
+        self._server = socket.create_server((self.host, self.port))
+        self.port = self._server.getsockname()[1]
+        self.running = True
+        threading.Thread(target=self._accept_loop, daemon=True, name="infer-accept").start()
+        threading.Thread(target=self._batch_loop, daemon=True, name="infer-batch").start()
+        logger.info(f"🧠 Server inferență activ pe portul {self.port} (batch ≤ {self.max_batch}, "
+                    f"așteptare ≤ {self.max_wait * 1000:.0f} ms).")
+        return self
+
+    def stop(self):
+        self.running = False
+        if self._server:
+            self._server.close()
+        self._queue.put(None)
+
+    def _accept_loop(self):
+        while self.running:
+            try:
+                sock, addr = self._server.accept()
+            except OSError:
+                break
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._client_loop, args=(_Client(sock, addr),), daemon=True).start()
+
+    def _client_loop(self, client):
+        logger.info(f"Client inferență conectat: {client.addr[0]}")
+        try:
+            while self.running:
+                header, payload = recv_message(client.sock)
+                # Decoding happens on the client's thread, in parallel with the batch in flight
+                frame = cv2.imdecode(np.frombuffer(payload, np.uint8), cv2.IMREAD_COLOR)
+                if frame is None:
+                    client.reply({"id": header.get("id"), "error": "imagine invalidă"})
+                    continue
+                self._queue.put(_Request(client, header.get("id"), frame,
+                                         float(header.get("conf", 0.25)), header.get("classes")))
+        except (ConnectionError, OSError, ValueError):
+            pass
+        finally:
+            client.sock.close()
+
+    def _next_batch(self):
+        first = self._queue.get()
+        if first is None:
+            return []
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                break
+            batch.append(item)
+        return batch
+
+    def _batch_loop(self):
+        while self.running:
+            batch = self._next_batch()
+            if not batch:
+                continue
+            t0 = time.perf_counter()
+            try:
+                # Lowest requested threshold for the batch; stricter ones are filtered per request
+                min_conf = min(r.conf for r in batch)
+                results = self.model([r.frame for r in batch], conf=min_conf, imgsz=self.imgsz, verbose=False)
+            except Exception as e:
+                logger.error(f"Eroare inferență batch: {e}")
+                for r in batch:
+                    self._safe_reply(r, {"id": r.req_id, "error": str(e)})
+                continue
+            infer_ms = (time.perf_counter() - t0) * 1000
+
+            self.stats["batches"] += 1
+            self.stats["frames_in_batches"] += len(batch)
+            self.stats["requests"] += len(batch)
+            self.stats["infer_ms"] += infer_ms
+            names = self.model.names
+            for r, res in zip(batch, results):
+                detections = []
+                for box in res.boxes:
+                    cls_id = int(box.cls[0])
+                    score = float(box.conf[0])
+                    if score < r.conf or (r.classes is not None and cls_id not in r.classes):
+                        continue
+                    detections.append([cls_id, names[cls_id], score] + [float(v) for v in box.xyxy[0]])
+                self._safe_reply(r, {"id": r.req_id, "detections": detections, "batch": len(batch),
+                                     "server_ms": round((time.perf_counter() - r.received) * 1000, 2)})
+
+    @staticmethod
+    def _safe_reply(request, header):
+        try:
+            request.client.reply(header)
+        except OSError:
+            pass
+
+    def get_stats(self):
+        s = dict(self.stats)
+        s["avg_batch"] = s["frames_in_batches"] / s["batches"] if s["batches"] else 0.0
+        s["avg_infer_ms"] = s["infer_ms"] / s["batches"] if s["batches"] else 0.0
+        return s
+
+
+class RemoteInferenceClient:
+    """
+    Pipelined client with a hard timeout: every bay thread sends its frame on the one
+    connection as soon as it is encoded (requests are tagged with ids) and a reader
+    thread hands each reply to its caller, so the server batches across bays too.
+    `timeout` covers the whole call, connecting and waiting to send included.
+    Frames are downscaled to `max_side` before JPEG encoding; boxes are scaled back.
+    """
+    def __init__(self, address, timeout=0.4, jpeg_quality=80, max_side=640):
+        host, _, port = address.rpartition(":")
+        self.host = host or address
+        self.port = int(port) if host else DEFAULT_PORT
+        self.timeout = timeout
+        self.jpeg_quality = jpeg_quality
+        self.max_side = max_side
+        self._sock = None
+        self._next_id = 0
+        self._pending = {}  # id -> [Event, reply header]
+        self._lock = threading.Lock()  # Connection state, ids, pending
+        self._send_lock = threading.Lock()
+
+    def _connection(self, deadline):
+        with self._lock:
+            if self._sock is None:
+                sock = socket.create_connection((self.host, self.port), timeout=max(0.001, deadline - time.monotonic()))
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                # Blocking for the reader; callers time out on their own events, and a send
+                # stuck on a full socket buffer gives up after `timeout` (kernel-side, so the
+                # reader's recv is not affected)
+                sock.settimeout(None)
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDTIMEO,
+                                struct.pack("ll", int(self.timeout), int(self.timeout % 1 * 1e6)))
+                self._sock = sock
+                threading.Thread(target=self._read_loop, args=(sock,), daemon=True, name="infer-client").start()
+            return self._sock
+
+    def _read_loop(self, sock):
+        try:
+            while True:
+                header, _ = recv_message(sock)
+                with self._lock:
+                    waiter = self._pending.pop(header.get("id"), None)
+                if waiter is not None:  # Unknown ids are late replies to requests that timed out
+                    waiter[1] = header
+                    waiter[0].set()
+        except (OSError, ValueError):
+            self._drop(sock)
+
+    def _drop(self, sock):
+        """Close `sock` and fail every request still waiting on it."""
+        with self._lock:
+            if self._sock is sock:
+                self._sock = None
+                pending, self._pending = self._pending, {}
+            else:
+                pending = {}
+        try:
+            sock.close()
+        except OSError:
+            pass
+        for waiter in pending.values():
+            waiter[0].set()  # Reply stays None: connection lost
+
+    def close(self):
+        sock = self._sock
+        if sock:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._drop(sock)
+
+    def infer(self, frame, conf, classes=None):
+        """Returns [(cls_id, name, score, (x1, y1, x2, y2)), ...]; raises on timeout/error."""
+        deadline = time.monotonic() + self.timeout
+        h, w = frame.shape[:2]
+        scale = min(1.0, self.max_side / max(h, w))
+        small = cv2.resize(frame, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA) \
+            if scale < 1.0 else frame
+        ok, buf = cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+        if not ok:
+            raise RuntimeError("codare JPEG eșuată")
+
+        sock = self._connection(deadline)
+        waiter = [threading.Event(), None]
+        with self._lock:
+            self._next_id += 1
+            req_id = self._next_id
+            self._pending[req_id] = waiter
+        try:
+            if not self._send_lock.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                raise TimeoutError("coadă de trimitere plină")
+            try:
+                send_message(sock, {"id": req_id, "conf": conf, "classes": classes}, buf.tobytes())
+            except OSError:
+                self._drop(sock)  # A partial message leaves the stream unusable
+                raise
+            finally:
+                self._send_lock.release()
+            if not waiter[0].wait(max(0.0, deadline - time.monotonic())):
+                raise TimeoutError(f"fără răspuns în {self.timeout * 1000:.0f} ms")
+        finally:
+            with self._lock:
+                self._pending.pop(req_id, None)
+        header = waiter[1]
+        if header is None:
+            raise ConnectionError("conexiune închisă")
+        if "error" in header:
+            raise RuntimeError(header["error"])
+        return [(d[0], d[1], d[2], tuple(v / scale for v in d[3:7])) for d in header["detections"]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI Wash Guard - server de inferență în lot")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    parser.add_argument("--imgsz", type=int, default=640)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+    server = InferenceServer(args.model, args.host, args.port, args.max_batch, args.max_wait_ms, args.imgsz).start()
+    try:
+        while True:
+            time.sleep(30)
+            s = server.get_stats()
+            logger.info(f"💓 {s['requests']} cereri, batch mediu {s['avg_batch']:.2f}, "
+                        f"inferență medie {s['avg_infer_ms']:.1f} ms/batch")
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
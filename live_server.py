@@ -0,0 +1,290 @@
+"""
+live_server.py - Built-in HTTP live view (MJPEG streams, snapshots, status)
+Each camera has one broadcaster that downscales and JPEG-encodes the latest
+frame at most `fps` times per second, only while someone is watching; every
+client gets the same bytes. Clients always take the newest frame, so a slow
+phone skips frames instead of queueing them.
+
+    /                         index page with all cameras
+    /cam/<id|name>/stream.mjpg
+    /cam/<id|name>/snapshot.jpg
+    /status.json              engine status (bays, relays, journal, alerts)
+"""
+
+import hmac
+import html
+import json
+import time
+import base64
+import socket
+import logging
+import threading
+from urllib.parse import unquote
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+BOUNDARY = "awgframe"
+
+
+class FrameBroadcaster:
+    """Encode-once fan-out of one camera's frames."""
+    IDLE_STOP_S = 10
+
+    def __init__(self, name, source, width=640, fps=5, quality=70, stopped=None):
+        self.name = name
+        self.source = source  # Callable returning (frame_id, frame)
+        self.width = width
+        self.interval = 1.0 / max(0.1, fps)
+        self.quality = quality
+        self.jpeg = None
+        self.seq = 0
+        self.clients = 0
+        self._last_id = None
+        self._last_demand = 0.0
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = stopped or threading.Event()  # Set by LiveServer.stop: streams end
+        self.encoded = 0
+
+    def _encode(self, frame):
+        h, w = frame.shape[:2]
+        if w > self.width:
+            frame = cv2.resize(frame, (self.width, int(h * self.width / w)), interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return buf.tobytes() if ok else None
+
+    def _poll(self):
+        """Encode the camera's frame if it changed; returns True if a new JPEG was published."""
+        frame_id, frame = self.source()
+        if frame is None or frame_id == self._last_id:
+            return False
+        data = self._encode(frame)
+        if data is None:
+            return False
+        with self._cond:
+            self._last_id = frame_id
+            self.jpeg = data
+            self.seq += 1
+            self.encoded += 1
+            self._cond.notify_all()
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._stopped.is_set() or (
+                        not self.clients and time.monotonic() - self._last_demand >= self.IDLE_STOP_S):
+                    self._thread = None  # Nobody watching: no encoding cost
+                    return
+            started = time.monotonic()
+            try:
+                self._poll()
+            except Exception as e:
+                logger.error(f"Eroare codare flux live {self.name}: {e}")
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def _demand(self):
+        with self._cond:
+            self._last_demand = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True, name=f"live-{self.name}")
+                self._thread.start()
+
+    def snapshot(self):
+        """Latest JPEG; encodes one on demand if nobody is streaming."""
+        with self._cond:
+            streaming = self._thread is not None
+        if not streaming:
+            self._poll()
+        with self._cond:
+            return self.jpeg
+
+    def frames(self, timeout=5.0):
+        """Yields JPEGs as they are published, always the newest one (older ones are skipped)."""
+        with self._cond:
+            self.clients += 1
+        try:
+            seen = 0  # seq 0 = nothing encoded yet
+            while not self._stopped.is_set():
+                self._demand()
+                with self._cond:
+                    if self.seq == seen:
+                        self._cond.wait(timeout)
+                    if self.seq == seen:
+                        continue  # Camera stalled; keep the connection, send nothing
+                    seen, data = self.seq, self.jpeg
+                yield data
+        finally:
+            with self._cond:
+                self.clients -= 1
+
+
+class LiveServer:
+    def __init__(self, engine, port=8080, width=640, fps=5, quality=70, user="", password=""):
+        self.engine = engine
+        self.port = port
+        self.width = width
+        self.fps = fps
+        self.quality = quality
+        self._auth = "Basic " + base64.b64encode(f"{user}:{password}".encode()).decode() if password else None
+        self._broadcasters = {}
+        self._streams = set()  # Sockets of open MJPEG streams, closed by stop()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._httpd = None
+
+    @classmethod
+    def from_config(cls, engine, cfg):
+        return cls(engine, cfg["port"], cfg["width"], cfg["fps"], cfg["quality"], cfg["user"], cfg["password"])
+
+    def start(self):
+        server = self
+
+        class Handler(_LiveHandler):
+            live = server
+
+        self._httpd = ThreadingHTTPServer(("0.0.0.0", self.port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True, name="live-http").start()
+        logger.info(f"📡 Vizualizare live HTTP pe portul {self.port} ({self.width}px, {self.fps} FPS).")
+        return self
+
+    def stop(self):
+        """Stop accepting and cut the viewers already connected (disabled, new password, restart)."""
+        self._stopped.set()
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        with self._lock:
+            streams, self._streams = list(self._streams), set()
+            broadcasters, self._broadcasters = list(self._broadcasters.values()), {}
+        for b in broadcasters:
+            with b._cond:
+                b._cond.notify_all()
+        for sock in streams:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)  # Unblocks a handler stuck writing to a slow viewer
+            except OSError:
+                pass
+
+    def track_stream(self, sock, active):
+        with self._lock:
+            if not active:
+                self._streams.discard(sock)
+            elif self._stopped.is_set():
+                return False
+            else:
+                self._streams.add(sock)
+        return True
+
+    def cameras(self):
+        return list(self.engine.active_cameras)
+
+    def resolve(self, key):
+        """Camera name for a URL key (relay id or name)."""
+        key = unquote(key)
+        for i, cam in enumerate(self.cameras()):
+            if str(cam.get("id", i)) == key or cam["name"] == key:
+                return cam["name"]
+        return None
+
+    def broadcaster(self, name):
+        with self._lock:
+            if name not in self._broadcasters:
+                source = lambda: self.engine.cameras.read_frame(name)
+                self._broadcasters[name] = FrameBroadcaster(name, source, self.width, self.fps, self.quality,
+                                                            self._stopped)
+            return self._broadcasters[name]
+
+    def get_stats(self):
+        with self._lock:
+            return {name: {"clients": b.clients, "encoded": b.encoded}
+                    for name, b in self._broadcasters.items()}
+
+
+class _LiveHandler(BaseHTTPRequestHandler):
+    live = None
+    timeout = 10  # A viewer that stops reading is dropped instead of blocking forever
+
+    def log_message(self, fmt, *args):
+        logger.debug(f"{self.client_address[0]} {fmt % args}")
+
+    def _send(self, code, content_type, body):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.live._auth and not hmac.compare_digest(self.headers.get("Authorization", "").encode(),
+                                                       self.live._auth.encode()):
+            self.send_response(401)
+            self.send_header("WWW-Authenticate", 'Basic realm="AI Wash Guard"')
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        path = self.path.split("?", 1)[0]
+        parts = [p for p in path.split("/") if p]
+        try:
+            if not parts:
+                self._index()
+            elif parts == ["status.json"]:
+                self._send(200, "application/json", json.dumps(self.live.engine.get_status()).encode())
+            elif parts == ["memory.txt"]:
+                guard = getattr(self.live.engine, "memory_guard", None)
+                if guard is None:
+                    self._send(404, "text/plain", b"")
+                else:
+                    self._send(200, "text/plain; charset=utf-8", guard.report().encode())
+            elif len(parts) == 3 and parts[0] == "cam":
+                name = self.live.resolve(parts[1])
+                if name is None:
+                    self._send(404, "text/plain", b"camera necunoscuta")
+                elif parts[2] == "snapshot.jpg":
+                    data = self.live.broadcaster(name).snapshot()
+                    if data is None:
+                        self._send(503, "text/plain", b"fara imagine")
+                    else:
+                        self._send(200, "image/jpeg", data)
+                elif parts[2] == "stream.mjpg":
+                    self._stream(self.live.broadcaster(name))
+                else:
+                    self._send(404, "text/plain", b"")
+            else:
+                self._send(404, "text/plain", b"")
+        except OSError:
+            pass  # Viewer went away (broken pipe, reset, timeout) or stop() cut the stream
+
+    def _stream(self, broadcaster):
+        if not self.live.track_stream(self.connection, True):
+            return
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", f"multipart/x-mixed-replace; boundary={BOUNDARY}")
+            self.send_header("Cache-Control", "no-store")
+            self.end_headers()
+            for data in broadcaster.frames():
+                self.wfile.write(f"--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                                 f"Content-Length: {len(data)}\r\n\r\n".encode())
+                self.wfile.write(data)
+                self.wfile.write(b"\r\n")
+        finally:
+            self.live.track_stream(self.connection, False)
+
+    def _index(self):
+        tiles = "".join(
+            f'<div><h3>{html.escape(cam["name"])}</h3><img src="/cam/{cam.get("id", i)}/stream.mjpg"></div>'
+            for i, cam in enumerate(self.live.cameras()))
+        page = (f"<!doctype html><html><head><meta charset='utf-8'>"
+                f"<meta name='viewport' content='width=device-width'><title>AI Wash Guard Live</title>"
+                f"<style>body{{background:#111;color:#eee;font-family:sans-serif}}"
+                f"div{{display:inline-block;margin:4px}}img{{max-width:100%}}</style></head>"
+                f"<body>{tiles}</body></html>")
+        self._send(200, "text/html; charset=utf-8", page.encode())
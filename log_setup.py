@@ -0,0 +1,204 @@
+"""
+log_setup.py - Asynchronous, rate-limited logging
+Callers only pay for a rate-limit check and a non-blocking put on a bounded
+queue; formatting and console/file writes happen on one background writer
+thread (QueueListener). Repeats of the same message (per call site and
+template, or an explicit `rate_key`) beyond `burst` per `window_s` are dropped
+and reported as one summary line. ERROR and above, and records logged with
+`rate_key=False` (alarm and relay transitions), are never dropped. `log_event()`
+attaches structured fields, written as JSON lines when `logging.json` is on.
+
+    from log_setup import log_event
+    logger.warning("DETECȚIE: %s identificat!", name)          # lazy, formatted off-thread
+    log_event(logger, "alarm_start", bay="Boxa 1", image="evidence/...jpg")
+"""
+
+import os
+import json
+import time
+import queue
+import logging
+import threading
+import logging.handlers
+
+FORMAT = "%(asctime)s [%(levelname)s] %(name)s: %(message)s"
+
+_active = None
+_active_lock = threading.Lock()
+
+
+def log_event(logger, event, level=logging.INFO, limit=True, **fields):
+    """Structured event record: `event` plus key=value fields (kept as data for the JSON log)."""
+    if logger.isEnabledFor(level):
+        text = " ".join(f"{k}=%s" for k in fields)
+        rate_key = ("event", event, fields.get("bay")) if limit else False
+        logger.log(level, f"[{event}] {text}", *fields.values(),
+                   extra={"event": event, "fields": fields, "rate_key": rate_key})
+
+
+class RateLimitFilter(logging.Filter):
+    """At most `burst` records per key per `window_s`; the rest are counted and summarised."""
+    def __init__(self, burst=5, window_s=60.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window_s
+        self._windows = {}  # key -> [window start, passed, suppressed, sample record]
+        self._lock = threading.Lock()
+        self.suppressed_total = 0
+
+    @staticmethod
+    def key(record):
+        key = getattr(record, "rate_key", None)
+        return key if key is not None else (record.name, record.lineno, str(record.msg))
+
+    def filter(self, record):
+        if self.burst <= 0 or record.levelno >= logging.ERROR:
+            return True
+        key = self.key(record)
+        if key is False:
+            return True  # Transitions (alarm, relay): every one matters
+        now = time.monotonic()
+        with self._lock:
+            w = self._windows.get(key)
+            if w is None or now - w[0] >= self.window:
+                if w is not None and w[2]:
+                    record.msg = f"{record.msg} [+{w[2]} mesaje similare suprimate în {self.window:.0f}s]"
+                self._windows[key] = [now, 1, 0, None]
+                if len(self._windows) > 2048:
+                    self._prune(now)
+                return True
+            if w[1] < self.burst:
+                w[1] += 1
+                return True
+            w[2] += 1
+            w[3] = record
+            self.suppressed_total += 1
+            return False
+
+    def _prune(self, now):
+        for key in [k for k, w in self._windows.items() if now - w[0] >= self.window and not w[2]]:
+            del self._windows[key]
+
+    def expired_summaries(self, force=False):
+        """Summary records for finished windows that suppressed something (no later record to carry them)."""
+        now = time.monotonic()
+        out = []
+        with self._lock:
+            for key, w in list(self._windows.items()):
+                if w[2] and (force or now - w[0] >= self.window):
+                    sample = w[3]
+                    summary = logging.LogRecord(sample.name, sample.levelno, sample.pathname, sample.lineno,
+                                                "%s [+%d mesaje similare suprimate în %ds]",
+                                                (sample.getMessage(), w[2], int(self.window)), None)
+                    out.append(summary)
+                    del self._windows[key]
+        return out
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; structured event fields are merged in."""
+    def format(self, record):
+        data = {"ts": round(record.created, 3), "level": record.levelname, "logger": record.name,
+                "msg": record.getMessage()}
+        event = getattr(record, "event", None)
+        if event:
+            data["event"] = event
+            data.update({k: v for k, v in record.fields.items() if k not in data})
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Non-blocking enqueue of the unformatted record; a full queue drops and counts."""
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Same process: the writer thread formats it, the caller pays nothing for it
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class AsyncLogging:
+    def __init__(self, level="INFO", file="", json_file=False, max_mb=10, backups=3,
+                 queue_size=10000, burst=5, window_s=60.0):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = _QueueHandler(self.queue)
+        self.limiter = RateLimitFilter(burst, window_s)
+        self.handler.addFilter(self.limiter)
+
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter(FORMAT))
+        outputs = [console]
+        if file:
+            os.makedirs(os.path.dirname(file) or ".", exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                file, maxBytes=int(max_mb * 1024 * 1024), backupCount=backups, encoding="utf-8")
+            file_handler.setFormatter(JsonFormatter() if json_file else logging.Formatter(FORMAT))
+            outputs.append(file_handler)
+        self.listener = logging.handlers.QueueListener(self.queue, *outputs, respect_handler_level=False)
+        self.level = level
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(cfg["level"], cfg["file"], cfg["json"], cfg["max_mb"], cfg["backups"],
+                   cfg["queue_size"], cfg["burst"], cfg["window_s"])
+
+    def _summary_loop(self):
+        while not self._stop.wait(max(1.0, self.limiter.window / 2)):
+            for record in self.limiter.expired_summaries():
+                self.handler.enqueue(record)
+
+    def start(self):
+        root = logging.getLogger()
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        self.listener.start()
+        threading.Thread(target=self._summary_loop, daemon=True, name="log-summary").start()
+        return self
+
+    def stop(self):
+        """Flush pending summaries and records, then detach (records after this go nowhere)."""
+        self._stop.set()
+        for record in self.limiter.expired_summaries(force=True):
+            self.handler.enqueue(record)
+        self.listener.stop()
+        logging.getLogger().removeHandler(self.handler)
+
+    def get_stats(self):
+        return {"queued": self.queue.qsize(), "dropped": self.handler.dropped,
+                "suppressed": self.limiter.suppressed_total}
+
+
+def setup_logging(cfg):
+    """Install (or re-install after a config change) the async handler on the root logger."""
+    global _active
+    with _active_lock:
+        old, _active = _active, AsyncLogging.from_config(cfg)
+        if old:
+            old.stop()
+        return _active.start()
+
+
+def shutdown_logging():
+    global _active
+    with _active_lock:
+        if _active:
+            _active.stop()
+            # Whatever is logged during the rest of shutdown goes straight to stderr
+            logging.basicConfig(level=logging.INFO, format=FORMAT)
+            _active = None
+
+
+def get_stats():
+    return _active.get_stats() if _active else None
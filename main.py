@@ -1,15 +1,36 @@
+import os
 import time
+import base64
+import socket
 import logging
 import signal
 import sys
+import argparse
 import threading
+import cv2
+from datetime import datetime
 from camera_manager import CameraManager
+from camera_process import ProcessCameraManager
 from ai_detector import AiDetector
 from relay_controller import RelayController
-from notifier import EmailNotifier
+from notifier import EmailNotifier, AlertDispatcher
 from database import DatabaseManager
+from evidence_store import SnapshotPipeline
+from event_journal import EventJournal
+from bay_state import BayStateStore
+from detection_log import DetectionLog
+from live_server import LiveServer
+from pipeline import PipelineSupervisor
+from preprocess import PipelinedDetector
+from thermal_governor import ThermalGovernor
+from camera_events import CameraEventGate
+from memory_guard import MemoryGuard
+from log_setup import setup_logging, shutdown_logging, log_event, get_stats as get_log_stats
 from config_manager import ConfigManager
+from thread_budget import apply_thread_budget, pin_current_thread
+from cluster import ClusterCoordinator, CoordinatorLink, RemoteRelays
 from gui.dashboard import DashboardApp
+from gui.settings_app import SettingsApp
 
 # ── Logging Setup ────────────────────────────────────────────────────────────
 logging.basicConfig(
@@ -18,147 +39,766 @@ logging.basicConfig(
 )
 logger = logging.getLogger("AWG")
 
+VEHICLE_LABEL = "Vehicul Interzis (ATV/Cross)"
+
 class AIWashGuard:
-    def __init__(self):
+    def __init__(self, config_path="config.json", state_dir=None):
         self.running = True
         logger.info("🚗 Inițializare sistem AI Wash Guard...")
         
-        # 1. Config
-        self.config_mgr = ConfigManager()
-        self.cfg = self.config_mgr.config
+        # 1. Config (single shared store; the GUI reads it through the engine)
+        self.config_mgr = ConfigManager(config_path, state_dir)
+        # Log records are formatted and written on a background thread from here on
+        self._setup_logging()
+        # Thread caps must be in place before the model creates its thread pools
+        apply_thread_budget(self.config_mgr.get_performance_settings())
+        # Bays in alarm when the last run ended; their relays are cut again as soon as they exist
+        self._setup_bay_state()
         
         # 2. Hardcoded / Defaults for detection logic
         self.DETECTION_THRESHOLD = 2
         
+        # Held by the monitoring loop for one pass and by config changes, so a
+        # component is never swapped out in the middle of a frame
+        self._apply_lock = threading.RLock()
+        
         # Initial setup of components
         self._setup_components()
+        self._setup_journal()
+        self._setup_detection_log()
+        self._setup_live_server()
+        self._setup_supervisor()
+        self._setup_governor()
+        self._setup_camera_events()
+        self._setup_memory_guard()
         
         # Track detection state per camera
         self._reset_detection_states()
+        self._restore_bay_state()
+        
+        # Only the components touched by a config change are restarted
+        self.config_mgr.subscribe(self._on_config_changed)
+        self.config_mgr.start_watching()
 
     def _setup_components(self):
-        """Initialize or re-initialize all core components based on current config."""
-        cam_cfg = self.config_mgr.get_cameras()
-        email_cfg = self.config_mgr.get_email_settings()
-        db_cfg = self.config_mgr.get_mysql_settings()
+        """Initialize all core components based on current config."""
+        self._setup_relays()
+        self._setup_detector()
+        self._setup_cameras()
+        self._setup_notifier()
+        self._setup_db()
+        self._setup_snapshots()
+
+    def _setup_relays(self):
         hw_cfg = self.config_mgr.get_hardware_settings()
-        ai_cfg = self.cfg.get("ai", {"model": "yolov8n.pt", "confidence": 0.5})
-        
-        # Hardware
         relay_pins = hw_cfg["relay_pins"]
         if not hasattr(self, 'relays'):
             self.relays = RelayController(pins=relay_pins, active_low=hw_cfg["active_low"])
-        else:
-            if self.relays.pins != relay_pins:
-                logger.info("Pinii de releu s-au schimbat. Reinițializare hardware.")
-                self.relays.cleanup()
-                self.relays = RelayController(pins=relay_pins, active_low=hw_cfg["active_low"])
+            # Straight back to the last safe state, before the model loads or a frame arrives
+            restored = self._restored_relays()
+            if restored:
+                self.relays.set_relays(restored)
+        elif self.relays.pins != relay_pins or self.relays.active_low != hw_cfg["active_low"]:
+            logger.info("Configurația releelor s-a schimbat. Reinițializare hardware.")
+            self.relays.cleanup()
+            self.relays = RelayController(pins=relay_pins, active_low=hw_cfg["active_low"])
+            # Bays still in alarm keep their power cut on the new lines
+            self.relays.set_relays({
+                cam.get("id", i): True for i, cam in enumerate(self.active_cameras)
+                if self.detection_counters.get(cam['name'], 0) >= self.DETECTION_THRESHOLD
+            })
 
-        # AI
+    def _setup_detector(self):
+        ai_cfg = self.config_mgr.get_ai_settings()
         if not hasattr(self, 'detector'):
-            self.detector = AiDetector(model_path=ai_cfg["model"], confidence=ai_cfg["confidence"])
-        
-        # Cameras
+            self.detector = AiDetector(model_path=ai_cfg["model"], confidence=ai_cfg["confidence"],
+                                       remote=ai_cfg["remote"], imgsz=ai_cfg["imgsz"],
+                                       cascade=ai_cfg["cascade"])
+            # Bay pipelines share it: frames are batched, preprocessing overlaps inference
+            self.inference = PipelinedDetector(self.detector, ai_cfg["max_batch"])
+            return
+        self.inference.max_batch = max(1, int(ai_cfg["max_batch"]))
+        self.detector.set_confidence(ai_cfg["confidence"])
+        self.detector.set_imgsz(ai_cfg["imgsz"])
+        self.detector.set_remote(ai_cfg["remote"])
+        self.detector.set_cascade(ai_cfg["cascade"])
+        if getattr(self, 'governor', None):
+            self.governor.apply()  # Keep the current degradation level over the new settings
+        if self.detector.model_path != ai_cfg["model"]:
+            # The current model keeps serving until the new one is warmed up
+            self.detector.load_model_async(ai_cfg["model"], on_done=self._on_model_swap)
+
+    def _on_model_swap(self, ok, model_path, error):
+        if ok:
+            return
+        # Roll the config back to the model that is actually serving
+        ai_cfg = dict(self.config_mgr.get_ai_settings())
+        if ai_cfg["model"] == model_path:
+            logger.warning(f"Revenire la modelul {self.detector.model_path} în configurație.")
+            ai_cfg["model"] = self.detector.model_path
+            self.config_mgr.update_settings("ai", ai_cfg)
+
+    def _camera_configs(self):
+        return self.config_mgr.get_cameras()
+
+    def _setup_cameras(self):
+        cam_cfg = self._camera_configs()
+        capture_cfg = self.config_mgr.get_capture_settings()
+        max_fps = capture_cfg["max_fps"]
         self.active_cameras = [c for c in cam_cfg if c.get("enabled", True)]
-        if not hasattr(self, 'cameras'):
-            self.cameras = CameraManager(cam_cfg)
+        # "process": every camera (group) decodes in its own worker process
+        manager_cls = ProcessCameraManager if capture_cfg["mode"] == "process" else CameraManager
+        existing = getattr(self, 'cameras', None)
+        reloading = existing is not None
+        if existing is not None and (type(existing) is not manager_cls or (
+                manager_cls is ProcessCameraManager
+                and existing.cameras_per_process != capture_cfg["cameras_per_process"])):
+            logger.info(f"🎞️ Mod captură: {capture_cfg['mode']}")
+            existing.stop_all()
+            existing = None
+        if existing is None:
+            if manager_cls is ProcessCameraManager:
+                self.cameras = ProcessCameraManager.from_config(cam_cfg, capture_cfg)
+            else:
+                self.cameras = CameraManager(cam_cfg, max_fps=max_fps)
         else:
+            self.cameras.max_fps = max_fps
+            if manager_cls is ProcessCameraManager:
+                self.cameras.hang_s = capture_cfg["hang_s"]
             self.cameras.update_config(cam_cfg)
-        
-        # Notifier
+        if reloading:
+            if getattr(self, 'governor', None):
+                self.governor.apply()
+            if hasattr(self, 'camera_events'):
+                self._setup_camera_events()  # Listeners follow the camera list
+        self._check_relay_mapping()
+
+    def _check_relay_mapping(self):
+        n_pins = len(self.config_mgr.get_hardware_settings()["relay_pins"])
+        for i, cam in enumerate(self.active_cameras):
+            if cam.get("id", i) >= n_pins:
+                logger.warning(f"{cam['name']}: nu există pin de releu pentru indexul {cam.get('id', i)} "
+                               f"({n_pins} pini configurați).")
+
+    def _setup_notifier(self):
+        email_cfg = self.config_mgr.get_email_settings()
         if not hasattr(self, 'notifier'):
             self.notifier = EmailNotifier(email_cfg["sender"], email_cfg["app_password"], email_cfg["recipient"])
         else:
             self.notifier.update_credentials(email_cfg["sender"], email_cfg["app_password"], email_cfg["recipient"])
         self.email_enabled = email_cfg["enabled"]
-        
-        # Database
+        # Per-bay/global limits and digest, so a flapping bay cannot flood SMTP
+        alert_cfg = self.config_mgr.get_alert_settings()
+        if not hasattr(self, 'alerts'):
+            self.alerts = AlertDispatcher.from_config(self.notifier, alert_cfg)
+        else:
+            self.alerts.configure(alert_cfg["per_bay_per_hour"], alert_cfg["per_bay_burst"],
+                                  alert_cfg["global_per_hour"], alert_cfg["global_burst"],
+                                  alert_cfg["digest_window_s"])
+
+    def _setup_db(self):
+        db_cfg = self.config_mgr.get_mysql_settings()
         if not hasattr(self, 'db'):
             self.db = DatabaseManager(db_cfg["host"], db_cfg["user"], db_cfg["password"], db_cfg["database"])
-        else:
+        elif any(self.db.config[k] != db_cfg[k] for k in self.db.config):
             self.db.update_config(db_cfg["host"], db_cfg["user"], db_cfg["password"], db_cfg["database"])
         self.db_enabled = db_cfg["enabled"]
 
+    def _setup_snapshots(self):
+        # Evidence store (snapshots are encoded off the monitoring thread)
+        old = getattr(self, 'snapshots', None)
+        self.snapshots = SnapshotPipeline.from_config(self.config_mgr.get_evidence_settings())
+        if old:
+            old.shutdown()
+
+    def _setup_journal(self):
+        # Alarms, relay transitions and incidents are journaled first; DB and email
+        # are fed by sinks that replay whatever they missed during an outage
+        self.journal = EventJournal.from_config(self.config_mgr.get_journal_settings())
+        self.journal.add_sink("db", self._deliver_to_db)
+        self.journal.add_sink("email", self._deliver_to_email)
+
+    def _setup_detection_log(self):
+        # Everything the model sees, in batched columnar files for offline analysis
+        old = getattr(self, 'detection_log', None)
+        if old:
+            old.close()
+        cfg = self.config_mgr.get_detection_log_settings()
+        self.detection_log = DetectionLog.from_config(cfg) if cfg["enabled"] else None
+        if self.detector is not None:
+            self.detector.keep_others = self.detection_log is not None
+
+    def _setup_live_server(self):
+        # HTTP live view for phones; frames are encoded once per camera for all viewers
+        old = getattr(self, 'live_server', None)
+        if old:
+            old.stop()
+        live_cfg = self.config_mgr.get_live_settings()
+        self.live_server = LiveServer.from_config(self, live_cfg).start() if live_cfg["enabled"] else None
+
+    def _setup_supervisor(self):
+        cfg = self.config_mgr.get_pipeline_settings()
+        if not hasattr(self, 'supervisor'):
+            self.supervisor = PipelineSupervisor.from_config(self, cfg)
+        else:
+            self.supervisor.frame_timeout = cfg["frame_timeout_s"]
+            self.supervisor.stall_after = cfg["stall_after_s"]
+            self.supervisor.min_backoff, self.supervisor.max_backoff = cfg["backoff_min_s"], cfg["backoff_max_s"]
+
+    def _setup_governor(self):
+        # Steps down imgsz / FPS / idle-bay work while the Pi is hot or behind
+        old = getattr(self, 'governor', None)
+        cfg = self.config_mgr.get_thermal_settings()
+        enabled = cfg["enabled"] and self.detector is not None
+        if old:
+            # Still enabled: a hot Pi keeps its level instead of restarting at full settings
+            old.stop(restore=not enabled)
+        self.governor = None
+        if enabled:
+            governor = ThermalGovernor.from_config(self, cfg)
+            if old:
+                governor.level = min(old.level, len(governor.ladder))
+                governor.apply()
+            self.governor = governor.start()
+
+    def _setup_camera_events(self):
+        # Camera-side motion events let quiet bays run at idle_fps instead of full rate
+        old = getattr(self, 'camera_events', None)
+        if old:
+            old.stop()
+        cfg = self.config_mgr.get_camera_events_settings()
+        enabled = cfg["enabled"] and self.detector is not None
+        self.camera_events = CameraEventGate.from_config(self.active_cameras, cfg) if enabled else None
+
+    def _setup_memory_guard(self):
+        # RSS / per-component memory over months of uptime; SIGUSR1 logs the top allocation diffs
+        old = getattr(self, 'memory_guard', None)
+        cfg = self.config_mgr.get_memory_settings()
+        if old:
+            old.stop(stop_tracing=not cfg["tracemalloc"])
+        guard = MemoryGuard.from_config(cfg)
+
+        # Restarts run on the guard thread; the lock keeps them from racing a config reload
+        def restart_capture():
+            with self._apply_lock:
+                self.cameras.restart_all()
+
+        def restart_live():
+            with self._apply_lock:
+                self._setup_live_server()
+
+        if isinstance(self.cameras, CameraManager):
+            guard.register("capture", probe=lambda: self.cameras.memory_bytes(), restart=restart_capture)
+        if self.detector is not None:
+            guard.register("inference",
+                           restart=lambda: self.detector.load_model_async(self.detector.model_path, reload=True))
+        guard.register("live", restart=restart_live)
+        guard.register("detection_log",
+                       probe=lambda: self.detection_log.pending_bytes() if self.detection_log else 0)
+        self.memory_guard = guard.start()
+        if old is None:
+            # Bound once, from __init__ on the main thread (reloads run on the watcher thread,
+            # where signal handlers cannot be set); always reaches the current guard
+            guard.install_signal(handler=lambda *_: self.memory_guard.request_report())
+
+    def _setup_logging(self):
+        setup_logging(self.config_mgr.get_logging_settings())
+
+    def _setup_thread_budget(self):
+        # Thread counts apply immediately; threads already pinned keep their cores until restart
+        apply_thread_budget(self.config_mgr.get_performance_settings())
+
+    def _setup_bay_state(self):
+        self.bay_state = BayStateStore.from_config(self.config_mgr.get_state_settings())
+        self._restored_bays, self._last_alive = self.bay_state.load()
+
+    def _restored_relays(self):
+        """{relay id: True} for the restored bays that are still configured and enabled."""
+        cams = [c for c in self._camera_configs() if c.get("enabled", True)]
+        return {cam.get("id", i): True for i, cam in enumerate(cams) if cam["name"] in self._restored_bays}
+
+    def _restore_bay_state(self):
+        """Resume the bays that were in alarm and close, in one batch, the sessions the last run left open."""
+        active = {cam['name']: cam.get("id", i) for i, cam in enumerate(self.active_cameras)}
+        keep, relays = [], {}
+        for name, entry in self._restored_bays.items():
+            if name in active:
+                self.detection_counters[name] = self.DETECTION_THRESHOLD
+                self.session_ids[name] = entry["since"]
+                self.last_snapshots[name] = entry.get("snapshot")
+                keep.append([name, int(entry["since"])])
+                relays[active[name]] = True
+                logger.warning(f"♻️ {name}: alarmă restaurată (din {datetime.fromtimestamp(entry['since']):%H:%M:%S}), "
+                               f"curent oprit în continuare.")
+            else:
+                # Bay no longer configured: its session ends where the last run did
+                self.journal.append("alarm_end", bay=name, start_ts=entry["since"], ts=self._last_alive)
+        if relays:
+            self.journal.append("relays", changes=relays)
+        # Sessions still open in the DB that are not being resumed were cut short by the crash
+        self.journal.append("reconcile_sessions", keep=keep, end_ts=self._last_alive)
+        self._persist_bay_state()
+        self.bay_state.start()
+
+    def _persist_bay_state(self):
+        """Called on every alarm transition (under _apply_lock)."""
+        self.bay_state.save({name: {"since": since, "snapshot": self.last_snapshots.get(name)}
+                             for name, since in self.session_ids.items() if since is not None})
+
     def _reset_detection_states(self):
-        cam_cfg = self.config_mgr.get_cameras()
+        cam_cfg = self._camera_configs()
         self.detection_counters = {cam['name']: 0 for cam in cam_cfg}
         self.session_ids = {cam['name']: None for cam in cam_cfg}
+        self.last_snapshots = {cam['name']: None for cam in cam_cfg}
+
+    def _sync_detection_states(self, changed_names):
+        """Keep bay state for cameras that still exist; release bays that were removed or disabled."""
+        active = {cam['name']: (i, cam) for i, cam in enumerate(self.active_cameras)}
+        for name in list(self.detection_counters):
+            if name in active:
+                continue
+            if self.detection_counters[name] >= self.DETECTION_THRESHOLD:
+                logger.info(f"Boxa {name} a fost eliminată/dezactivată. Reluare curent.")
+            if self.session_ids.get(name) is not None:
+                # Through the journal like any alarm end; session_ids holds the start time, not a row id
+                self.journal.append("alarm_end", bay=name, start_ts=self.session_ids[name])
+            for dct in (self.detection_counters, self.session_ids, self.last_snapshots):
+                dct.pop(name, None)
+        self._persist_bay_state()
+        for name, (i, cam) in active.items():
+            self.detection_counters.setdefault(name, 0)
+            self.session_ids.setdefault(name, None)
+            self.last_snapshots.setdefault(name, None)
+
+        # Relays of bays that left the active set go back to OFF
+        active_relays = {cam.get("id", i) for i, cam in active.values()}
+        self.relays.set_relays({idx: False for idx in range(len(self.relays.pins))
+                                if idx not in active_relays})
+
+    _SECTION_HANDLERS = {
+        "cameras": "_setup_cameras",
+        "capture": "_setup_cameras",
+        "hardware": "_setup_relays",
+        "ai": "_setup_detector",
+        "email": "_setup_notifier",
+        "alerts": "_setup_notifier",
+        "mysql": "_setup_db",
+        "evidence": "_setup_snapshots",
+        "performance": "_setup_thread_budget",
+        "live": "_setup_live_server",
+        "pipeline": "_setup_supervisor",
+        "detection_log": "_setup_detection_log",
+        "thermal": "_setup_governor",
+        "logging": "_setup_logging",
+        "camera_events": "_setup_camera_events",
+        "memory": "_setup_memory_guard",
+    }
+
+    def _on_config_changed(self, diff):
+        """Restart only the components whose config section changed; bay state is preserved."""
+        with self._apply_lock:
+            for section in diff:
+                handler = self._SECTION_HANDLERS.get(section)
+                if handler:
+                    logger.info(f"♻️ Reaplicare componentă: {section} ({', '.join(sorted(diff[section]))})")
+                    getattr(self, handler)()
+            if "cameras" in diff:
+                self._sync_detection_states(diff["cameras"])
 
     def reload_config(self):
-        """Method called by GUI after saving settings."""
+        """Re-read config.json now (normally the file watcher does this on its own)."""
         logger.info("🔄 Reîncărcare configurație sistem...")
-        self.config_mgr.load()
-        self.cfg = self.config_mgr.config
-        self._setup_components()
-        self._reset_detection_states()
+        self.config_mgr.reload()
+
+    def get_status(self):
+        """Engine metrics in one place (live view /status.json, diagnostics)."""
+        bays = {name: {"count": count, "alarm": count >= self.DETECTION_THRESHOLD,
+                       "last_snapshot": self.last_snapshots.get(name)}
+                for name, count in list(self.detection_counters.items())}
+        status = {"time": time.time(), "bays": bays, "relays": self.relays.get_stats(),
+                  "journal": self.journal.get_stats()}
+        if getattr(self, 'alerts', None):
+            status["alerts"] = self.alerts.get_stats()
+        if self.detector is not None:
+            status["detector"] = {"model": self.detector.model_path, "swap": self.detector.swap_status,
+                                  "remote": self.detector.remote_stats, "batching": self.inference.get_stats(),
+                                  "cascade": self.detector.get_cascade_stats()}
+        status["logging"] = get_log_stats()
+        if getattr(self, 'memory_guard', None):
+            status["memory"] = self.memory_guard.get_status()
+        if isinstance(self.cameras, ProcessCameraManager):
+            status["decode_workers"] = self.cameras.get_stats()
+        if getattr(self, 'camera_events', None):
+            status["camera_events"] = self.camera_events.get_status()
+        if getattr(self, 'governor', None):
+            status["thermal"] = self.governor.get_status()
+        if getattr(self, 'detection_log', None):
+            status["detection_log"] = self.detection_log.get_stats()
+        if getattr(self, 'live_server', None):
+            status["live"] = self.live_server.get_stats()
+        if hasattr(self, 'supervisor'):
+            status["pipelines"] = self.supervisor.get_status()
+        return status
 
     def monitoring_loop(self):
-        """Background thread for AI monitoring."""
+        """Supervises one detection pipeline per active camera (see pipeline.py)."""
         logger.info("🛰️ Buclă de monitorizare pornită (fundal).")
-        heartbeat_timer = time.time()
-        
-        try:
-            while self.running:
-                # Heartbeat every 30s
-                if time.time() - heartbeat_timer > 30:
-                    logger.info("💓 Heartbeat monitorizare: activ.")
-                    heartbeat_timer = time.time()
-
-                if not self.active_cameras:
-                    time.sleep(1)
-                    continue
+        self.supervisor.run(lambda: self.running)
 
-                frames = self.cameras.get_latest_frames()
-                
-                for i, cam in enumerate(self.active_cameras):
-                    cam_name = cam['name']
-                    frame = frames.get(cam_name)
-                    if frame is None: continue
+    def _process_bay(self, cam, index, frame):
+        """Detection on one new frame of one bay; runs on that bay's pipeline thread."""
+        cam_name = cam['name']
+        relay_id = cam.get("id", index)
+        idle = self.detection_counters.get(cam_name, 0) == 0
+        if self.camera_events and not self.camera_events.should_process(cam_name, idle):
+            return  # Quiet bay: the camera reported no motion, idle-rate slot not due
+        governor = self.governor
+        if governor and not governor.should_process(cam_name, frame, idle):
+            return  # Idle bay, nothing moved: skipped while the governor saves work
+        # Outside the lock so bays waiting on inference at the same time share one batch
+        t0 = time.perf_counter()
+        detections = self.inference.detect_objects(frame)
+        if governor:
+            governor.record_latency((time.perf_counter() - t0) * 1000)
+        if self.detection_log is not None:
+            self.detection_log.add(time.time(), cam_name, detections)
+        with self._apply_lock:
+            relay_change = None
+            count = self.detection_counters.setdefault(cam_name, 0)
+            was_alarm = count >= self.DETECTION_THRESHOLD
+            
+            if detections:
+                count = self.detection_counters[cam_name] = count + 1
+                if count >= self.DETECTION_THRESHOLD:
+                    relay_change = True
                     
-                    detected = self.detector.detect(frame)
-                    
-                    if detected:
-                        self.detection_counters[cam_name] += 1
-                        if self.detection_counters[cam_name] >= self.DETECTION_THRESHOLD:
-                            relay_idx = cam.get("id", i)
-                            self.relays.set_relay(relay_idx, True)
-                            
-                            if self.detection_counters[cam_name] == self.DETECTION_THRESHOLD:
-                                logger.error(f"!!! ALARMĂ {cam_name} !!! - Vehicul Interzis.")
-                                if self.email_enabled:
-                                    # Pass the triggering frame to the email
-                                    self.notifier.send_alert(cam_name, "Vehicul Interzis (ATV/Cross)", frame=frame)
-                                if self.db_enabled:
-                                    self.session_ids[cam_name] = self.db.start_session(cam_name)
-                                    self.db.log_incident(cam_name, "Vehicul Interzis (ATV/Cross)")
-                    else:
-                        if self.detection_counters.get(cam_name, 0) > 0:
-                            logger.info(f"Reluare curent {cam_name}. Zonă liberă.")
-                            relay_idx = cam.get("id", i)
-                            self.relays.set_relay(relay_idx, False)
-                            
-                            if self.db_enabled and self.session_ids.get(cam_name) is not None:
-                                self.db.end_session(self.session_ids[cam_name])
-                                self.session_ids[cam_name] = None
-                                
-                        self.detection_counters[cam_name] = 0
-                
-                time.sleep(0.01)
-                
-        except Exception as e:
-            logger.error(f"Eroare în bucla de monitorizare: {e}")
+                    if count == self.DETECTION_THRESHOLD:
+                        self._on_alarm_start(cam_name, frame, detections)
+            else:
+                if count > 0:
+                    logger.info("Reluare curent %s. Zonă liberă.", cam_name, extra={"rate_key": False})
+                    relay_change = False
+                    self._on_alarm_end(cam_name, was_alarm)
+                        
+                self.detection_counters[cam_name] = 0
+
+            # Unchanged relays are skipped by the controller; only real transitions are journaled
+            if relay_change is not None:
+                self.relays.set_relays({relay_id: relay_change})
+                if (relay_change and count == self.DETECTION_THRESHOLD) or (not relay_change and was_alarm):
+                    self.journal.append("relays", changes={relay_id: relay_change})
+
+    def _on_alarm_start(self, cam_name, frame, detections):
+        """Side effects of a new alarm: snapshot, then the journal events for email and DB."""
+        logger.error("!!! ALARMĂ %s !!! - Vehicul Interzis.", cam_name)
+        # Encoded once, off this thread; email, DB and dashboard share the file
+        image_path, _ = self.snapshots.submit(
+            cam_name, frame, detections[0].box if detections else None)
+        self._log_alarm(cam_name, image_path)
+
+    def _log_alarm(self, cam_name, image_path):
+        started = time.time()
+        self.last_snapshots[cam_name] = image_path
+        # The start time identifies the session until the DB sink has stored it
+        self.session_ids[cam_name] = started
+        log_event(logger, "alarm_start", limit=False, bay=cam_name, image=image_path)
+        self.journal.append("alarm_start", bay=cam_name, ts=started)
+        self.journal.append("incident", bay=cam_name, vehicle=VEHICLE_LABEL, image_path=image_path, ts=started)
+        self._persist_bay_state()
+
+    def _on_alarm_end(self, cam_name, was_alarm):
+        started = self.session_ids.get(cam_name)
+        if started is not None:
+            log_event(logger, "alarm_end", limit=False, bay=cam_name, duration_s=round(time.time() - started, 1))
+            self.journal.append("alarm_end", bay=cam_name, start_ts=started)
+            self.session_ids[cam_name] = None
+            self._persist_bay_state()
+
+    # ── Journal sinks (own threads; False = retry later) ─────────────────────
+    def _deliver_to_db(self, event):
+        if not self.db_enabled or event["type"] not in ("alarm_start", "alarm_end", "incident", "reconcile_sessions"):
+            return True
+        if event["type"] == "reconcile_sessions":
+            keep = [(bay, datetime.fromtimestamp(ts)) for bay, ts in event["keep"]]
+            end = datetime.fromtimestamp(int(event["end_ts"])) if event.get("end_ts") else None
+            return self.db.close_dangling_sessions(keep, end)
+        # DATETIME columns keep whole seconds; replays must produce the same key
+        when = datetime.fromtimestamp(int(event["ts"]))
+        if event["type"] == "incident":
+            return self.db.log_incident(event["bay"], event["vehicle"], event.get("image_path"), timestamp=when)
+        start = datetime.fromtimestamp(int(event.get("start_ts", event["ts"])))
+        session_id = self.db.start_session(event["bay"], start)
+        if event["type"] == "alarm_start":
+            return session_id is not None
+        return self.db.end_session(session_id, when)
+
+    def _deliver_to_email(self, event):
+        if not self.email_enabled or event["type"] != "incident":
+            return True
+        image_path = event.get("image_path")
+        # The snapshot is written by the encoder pool right after the alarm
+        while image_path and not os.path.exists(image_path) and time.time() < event["ts"] + 10:
+            time.sleep(0.2)
+        if image_path and not os.path.exists(image_path):
+            image_path = None
+        return self.alerts.submit(event["bay"], event["vehicle"], image_path=image_path, when=event["ts"])
 
     def stop(self, *args):
         logger.info("🛑 Proces de oprire... Vă rugăm așteptați.")
         self.running = False
+        self.config_mgr.stop_watching()
+        if getattr(self, 'live_server', None): self.live_server.stop()
         if hasattr(self, 'cameras'): self.cameras.stop_all()
+        if hasattr(self, 'snapshots'): self.snapshots.shutdown()
+        if hasattr(self, 'supervisor'): self.supervisor.stop_all()
+        if getattr(self, 'governor', None): self.governor.stop(restore=False)
+        if getattr(self, 'camera_events', None): self.camera_events.stop()
+        if getattr(self, 'memory_guard', None): self.memory_guard.stop()
+        if getattr(self, 'inference', None): self.inference.stop()
+        if hasattr(self, 'journal'): self.journal.close()
+        if getattr(self, 'detection_log', None): self.detection_log.close()
+        if hasattr(self, 'alerts'): self.alerts.stop()
+        if getattr(self, 'bay_state', None): self.bay_state.stop()
         if hasattr(self, 'relays'): self.relays.cleanup()
         if hasattr(self, 'db'): self.db.close()
+        shutdown_logging()
         sys.exit(0)
 
+class ClusterWorkerEngine(AIWashGuard):
+    """
+    Cluster worker: runs cameras and detection for the bays the coordinator assigns.
+    Relay commands and alarms are forwarded; email, DB and evidence live on the coordinator.
+    """
+    def __init__(self, coordinator_address, node_id, capacity, config_path="config.json", state_dir=None):
+        self.assigned_cameras = []
+        self._last_thumbs = 0.0
+        # Alarm messages the coordinator has not received yet, in order; resent after a reconnect
+        self._unsent = []
+        self._unsent_lock = threading.Lock()
+        self._reconnected = False
+        self.link = CoordinatorLink(coordinator_address, node_id, capacity,
+                                    on_assign=self._on_assign, status_provider=self._cluster_status,
+                                    on_connect=self._on_link_connected)
+        # Own journal, logs and detections even when sharing a directory and config.json
+        # with the coordinator and other workers (local loopback test)
+        super().__init__(config_path, state_dir or os.path.join("nodes", node_id))
+        self.link.start()
+
+    def _camera_configs(self):
+        return self.assigned_cameras
+
+    def _check_relay_mapping(self):
+        pass  # Relay pins belong to the coordinator
+
+    def _setup_journal(self):
+        # Local record only: DB and email are fed by the coordinator's journal
+        self.journal = EventJournal.from_config(self.config_mgr.get_journal_settings())
+
+    def _setup_bay_state(self):
+        # Alarm state is the coordinator's; it comes back with the assignment (alarm_state)
+        self.bay_state, self._restored_bays, self._last_alive = None, {}, None
+
+    def _restore_bay_state(self):
+        pass
+
+    def _persist_bay_state(self):
+        pass
+
+    def _setup_relays(self):
+        self.relays = RemoteRelays(self.link)
+
+    def _setup_notifier(self):
+        self.email_enabled = False
+
+    def _setup_db(self):
+        self.db_enabled = False
+
+    def _setup_snapshots(self):
+        # Encode only; the coordinator stores the bytes without re-encoding
+        cfg = self.config_mgr.get_evidence_settings()
+        self.snapshots = SnapshotPipeline(None, cfg["format"], cfg["quality"], cfg["max_width"],
+                                          cfg["crop_margin"], cfg["workers"])
+
+    def _on_assign(self, msg):
+        with self._apply_lock:
+            new_config = self.config_mgr.snapshot()
+            new_config["ai"] = msg["ai"]
+            new_config["capture"] = msg["capture"]
+            self.config_mgr.apply(new_config, persist=False)
+
+            self.assigned_cameras = msg["cameras"]
+            self._setup_cameras()
+            self._sync_detection_states(set(c["name"] for c in self.assigned_cameras))
+            taken_over = {}
+            for cam in self.assigned_cameras:
+                if msg["alarm_state"].get(cam["name"]):
+                    self.detection_counters[cam["name"]] = self.DETECTION_THRESHOLD
+                    taken_over[cam["id"]] = True
+            self.relays.set_initial(taken_over)
+            if self._reconnected:
+                # Whatever was lost while the coordinator was unreachable, for the bays still ours
+                self._reconnected = False
+                self.relays.resync([cam["id"] for cam in self.assigned_cameras])
+                self._flush_unsent()
+        logger.info(f"📦 Camere alocate: {', '.join(c['name'] for c in self.assigned_cameras) or '-'}")
+
+    def _on_link_connected(self):
+        self._reconnected = True
+
+    def _send_event(self, msg):
+        with self._unsent_lock:
+            # Behind anything still queued, so the coordinator sees start/end in order
+            if self._unsent or not self.link.send(msg):
+                self._unsent.append(msg)
+
+    def _flush_unsent(self):
+        names = {cam["name"] for cam in self.assigned_cameras}
+        with self._unsent_lock:
+            # Bays that moved to another node are reported by their new owner
+            pending = [msg for msg in self._unsent if msg["camera"] in names]
+            while pending and self.link.send(pending[0]):
+                pending.pop(0)
+            self._unsent = pending
+
+    def _on_alarm_start(self, cam_name, frame, detections):
+        logger.error(f"!!! ALARMĂ {cam_name} !!! - Vehicul Interzis.")
+
+        def forward(data, ext):
+            self._send_event({"type": "alarm_start", "camera": cam_name, "ext": ext,
+                              "image": base64.b64encode(data).decode() if data else None})
+
+        future = self.snapshots.encode_async(frame, detections[0].box if detections else None, forward)
+        # Report the alarm even if encoding fails
+        future.add_done_callback(lambda f: f.exception() and forward(None, ".jpg"))
+
+    def _on_alarm_end(self, cam_name, was_alarm):
+        if was_alarm:
+            self._send_event({"type": "alarm_end", "camera": cam_name})
+
+    def _cluster_status(self):
+        bays = {name: {"count": count, "alarm": count >= self.DETECTION_THRESHOLD}
+                for name, count in list(self.detection_counters.items())}
+        status = {"bays": bays}
+        now = time.monotonic()
+        if now - self._last_thumbs >= 2.0:
+            self._last_thumbs = now
+            thumbs = {}
+            for name, frame in self.cameras.get_latest_frames().items():
+                if frame is None:
+                    continue
+                h, w = frame.shape[:2]
+                small = cv2.resize(frame, (320, int(320 * h / w)), interpolation=cv2.INTER_AREA)
+                ok, buf = cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, 60])
+                if ok:
+                    thumbs[name] = base64.b64encode(buf.tobytes()).decode()
+            status["thumbs"] = thumbs
+        return status
+
+    def stop(self, *args):
+        self.link.stop()
+        super().stop(*args)
+
+
+class ClusterCoordinatorEngine(AIWashGuard):
+    """
+    Cluster coordinator: owns relays, email, DB, evidence and the dashboard.
+    No local cameras or inference; bays are assigned to worker nodes.
+    """
+    def __init__(self, port, config_path="config.json", state_dir=None):
+        self.cluster_port = port
+        super().__init__(config_path, state_dir)
+
+    def _setup_detector(self):
+        self.detector = None
+
+    def _setup_cameras(self):
+        cam_cfg = self._camera_configs()
+        self.active_cameras = [c for c in cam_cfg if c.get("enabled", True)]
+        if not hasattr(self, 'cameras'):
+            cluster_cfg = self.config_mgr.get_cluster_settings()
+            # The coordinator doubles as the dashboard's camera source (worker thumbnails)
+            self.cameras = ClusterCoordinator(
+                self.config_mgr, on_relays=self._on_remote_relays,
+                on_alarm_start=self._on_remote_alarm_start, on_alarm_end=self._on_remote_alarm_end,
+                on_status=self._on_remote_status, port=self.cluster_port,
+                heartbeat_timeout=cluster_cfg["heartbeat_timeout"])
+            # Alarms restored from the last run go out with the first assignment, so the
+            # worker taking the bay sends the relay back on once the bay is clear
+            for name in self._restored_bays:
+                self.cameras.bay_status[name] = {"alarm": True}
+            self.cameras.start()
+        self._check_relay_mapping()
+
+    def monitoring_loop(self):
+        logger.info("🛰️ Coordonator activ; detecția rulează pe nodurile worker.")
+        while self.running:
+            time.sleep(30)
+            status = self.cameras.get_status()
+            logger.info(f"💓 Cluster: {len(status['nodes'])} noduri, {len(status['assignment'])} camere alocate.")
+
+    def get_status(self):
+        status = super().get_status()
+        status["cluster"] = self.cameras.get_status()
+        return status
+
+    def _on_remote_relays(self, changes):
+        with self._apply_lock:
+            self.relays.set_relays(changes)
+            self.journal.append("relays", changes=changes)
+
+    def _on_remote_status(self, cam_name, count):
+        self.detection_counters[cam_name] = count
+
+    def _on_remote_alarm_start(self, cam_name, data, ext):
+        logger.error(f"!!! ALARMĂ {cam_name} !!! - Vehicul Interzis (raportat de nod).")
+        with self._apply_lock:
+            image_path = None
+            if data:
+                image_path, _ = self.snapshots.submit_encoded(cam_name, data, ext)
+            self._log_alarm(cam_name, image_path)
+
+    def _on_remote_alarm_end(self, cam_name):
+        logger.info(f"Reluare curent {cam_name}. Zonă liberă.")
+        with self._apply_lock:
+            self._on_alarm_end(cam_name, True)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="AI Wash Guard")
+    parser.add_argument("--settings", action="store_true", help="Deschide doar fereastra de setări")
+    parser.add_argument("--coordinator", action="store_true", help="Rulează ca coordonator de cluster")
+    parser.add_argument("--worker", metavar="HOST:PORT", help="Rulează ca nod worker conectat la coordonator")
+    parser.add_argument("--port", type=int, help="Port coordonator (implicit din config: cluster.port)")
+    parser.add_argument("--node-id", default=socket.gethostname(), help="Identificator nod worker")
+    parser.add_argument("--capacity", type=int, help="Număr maxim de camere pentru acest nod")
+    parser.add_argument("--headless", action="store_true", help="Fără interfață grafică")
+    parser.add_argument("--config", default="config.json", help="Fișier de configurare")
+    parser.add_argument("--state-dir", help="Director pentru jurnal, loguri, detecții și starea boxelor "
+                                            "(implicit: directorul curent; worker: nodes/<node-id>)")
+    return parser.parse_args()
+
+def run_headless(engine):
+    signal.signal(signal.SIGINT, engine.stop)
+    signal.signal(signal.SIGTERM, engine.stop)
+    engine.monitoring_loop()
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.settings:
+        SettingsApp().mainloop()
+        sys.exit(0)
     try:
-        engine = AIWashGuard()
+        cluster_cfg = ConfigManager(args.config).get_cluster_settings() if (args.worker or args.coordinator) else None
+        if args.worker:
+            engine = ClusterWorkerEngine(args.worker, args.node_id, args.capacity or cluster_cfg["capacity"],
+                                         args.config, args.state_dir)
+            run_headless(engine)  # Workers have no screen; the coordinator shows all bays
+        elif args.coordinator:
+            engine = ClusterCoordinatorEngine(args.port or cluster_cfg["port"], args.config, args.state_dir)
+        else:
+            engine = AIWashGuard(args.config, args.state_dir)
+        if args.headless:
+            run_headless(engine)
         
         logger.info("⚙️ Motorul de monitorizare pornește...")
         monitor_thread = threading.Thread(target=engine.monitoring_loop, daemon=True)
@@ -172,6 +812,7 @@ if __name__ == "__main__":
         signal.signal(signal.SIGINT, engine.stop)
         signal.signal(signal.SIGTERM, engine.stop)
         
+        pin_current_thread("ui")
         app.mainloop()
     except Exception as e:
         import tkinter as tk
@@ -0,0 +1,303 @@
+"""
+memory_guard.py - Memory instrumentation and leak guard for months-long runs
+Samples the process RSS (from /proc) every `interval_s`, together with the
+bytes each registered component reports holding and, when `tracemalloc` is on,
+traced Python/numpy allocations grouped by the subsystem (source module) that
+made them. Crossing `rss_warn_mb` logs a diagnostic report; crossing
+`rss_limit_mb` or a per-subsystem `limits_mb` entry also restarts the offending
+component when `restart` is on (with a cooldown), then returns freed heap to
+the OS.
+
+Top allocation diffs on demand:
+    kill -USR1 <pid>                         report in the log
+    curl http://<pi>:8080/memory.txt         live view endpoint
+"""
+
+import os
+import gc
+import time
+import signal
+import ctypes
+import ctypes.util
+import logging
+import threading
+import tracemalloc
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+_REPO = os.path.dirname(os.path.abspath(__file__))
+
+# Source module -> subsystem, for tracemalloc attribution
+SUBSYSTEMS = {
+    "camera_manager": "capture", "camera_process": "capture",
+    "ai_detector": "inference", "preprocess": "inference", "pipeline": "inference",
+    "evidence_store": "evidence", "live_server": "live",
+    "event_journal": "journal", "detection_log": "detection_log",
+    "notifier": "alerts", "database": "db", "log_setup": "logging",
+    "camera_events": "camera_events", "cluster": "cluster", "memory_guard": "memory_guard",
+}
+
+
+def read_proc_memory():
+    """(rss_mb, peak_rss_mb) of this process, (None, None) without /proc."""
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    key, kb = line.split()[:2]
+                    values[key] = int(kb) / 1024.0
+    except OSError:
+        pass
+    return values.get("VmRSS:"), values.get("VmHWM:")
+
+
+def malloc_trim():
+    """Hand freed glibc heap back to the OS (RSS stays high after a big free otherwise)."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6")
+        return bool(libc.malloc_trim(0))
+    except (OSError, AttributeError):
+        return False
+
+
+def subsystem_of(filename):
+    path = os.path.abspath(filename)
+    if not path.startswith(_REPO + os.sep):
+        return None
+    rel = os.path.relpath(path, _REPO)
+    if rel.startswith("gui" + os.sep):
+        return "ui"
+    return SUBSYSTEMS.get(os.path.splitext(rel)[0], "other")
+
+
+class MemoryGuard:
+    """
+    `register(name, probe, restart)`: `probe()` returns the bytes the component
+    holds (frames, buffers), `restart()` rebuilds it. Both are optional; a
+    subsystem without a probe is measured through tracemalloc only.
+    """
+    def __init__(self, interval_s=60.0, rss_warn_mb=1500, rss_limit_mb=0, limits_mb=None,
+                 tracemalloc_on=False, tracemalloc_frames=10, restart=False, restart_cooldown_s=900, top=15):
+        self.interval = interval_s
+        self.rss_warn_mb = rss_warn_mb
+        self.rss_limit_mb = rss_limit_mb
+        self.limits_mb = dict(limits_mb or {})
+        self.tracemalloc_frames = max(1, int(tracemalloc_frames))
+        self.restart_enabled = restart
+        self.restart_cooldown = restart_cooldown_s
+        self.top = top
+        self._components = {}  # name -> (probe, restart)
+        self._subsystem_cache = {}  # traceback -> subsystem
+        self._baseline = None  # First sample
+        self._last_snapshot = None  # tracemalloc snapshot the next report diffs against
+        self._warned = False
+        self._last_restart = {}
+        self.restarts = {}
+        self.history = deque(maxlen=1440)  # (time, rss_mb)
+        self.latest = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._report_requested = False
+        self._stop = threading.Event()
+        self._thread = None
+        self.tracing = False
+        if tracemalloc_on:
+            self._start_tracing()
+
+    @classmethod
+    def from_config(cls, cfg):
+        return cls(cfg["interval_s"], cfg["rss_warn_mb"], cfg["rss_limit_mb"], cfg["limits_mb"],
+                   cfg["tracemalloc"], cfg["tracemalloc_frames"], cfg["restart"],
+                   cfg["restart_cooldown_s"], cfg["top"])
+
+    def _start_tracing(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+            logger.info(f"🧠 tracemalloc activ ({self.tracemalloc_frames} cadre de stivă).")
+        self.tracing = True
+        self._last_snapshot = self._snapshot()
+
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+
+    def register(self, name, probe=None, restart=None):
+        self._components[name] = (probe, restart)
+
+    # ── Sampling ─────────────────────────────────────────────────────────────
+    def _by_subsystem(self, snapshot):
+        sizes = {}
+        cache = self._subsystem_cache
+        for trace in snapshot.traces:
+            tb = trace.traceback
+            name = cache.get(tb)
+            if name is None:
+                # Innermost frame inside this repo decides (numpy/torch allocations count for their caller)
+                name = next((s for s in (subsystem_of(f.filename) for f in reversed(tb)) if s), "extern")
+                if len(cache) < 200000:
+                    cache[tb] = name
+            sizes[name] = sizes.get(name, 0) + trace.size
+        return sizes
+
+    def sample(self):
+        rss, hwm = read_proc_memory()
+        components = {}
+        for name, (probe, _) in list(self._components.items()):
+            if probe is None:
+                continue
+            try:
+                components[name] = probe() / 1048576.0
+            except Exception as e:
+                logger.debug(f"Sondă memorie {name}: {e}")
+        traced = {}
+        if self.tracing:
+            traced = {k: v / 1048576.0 for k, v in self._by_subsystem(self._snapshot()).items()}
+        sample = {"time": time.time(), "rss_mb": rss, "peak_rss_mb": hwm,
+                  "components_mb": components, "traced_mb": traced}
+        with self._lock:
+            if self._baseline is None:
+                self._baseline = sample
+            self.latest = sample
+            if rss is not None:
+                self.history.append((sample["time"], rss))
+        return sample
+
+    def growth_mb_per_hour(self):
+        if len(self.history) < 2:
+            return None
+        (t0, r0), (t1, r1) = self.history[0], self.history[-1]
+        # Under 10 minutes the rate is mostly start-up noise (model load, first frames)
+        return (r1 - r0) / ((t1 - t0) / 3600.0) if t1 - t0 >= 600 else None
+
+    def _usage(self, sample, name):
+        """MB attributed to `name`: its probe if it has one, otherwise tracemalloc."""
+        if name in sample["components_mb"]:
+            return sample["components_mb"][name]
+        return sample["traced_mb"].get(name)
+
+    def _growth(self, sample, name):
+        now, start = self._usage(sample, name), self._usage(self._baseline, name)
+        return now - (start or 0.0) if now is not None else None
+
+    # ── Reports ──────────────────────────────────────────────────────────────
+    def report(self, sample=None):
+        """Text report: RSS, per-component/subsystem usage and growth, top allocation diffs."""
+        sample = sample or self.sample()
+        rss, base = sample["rss_mb"], self._baseline["rss_mb"]
+        lines = [f"🧠 Memorie: RSS {rss or 0:.0f} MB (vârf {sample['peak_rss_mb'] or 0:.0f} MB, "
+                 f"{(rss or 0) - (base or 0):+.0f} MB de la pornire"
+                 + (f", {self.growth_mb_per_hour():+.1f} MB/h" if self.growth_mb_per_hour() is not None else "")
+                 + ")"]
+        for title, key in (("Componente", "components_mb"), ("Subsisteme (tracemalloc)", "traced_mb")):
+            if sample[key]:
+                lines.append(f"  {title}:")
+                for name, mb in sorted(sample[key].items(), key=lambda kv: -kv[1]):
+                    lines.append(f"    {name:<16}{mb:>9.1f} MB  ({mb - self._baseline[key].get(name, 0.0):+.1f})")
+        if self.tracing:
+            snapshot = self._snapshot()
+            with self._lock:
+                previous, self._last_snapshot = self._last_snapshot, snapshot
+            lines.append(f"  Top {self.top} alocări (diferență față de raportul anterior):")
+            for stat in snapshot.compare_to(previous, "lineno")[:self.top]:
+                frame = stat.traceback[-1]
+                where = os.path.relpath(frame.filename, _REPO) if subsystem_of(frame.filename) else frame.filename
+                lines.append(f"    {stat.size_diff / 1024:>+10.0f} KB  {stat.count_diff:>+7}  {where}:{frame.lineno}")
+        else:
+            lines.append("  (memory.tracemalloc oprit: fără detalii pe linii de cod)")
+        return "\n".join(lines)
+
+    def request_report(self, *_):
+        """Signal-safe: the guard thread writes the report (SIGUSR1 handler)."""
+        self._report_requested = True
+        self._wake.set()
+
+    def install_signal(self, signum=getattr(signal, "SIGUSR1", None), handler=None):
+        """Main thread only; `handler` lets the owner forward to whichever guard is current."""
+        if signum is None or threading.current_thread() is not threading.main_thread():
+            return False
+        signal.signal(signum, handler or self.request_report)
+        return True
+
+    # ── Thresholds ───────────────────────────────────────────────────────────
+    def _restart(self, name, reason):
+        _, restart = self._components.get(name, (None, None))
+        now = time.monotonic()
+        if restart is None or not self.restart_enabled:
+            return False
+        if now - self._last_restart.get(name, -self.restart_cooldown) < self.restart_cooldown:
+            return False
+        self._last_restart[name] = now
+        self.restarts[name] = self.restarts.get(name, 0) + 1
+        logger.warning(f"♻️ Repornire {name} ({reason}).")
+        try:
+            restart()
+        except Exception as e:
+            logger.error(f"Repornire {name} eșuată: {e}")
+        gc.collect()
+        malloc_trim()
+        return True
+
+    def check(self, sample):
+        rss = sample["rss_mb"]
+        for name, limit in self.limits_mb.items():
+            used = self._usage(sample, name)
+            if limit and used is not None and used > limit:
+                logger.warning(f"⚠️ {name}: {used:.0f} MB > limita {limit} MB\n{self.report(sample)}")
+                self._restart(name, f"{used:.0f} MB > {limit} MB")
+
+        if rss is None:
+            return
+        if self.rss_warn_mb and rss > self.rss_warn_mb and not self._warned:
+            self._warned = True
+            logger.warning(f"⚠️ RSS peste pragul de avertizare ({self.rss_warn_mb} MB)\n{self.report(sample)}")
+        elif self._warned and rss < 0.9 * self.rss_warn_mb:
+            self._warned = False
+        if self.rss_limit_mb and rss > self.rss_limit_mb:
+            # The restartable component that grew most since start is the likely leak
+            growth = {name: self._growth(sample, name) for name, (_, restart) in self._components.items()
+                      if restart is not None}
+            growth = {k: v for k, v in growth.items() if v is not None and v > 0}
+            reason = f"RSS {rss:.0f} MB > {self.rss_limit_mb} MB"
+            if not growth or not self._restart(max(growth, key=growth.get), reason):
+                gc.collect()
+                malloc_trim()
+
+    # ── Thread ───────────────────────────────────────────────────────────────
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                if self._report_requested:
+                    self._report_requested = False
+                    logger.info(self.report())
+                    continue
+                sample = self.sample()
+                logger.debug(f"Memorie: RSS {sample['rss_mb']} MB, componente {sample['components_mb']}")
+                self.check(sample)
+            except Exception as e:
+                logger.error(f"Eroare monitor memorie: {e}")
+
+    def start(self):
+        self.sample()  # Baseline
+        self._thread = threading.Thread(target=self._run, daemon=True, name="memory-guard")
+        self._thread.start()
+        return self
+
+    def stop(self, stop_tracing=True):
+        self._stop.set()
+        self._wake.set()
+        if stop_tracing and self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+    def get_status(self):
+        with self._lock:
+            sample = dict(self.latest)
+        growth = self.growth_mb_per_hour()
+        return dict(sample, growth_mb_h=round(growth, 2) if growth is not None else None,
+                    tracemalloc=self.tracing, restarts=dict(self.restarts))
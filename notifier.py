@@ -2,12 +2,14 @@
 notifier.py - Email notification service using Gmail SMTP
 """
 
+import os
+import time
 import smtplib
 import logging
+import threading
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.image import MIMEImage
-import cv2
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
@@ -29,12 +31,15 @@ class EmailNotifier:
         self.recipient_email = recipient
         logger.info("Email credentials updated.")
 
-    def send_alert(self, bay_name, vehicle_type, frame=None):
+    def send_alert(self, bay_name, vehicle_type, image_path=None, when=None):
         """
-        Sends an alert email for a detection incident, optionally with an image.
+        Sends an alert email for a detection incident, optionally attaching the
+        snapshot already stored in the evidence store. `when` (epoch seconds) is the
+        incident time, so alerts replayed after an outage show when it happened.
         """
         try:
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            incident_time = datetime.fromtimestamp(when) if when else datetime.now()
+            timestamp = incident_time.strftime("%Y-%m-%d %H:%M:%S")
             subject = f"⚠️ ALARMĂ AI Wash Guard: {bay_name}"
             
             body = f"""
@@ -53,30 +58,74 @@ class EmailNotifier:
             msg['Subject'] = subject
             msg.attach(MIMEText(body, 'plain'))
 
-            # Attach image if provided
-            if frame is not None:
+            # Attach the stored snapshot (already cropped and encoded by the snapshot pipeline)
+            if image_path:
                 try:
-                    # Encode frame as jpg
-                    ret, buffer = cv2.imencode('.jpg', frame)
-                    if ret:
-                        img_attachment = MIMEImage(buffer.tobytes(), name=f"detecție_{bay_name}.jpg")
-                        msg.attach(img_attachment)
+                    msg.attach(self._image_attachment(image_path))
                 except Exception as img_err:
-                    logger.error(f"Eroare la procesarea imaginii pentru email: {img_err}")
-
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=12)
-            server.starttls()
-            server.login(self.sender_email, self.app_password)
-            text = msg.as_string()
-            server.sendmail(self.sender_email, self.recipient_email, text)
-            server.quit()
+                    logger.error(f"Eroare la atașarea imaginii pentru email: {img_err}")
 
+            self._send(msg)
             logger.info(f"Email de alertă trimis către {self.recipient_email} pentru {bay_name}.")
             return True
         except Exception as e:
             logger.error(f"Eroare la trimiterea email-ului: {e}")
             return False
 
+    def send_digest(self, alerts, suppressed, window_s):
+        """
+        One email for several alarms: `alerts` is a list of (bay, vehicle, image_path, when),
+        `suppressed` maps bay -> alarms that were rate-limited since the last email.
+        At most one thumbnail per bay is attached (the latest).
+        """
+        try:
+            lines = [f"  {datetime.fromtimestamp(when).strftime('%H:%M:%S')}  {bay}: {vehicle}"
+                     for bay, vehicle, _, when in alerts]
+            bays = sorted({a[0] for a in alerts})
+            body = (f"REZUMAT ALARME AI Wash Guard (ultimele {window_s // 60 or 1} min)\n"
+                    f"-------------------------\n"
+                    f"{len(alerts)} alarme în {len(bays)} boxe:\n" + "\n".join(lines) + "\n")
+            if suppressed:
+                body += "\nAlarme limitate (fără email individual): " + \
+                        ", ".join(f"{bay}: {n}" for bay, n in sorted(suppressed.items())) + "\n"
+
+            msg = MIMEMultipart()
+            msg['From'] = self.sender_email
+            msg['To'] = self.recipient_email
+            msg['Subject'] = f"⚠️ REZUMAT AI Wash Guard: {len(alerts)} alarme ({', '.join(bays)})"
+            msg.attach(MIMEText(body, 'plain'))
+            latest = {}
+            for bay, _, image_path, _ in alerts:
+                if image_path and os.path.exists(image_path):
+                    latest[bay] = image_path
+            for image_path in latest.values():
+                try:
+                    msg.attach(self._image_attachment(image_path))
+                except Exception as img_err:
+                    logger.error(f"Eroare la atașarea imaginii pentru email: {img_err}")
+
+            self._send(msg)
+            logger.info(f"Email rezumat trimis: {len(alerts)} alarme, {len(latest)} imagini.")
+            return True
+        except Exception as e:
+            logger.error(f"Eroare la trimiterea email-ului rezumat: {e}")
+            return False
+
+    def _send(self, msg):
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=12)
+        server.starttls()
+        server.login(self.sender_email, self.app_password)
+        server.sendmail(self.sender_email, self.recipient_email, msg.as_string())
+        server.quit()
+
+    @staticmethod
+    def _image_attachment(image_path):
+        with open(image_path, "rb") as f:
+            data = f.read()
+        subtype = os.path.splitext(image_path)[1].lstrip(".").lower()
+        subtype = "jpeg" if subtype == "jpg" else subtype
+        return MIMEImage(data, _subtype=subtype, name=os.path.basename(image_path))
+
     def test_connection(self):
         """Sends a test email to verify credentials and recipient."""
         try:
@@ -97,3 +146,163 @@ class EmailNotifier:
             return True, "Email de test trimis cu succes!"
         except Exception as e:
             return False, str(e)
+
+
+class TokenBucket:
+    """`rate_per_hour` tokens refilled continuously, at most `burst` saved up."""
+    def __init__(self, rate_per_hour, burst):
+        self.rate = rate_per_hour / 3600.0
+        self.burst = max(1.0, float(burst))
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def available(self):
+        self._refill()
+        return self.tokens >= 1.0
+
+    def take(self):
+        self._refill()
+        self.tokens -= 1.0
+
+    def reconfigure(self, rate_per_hour, burst):
+        """New rate/burst keeping the tokens already spent (capped at the new burst)."""
+        self._refill()
+        self.rate = rate_per_hour / 3600.0
+        self.burst = max(1.0, float(burst))
+        self.tokens = min(self.tokens, self.burst)
+
+
+class AlertDispatcher:
+    """
+    Rate limiting and digest in front of EmailNotifier, so a flapping bay cannot
+    flood SMTP or the Gmail quota.
+    - The first alarm goes out immediately if its bay and the global bucket allow it.
+    - Alarms within `digest_window_s` of the bay's last email are merged into one
+      digest sent when the window closes (0 = no digest; such alarms are only counted).
+    - Alarms over the per-bay/global limit are listed in the next digest; only those
+      no digest can carry (no digest, or evicted from a full one) are counted as
+      suppressed, so each alarm is reported once. Every email, digest included,
+      takes a global token.
+    Pending digest entries are in memory; incidents themselves are in the DB/journal.
+    """
+    MAX_PENDING = 200
+
+    def __init__(self, notifier, per_bay_per_hour=6, per_bay_burst=2, global_per_hour=30,
+                 global_burst=5, digest_window_s=300):
+        self.notifier = notifier
+        self._lock = threading.Lock()
+        self._bays = {}
+        self._pending = []
+        self._last_email = {}
+        self.suppressed = {}
+        self._limited = set()  # Bays whose limit was hit since their last email (warned once)
+        self.stats = {"sent": 0, "digests": 0, "digested": 0, "suppressed": 0, "dropped": 0}
+        self.per_bay_per_hour = self.per_bay_burst = None
+        self._global, self._global_limits = None, None
+        self.configure(per_bay_per_hour, per_bay_burst, global_per_hour, global_burst, digest_window_s)
+        self._stop = threading.Event()
+        threading.Thread(target=self._digest_loop, daemon=True, name="alert-digest").start()
+
+    def configure(self, per_bay_per_hour, per_bay_burst, global_per_hour, global_burst, digest_window_s):
+        # Called again on every email/alerts change: only buckets whose limits changed are
+        # touched, and they keep their tokens, so a config save cannot reset the limits mid-burst
+        with self._lock:
+            if (per_bay_per_hour, per_bay_burst) != (self.per_bay_per_hour, self.per_bay_burst):
+                for bucket in self._bays.values():
+                    bucket.reconfigure(per_bay_per_hour, per_bay_burst)
+            self.per_bay_per_hour = per_bay_per_hour
+            self.per_bay_burst = per_bay_burst
+            self.digest_window = digest_window_s
+            if self._global is None:
+                self._global = TokenBucket(global_per_hour, global_burst)
+            elif (global_per_hour, global_burst) != self._global_limits:
+                self._global.reconfigure(global_per_hour, global_burst)
+            self._global_limits = (global_per_hour, global_burst)
+
+    @classmethod
+    def from_config(cls, notifier, cfg):
+        return cls(notifier, cfg["per_bay_per_hour"], cfg["per_bay_burst"],
+                   cfg["global_per_hour"], cfg["global_burst"], cfg["digest_window_s"])
+
+    def _bay_bucket(self, bay):
+        if bay not in self._bays:
+            self._bays[bay] = TokenBucket(self.per_bay_per_hour, self.per_bay_burst)
+        return self._bays[bay]
+
+    def submit(self, bay, vehicle, image_path=None, when=None):
+        """Returns False only if an immediate send failed (the caller may retry)."""
+        when = when or time.time()
+        with self._lock:
+            last = self._last_email.get(bay)
+            in_window = (last is not None and self.digest_window > 0
+                         and time.monotonic() - last < self.digest_window)
+            bucket = self._bay_bucket(bay)
+            allowed = bucket.available() and self._global.available()
+            if not allowed:
+                self.stats["suppressed"] += 1
+                if bay not in self._limited:
+                    self._limited.add(bay)
+                    logger.warning(f"📧 Limită email atinsă pentru {bay}; alarmele următoare intră în rezumat.")
+            if in_window or not allowed:
+                if self.digest_window > 0:
+                    self._queue((bay, vehicle, image_path, when))  # Listed in the digest
+                elif not allowed:
+                    self.suppressed[bay] = self.suppressed.get(bay, 0) + 1  # Only counted
+                return True
+            bucket.take()
+            self._global.take()
+            self._last_email[bay] = time.monotonic()
+            self._limited.discard(bay)
+            if self.digest_window <= 0 and bay in self.suppressed:
+                # No digest to carry the count; report it when the bay is allowed again
+                logger.info(f"📧 {self.suppressed.pop(bay)} alarme limitate pentru {bay} de la ultimul email.")
+
+        ok = self.notifier.send_alert(bay, vehicle, image_path=image_path, when=when)
+        if ok:
+            self.stats["sent"] += 1
+        return ok
+
+    def _queue(self, alert):
+        if len(self._pending) >= self.MAX_PENDING:
+            evicted = self._pending.pop(0)
+            self.stats["dropped"] += 1
+            # No longer listed in the digest: still reported there as a count
+            self.suppressed[evicted[0]] = self.suppressed.get(evicted[0], 0) + 1
+        self._pending.append(alert)
+
+    def _digest_loop(self):
+        while not self._stop.wait(1.0):
+            with self._lock:
+                now = time.monotonic()
+                due = self.digest_window > 0 and any(
+                    now - self._last_email.get(a[0], 0) >= self.digest_window for a in self._pending)
+                if not due or not self._global.available():
+                    continue
+                alerts, suppressed = self._pending, self.suppressed
+                self._pending, self.suppressed = [], {}
+                self._global.take()
+                for bay, _, _, _ in alerts:
+                    self._last_email[bay] = now
+            if self.notifier.send_digest(alerts, suppressed, self.digest_window):
+                self.stats["digests"] += 1
+                self.stats["digested"] += len(alerts)
+            else:
+                with self._lock:
+                    # Kept for the next window
+                    self._pending[:0] = alerts
+                    for bay, n in suppressed.items():
+                        self.suppressed[bay] = self.suppressed.get(bay, 0) + n
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, pending=len(self._pending), suppressed_by_bay=dict(self.suppressed))
+
+    def stop(self):
+        self._stop.set()
+        if self._pending:
+            logger.info(f"📧 {len(self._pending)} alarme din rezumat netrimise la oprire (rămân în DB).")
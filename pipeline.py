@@ -0,0 +1,182 @@
+"""
+pipeline.py - Supervised per-camera detection pipelines
+Each active camera runs in its own BayPipeline thread, so an exception from one
+camera's frame, the detector or its relay only takes down that bay. The
+PipelineSupervisor restarts failed workers with exponential backoff and marks a
+bay degraded when its camera stops delivering frames or its inference heartbeat
+goes stale (a hung worker is abandoned and replaced).
+"""
+
+import time
+import logging
+import threading
+import traceback
+
+from thread_budget import pin_current_thread
+
+logger = logging.getLogger(__name__)
+
+
+class BayPipeline:
+    """Wait for a new frame of one camera, run detection and update that bay."""
+    def __init__(self, engine, cam, index):
+        self.engine = engine
+        self.cam = cam
+        self.index = index
+        self.name = cam["name"]
+        self.started = time.monotonic()
+        self.heartbeat = self.started  # Last time the worker was alive between passes
+        self.last_inference = None
+        self.frames = 0
+        self.error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"bay-{self.name}")
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _run(self):
+        pin_current_thread("inference")
+        last_id = None
+        try:
+            while not self._stop.is_set():
+                self.heartbeat = time.monotonic()
+                frame_id, frame = self.engine.cameras.read_frame(self.name)
+                if frame is None or frame_id == last_id:
+                    self._stop.wait(0.02)
+                    continue
+                last_id = frame_id
+                self.engine._process_bay(self.cam, self.index, frame)
+                self.last_inference = time.monotonic()
+                self.frames += 1
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            logger.error(f"Eroare pipeline {self.name}: {self.error}\n{traceback.format_exc()}")
+
+
+class PipelineSupervisor:
+    """
+    Keeps one BayPipeline per active camera and reports each bay's health:
+    ok, degraded (no frames for `frame_timeout_s` / no heartbeat for `stall_after_s`)
+    or failed (waiting for a restart). Relays keep their last state while a bay
+    is degraded, so a bay in alarm stays off.
+    """
+    def __init__(self, engine, frame_timeout_s=10.0, stall_after_s=15.0, backoff_s=(1.0, 60.0)):
+        self.engine = engine
+        self.frame_timeout = frame_timeout_s
+        self.stall_after = stall_after_s
+        self.min_backoff, self.max_backoff = backoff_s
+        self.pipelines = {}
+        self._restart_at = {}
+        self._backoff = {}
+        self.restarts = {}
+        self.health = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, engine, cfg):
+        return cls(engine, cfg["frame_timeout_s"], cfg["stall_after_s"],
+                   (cfg["backoff_min_s"], cfg["backoff_max_s"]))
+
+    def _start(self, cam, index):
+        self.pipelines[cam["name"]] = BayPipeline(self.engine, cam, index).start()
+
+    def sync(self):
+        """Start/stop workers so they match the engine's active cameras."""
+        active = {cam["name"]: (i, cam) for i, cam in enumerate(self.engine.active_cameras)}
+        with self._lock:
+            for name in list(self.pipelines):
+                pipe = self.pipelines[name]
+                if name not in active or active[name] != (pipe.index, pipe.cam):
+                    pipe.stop()
+                    del self.pipelines[name]
+                    self.health.pop(name, None)
+            for name, (i, cam) in active.items():
+                if name not in self.pipelines and name not in self._restart_at:
+                    self._start(cam, i)
+
+    def check(self):
+        """One supervision pass: restart failed workers when due, flag stalled bays."""
+        now = time.monotonic()
+        active = {cam["name"]: (i, cam) for i, cam in enumerate(self.engine.active_cameras)}
+        with self._lock:
+            for name, due in list(self._restart_at.items()):
+                if name not in active:
+                    del self._restart_at[name]
+                elif now >= due:
+                    del self._restart_at[name]
+                    self.restarts[name] = self.restarts.get(name, 0) + 1
+                    logger.info(f"🔁 Repornire pipeline {name} (#{self.restarts[name]}).")
+                    self._start(active[name][1], active[name][0])
+
+            for name, pipe in list(self.pipelines.items()):
+                frame_age = self.engine.cameras.frame_age(name)
+                state, reason = "ok", None
+                if not pipe.is_alive() or now - pipe.heartbeat > self.stall_after:
+                    if pipe.is_alive():
+                        reason = f"inferență blocată de {now - pipe.heartbeat:.0f}s"
+                        pipe.stop()  # Abandoned: it exits on its own if it ever returns
+                    else:
+                        reason = pipe.error or "worker oprit"
+                    delay = self._backoff.get(name, self.min_backoff)
+                    self._backoff[name] = min(delay * 2, self.max_backoff)
+                    self._restart_at[name] = now + delay
+                    del self.pipelines[name]
+                    logger.error(f"⚠️ Pipeline {name} căzut ({reason}); repornire în {delay:.0f}s.")
+                    state = "failed"
+                elif frame_age is None or frame_age > self.frame_timeout:
+                    state, reason = "degraded", "fără cadre de la cameră"
+                elif now - pipe.started > self.max_backoff:
+                    self._backoff.pop(name, None)  # Stable again: next failure restarts quickly
+
+                prev = self.health.get(name, {}).get("state")
+                if state != prev and state == "degraded":
+                    logger.warning(f"⚠️ Boxa {name} degradată: {reason}.")
+                elif prev in ("degraded", "failed") and state == "ok":
+                    logger.info(f"✅ Boxa {name} funcționează din nou.")
+                self.health[name] = {
+                    "state": state, "reason": reason,
+                    "frame_age": round(frame_age, 2) if frame_age is not None else None,
+                    "inference_age": round(now - pipe.last_inference, 2) if pipe.last_inference else None,
+                    "restarts": self.restarts.get(name, 0),
+                }
+
+    def degraded_bays(self):
+        """{bay: reason} for every bay that is not running normally."""
+        with self._lock:
+            out = {name: h["reason"] for name, h in self.health.items() if h["state"] != "ok"}
+            for name in self._restart_at:
+                out.setdefault(name, "repornire în așteptare")
+            return out
+
+    def get_status(self):
+        with self._lock:
+            return {name: dict(h) for name, h in self.health.items()}
+
+    def run(self, is_running, interval=1.0):
+        heartbeat_timer = time.time()
+        while is_running():
+            self.sync()
+            self.check()
+            # Heartbeat every 30s
+            if time.time() - heartbeat_timer > 30:
+                degraded = self.degraded_bays()
+                logger.info(f"💓 Heartbeat monitorizare: {len(self.pipelines)} pipeline-uri active"
+                            + (f", degradate: {', '.join(degraded)}." if degraded else "."))
+                heartbeat_timer = time.time()
+            time.sleep(interval)
+        self.stop_all()
+
+    def stop_all(self):
+        with self._lock:
+            for pipe in self.pipelines.values():
+                pipe.stop()
+            self.pipelines.clear()
@@ -0,0 +1,177 @@
+"""
+preprocess.py - Pipelined, double-buffered preprocessing for batched inference
+Frames from all bay pipelines are letterboxed into preallocated buffers and
+converted to a model-ready float32 NCHW batch on a preprocessing thread, while
+the previous batch runs through the model on the inference thread. Buffers are
+allocated once per input size (and per camera geometry for the resize scratch),
+so steady-state preprocessing does not allocate per frame.
+"""
+
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+import cv2
+import numpy as np
+
+from thread_budget import pin_current_thread
+
+logger = logging.getLogger(__name__)
+
+PAD_VALUE = 114  # Same grey as Ultralytics letterboxing
+
+
+class BatchBuffers:
+    """
+    `slots` independent batches of `batch` letterboxed imgsz x imgsz images:
+    a uint8 BGR canvas and the float32 RGB NCHW tensor the model reads.
+    """
+    def __init__(self, imgsz, batch, slots=2):
+        self.imgsz = imgsz
+        self.batch = batch
+        self.canvas = np.full((slots, batch, imgsz, imgsz, 3), PAD_VALUE, dtype=np.uint8)
+        self.tensor = np.zeros((slots, batch, 3, imgsz, imgsz), dtype=np.float32)
+        self._scratch = {}
+
+    def _letterbox_params(self, h, w):
+        s = self.imgsz
+        scale = min(s / h, s / w)
+        nw, nh = max(1, round(w * scale)), max(1, round(h * scale))
+        return scale, nw, nh, (s - nw) // 2, (s - nh) // 2
+
+    def fill(self, slot, frames):
+        """
+        Letterbox `frames` into `slot` and convert them in one vectorised pass.
+        Returns (tensor view of the first len(frames) images, metas) where each meta
+        is (scale, left, top, width, height) for mapping boxes back to the frame.
+        """
+        canvas = self.canvas[slot]
+        metas = []
+        for i, frame in enumerate(frames):
+            h, w = frame.shape[:2]
+            scale, nw, nh, left, top = self._letterbox_params(h, w)
+            scratch = self._scratch.get((nh, nw))
+            if scratch is None:
+                scratch = self._scratch[(nh, nw)] = np.empty((nh, nw, 3), dtype=np.uint8)
+            cv2.resize(frame, (nw, nh), dst=scratch, interpolation=cv2.INTER_LINEAR)
+            img = canvas[i]
+            img[:top] = PAD_VALUE
+            img[top + nh:] = PAD_VALUE
+            img[top:top + nh, :left] = PAD_VALUE
+            img[top:top + nh, left + nw:] = PAD_VALUE
+            img[top:top + nh, left:left + nw] = scratch
+            metas.append((scale, left, top, w, h))
+
+        n = len(frames)
+        # BGR->RGB, HWC->CHW and /255 as strided views feeding one ufunc into the preallocated tensor
+        np.multiply(canvas[:n, :, :, ::-1].transpose(0, 3, 1, 2), np.float32(1 / 255.0),
+                    out=self.tensor[slot, :n], dtype=np.float32, casting="unsafe")
+        return self.tensor[slot, :n], metas
+
+
+class PipelinedDetector:
+    """
+    Front for AiDetector shared by all bay pipelines. `detect_objects(frame)` has
+    the same contract as AiDetector's and blocks the calling bay until its result
+    is ready. Requests waiting at the same time are batched (up to `max_batch`);
+    batch N+1 is preprocessed while batch N is inferred.
+    """
+    SLOTS = 2
+
+    def __init__(self, detector, max_batch=4):
+        self.detector = detector
+        self.max_batch = max(1, int(max_batch))
+        self._requests = queue.Queue()
+        self._ready = queue.Queue()
+        self._free = queue.Queue()
+        for slot in range(self.SLOTS):
+            self._free.put(slot)
+        self._buffers = None
+        self.stats = {"batches": 0, "frames": 0, "preprocess_ms": 0.0, "infer_ms": 0.0}
+        self._running = True
+        threading.Thread(target=self._preprocess_loop, daemon=True, name="preprocess").start()
+        threading.Thread(target=self._infer_loop, daemon=True, name="inference").start()
+
+    def detect_objects(self, frame):
+        if frame is None:
+            return []
+        if self.detector.remote_active() or self.detector.cascade_active():
+            # Server does its own batching; cascade passes are per frame (screen, then crop)
+            return self.detector.detect_objects(frame)
+        future = Future()
+        self._requests.put((frame, future))
+        return future.result()
+
+    def _buffers_for(self, imgsz):
+        # Reallocated only when ai.imgsz or the batch size changes; in-flight batches keep the old ones
+        if self._buffers is None or self._buffers.imgsz != imgsz or self._buffers.batch != self.max_batch:
+            self._buffers = BatchBuffers(imgsz, self.max_batch, self.SLOTS)
+        return self._buffers
+
+    def _preprocess_loop(self):
+        pin_current_thread("inference")
+        while self._running:
+            item = self._requests.get()
+            if item is None:
+                break
+            batch = [item]
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._running = False
+                    break
+                batch.append(item)
+
+            slot = self._free.get()  # Waits while both slots are in use
+            t0 = time.perf_counter()
+            try:
+                buffers = self._buffers_for(self.detector.imgsz)
+                tensor, metas = buffers.fill(slot, [frame for frame, _ in batch])
+            except Exception as e:
+                self._free.put(slot)
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.stats["preprocess_ms"] += (time.perf_counter() - t0) * 1000
+            self._ready.put((slot, tensor, metas, batch))
+
+    def _infer_loop(self):
+        pin_current_thread("inference")
+        while True:
+            item = self._ready.get()
+            if item is None:
+                break
+            slot, tensor, metas, batch = item
+            t0 = time.perf_counter()
+            try:
+                results = self.detector.detect_prepared(tensor, metas, [frame for frame, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), detections in zip(batch, results):
+                    future.set_result(detections)
+            finally:
+                # The model has finished reading the slot; it can be refilled
+                self._free.put(slot)
+            self.stats["infer_ms"] += (time.perf_counter() - t0) * 1000
+            self.stats["batches"] += 1
+            self.stats["frames"] += len(batch)
+
+    def get_stats(self):
+        s = dict(self.stats)
+        b = s["batches"] or 1
+        s["avg_batch"] = s["frames"] / b
+        s["avg_preprocess_ms"] = s["preprocess_ms"] / b
+        s["avg_infer_ms"] = s["infer_ms"] / b
+        return s
+
+    def stop(self):
+        self._running = False
+        self._requests.put(None)
+        self._ready.put(None)
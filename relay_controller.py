@@ -1,11 +1,15 @@
 """
 relay_controller.py - GPIO control for 4-channel relay module
 Specifically for AI Wash Guard on Raspberry Pi 5.
-Supports Mock Mode for cross-platform execution.
+Supports Mock Mode for cross-platform execution (simulated gpiod backend).
 """
 
 import logging
 import os
+import threading
+import time
+
+import gpio_sim
 
 try:
     import gpiod
@@ -18,19 +22,30 @@ logger = logging.getLogger(__name__)
 class RelayController:
     """
     Controls a 4-channel relay module using gpiod.
-    Supports a Mock mode for non-Linux/Pi environments.
+    Line state is cached: only transitions reach the hardware, and a bulk
+    `set_relays` applies all changes of a monitoring pass in one request.
+    Supports a Mock mode for non-Linux/Pi environments (gpio_sim backend).
     """
-    def __init__(self, pins: list, active_low: bool = True):
+    def __init__(self, pins: list, active_low: bool = True, chip=None):
         self.pins = pins
         self.active_low = active_low
-        self._line_values = {}
+        self._states = {i: False for i in range(len(pins))}
         self._request = None
-        self._chip = None
+        self._chip = chip
+        self._lock = threading.Lock()
+        self.stats = {"writes": 0, "skipped": 0, "last_ms": 0.0, "max_ms": 0.0, "total_ms": 0.0}
+
+        if chip is not None:
+            # Injected chip (e.g. gpio_sim.Chip in tests); the module follows the chip type
+            self._gpio = gpio_sim if isinstance(chip, gpio_sim.Chip) else gpiod
+            self.mock_mode = self._gpio is gpio_sim
+            self._setup_pins()
+            return
+
         self.mock_mode = not HAS_GPIOD or not os.path.exists("/dev/gpiochip0")
-        
-        if self.mock_mode:
-            logger.warning("⚠️ Mod MOCK activat (nu s-a găsit hardware GPIO). Comenzile releelor vor fi doar simulate în consolă.")
-        else:
+        self._gpio = gpio_sim if self.mock_mode else gpiod
+
+        if not self.mock_mode:
             # Identify the RP1 chip (usually gpiochip4 on Pi 5)
             try:
                 self._chip = self._find_chip()
@@ -38,6 +53,12 @@ class RelayController:
             except Exception as e:
                 logger.error(f"Eroare inițializare GPIO: {e}. Trecem în Mod MOCK.")
                 self.mock_mode = True
+                self._gpio = gpio_sim
+
+        if self.mock_mode:
+            logger.warning("⚠️ Mod MOCK activat (nu s-a găsit hardware GPIO). Comenzile releelor vor fi doar simulate.")
+            self._chip = gpio_sim.Chip()
+            self._setup_pins()
 
     def _find_chip(self):
         if not HAS_GPIOD: return None
@@ -48,7 +69,7 @@ class RelayController:
                     return gpiod.Chip(path)
                 except Exception:
                     continue
-        
+
         # Search for chip with 'rp1' in label
         import glob
         for p in glob.glob("/dev/gpiochip*"):
@@ -60,20 +81,24 @@ class RelayController:
                 continue
         return None
 
+    def _physical_value(self, on):
+        """Line value for a logical relay state (Active Low modules energize on 0)."""
+        Value = self._gpio.line.Value
+        if self.active_low:
+            return Value.INACTIVE if on else Value.ACTIVE
+        return Value.ACTIVE if on else Value.INACTIVE
+
     def _setup_pins(self):
-        if self.mock_mode or self._chip is None: return
-        
+        if self._chip is None: return
+
         line_settings = {}
         for pin in self.pins:
             # Default to OFF (physical 1 if active_low, else 0)
-            initial_val = gpiod.line.Value.ACTIVE if self.active_low else gpiod.line.Value.INACTIVE
-            self._line_values[pin] = initial_val
-            
-            line_settings[pin] = gpiod.LineSettings(
-                direction=gpiod.line.Direction.OUTPUT,
-                output_value=initial_val
+            line_settings[pin] = self._gpio.LineSettings(
+                direction=self._gpio.line.Direction.OUTPUT,
+                output_value=self._physical_value(False)
             )
-        
+
         self._request = self._chip.request_lines(
             consumer="ai_wash_guard",
             config=line_settings
@@ -81,36 +106,67 @@ class RelayController:
         logger.info(f"Pinii {self.pins} au fost inițializați.")
 
     def set_relay(self, index: int, on: bool):
-        """Set state for relay 0-3 based on pins list index."""
-        if index < 0 or index >= len(self.pins):
-            return
-            
-        pin = self.pins[index]
-        
-        if self.mock_mode:
-            logger.info(f"[MOCK] Releu {index} (Pin {pin}) -> {'PORNIT' if on else 'OPRIT'}")
-            return
-            
-        # Physical value based on Active Low logic
-        val = gpiod.line.Value.INACTIVE if on else gpiod.line.Value.ACTIVE if self.active_low else \
-              gpiod.line.Value.ACTIVE if on else gpiod.line.Value.INACTIVE
-        
-        if self._request:
-            self._request.set_value(pin, val)
-            logger.debug(f"Releu {index} (Pin {pin}) -> {'PORNIT' if on else 'OPRIT'}")
+        """Set state for relay 0-3 based on pins list index. No-op if unchanged."""
+        return self.set_relays({index: on})
 
-    def cleanup(self):
-        if self.mock_mode:
-            logger.info("[MOCK] GPIO cleanup finalizat.")
-            return
+    def set_relays(self, states: dict):
+        """
+        Apply {relay index: on} in a single line request write.
+        Relays already in the requested state are skipped; returns the number changed.
+        """
+        with self._lock:
+            changes = {}
+            for index, on in states.items():
+                if index < 0 or index >= len(self.pins):
+                    continue
+                if self._states.get(index) == on:
+                    self.stats["skipped"] += 1
+                    continue
+                changes[index] = on
+            if not changes:
+                return 0
+
+            values = {self.pins[i]: self._physical_value(on) for i, on in changes.items()}
+            if self._request:
+                t0 = time.perf_counter()
+                self._request.set_values(values)
+                self._record_latency((time.perf_counter() - t0) * 1000)
+            self._states.update(changes)
 
+        for index, on in changes.items():
+            prefix = "[MOCK] " if self.mock_mode else ""
+            # Lazy args: formatted by the log writer thread, not on the monitoring path
+            logger.info("%sReleu %d (Pin %s) -> %s", prefix, index, self.pins[index], "PORNIT" if on else "OPRIT",
+                        extra={"rate_key": False})
+        return len(changes)
+
+    def _record_latency(self, ms):
+        self.stats["writes"] += 1
+        self.stats["last_ms"] = ms
+        self.stats["total_ms"] += ms
+        self.stats["max_ms"] = max(self.stats["max_ms"], ms)
+
+    def get_state(self, index: int):
+        return self._states.get(index, False)
+
+    def get_stats(self):
+        """Write counts and relay switch latency (time spent in the line request write)."""
+        with self._lock:
+            s = dict(self.stats)
+        s["avg_ms"] = s["total_ms"] / s["writes"] if s["writes"] else 0.0
+        return s
+
+    def cleanup(self):
         if self._request:
-            # Turn all off before releasing
-            for pin in self.pins:
-                off_val = gpiod.line.Value.ACTIVE if self.active_low else gpiod.line.Value.INACTIVE
-                self._request.set_value(pin, off_val)
-            self._request.release()
-        
+            # Turn all off before releasing, in one request
+            off_val = self._physical_value(False)
+            try:
+                self._request.set_values({pin: off_val for pin in self.pins})
+            finally:
+                self._request.release()
+                self._request = None
+        self._states = {i: False for i in range(len(self.pins))}
+
         if self._chip:
             self._chip.close()
-        logger.info("GPIO cleanup finalizat.")
+        logger.info(f"{'[MOCK] ' if self.mock_mode else ''}GPIO cleanup finalizat.")
@@ -0,0 +1,266 @@
+"""
+sweep_operating_point.py - Accuracy-vs-speed sweep over detector settings
+Runs AiDetector over a labelled clip set for every combination of model,
+backend, input size and confidence, and reports frame precision/recall,
+alarm recall, alarm latency and throughput per setting plus the Pareto front.
+
+Clip set: a directory with video files and a labels.json:
+    {"clips": [{"file": "boxa1_atv.mp4", "events": [[12.0, 31.5], [80.0, 95.0]]},
+               {"file": "boxa2_masini.mp4", "events": []}]}
+`events` are the [start, end] seconds where a forbidden vehicle is in the bay.
+
+    python sweep_operating_point.py clips/ --models yolov8n.pt --imgsz 320,480,640 \\
+        --conf 0.25,0.35,0.45,0.55 --backends pt,onnx --min-recall 0.95 --write-config
+"""
+
+import os
+import sys
+import csv
+import json
+import shutil
+import time
+import logging
+import argparse
+import itertools
+
+import cv2
+
+from ai_detector import AiDetector
+from config_manager import ConfigManager
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+logger = logging.getLogger("SWEEP")
+
+# Must match AIWashGuard.DETECTION_THRESHOLD (consecutive positive frames before an alarm)
+DEFAULT_THRESHOLD = 2
+
+
+def load_clip_set(directory):
+    with open(os.path.join(directory, "labels.json")) as f:
+        labels = json.load(f)
+    clips = []
+    for clip in labels["clips"]:
+        path = os.path.join(directory, clip["file"])
+        if not os.path.exists(path):
+            logger.error(f"[SKIP] Clip lipsă: {path}")
+            continue
+        clips.append({"path": path, "events": [tuple(e) for e in clip.get("events", [])]})
+    return clips
+
+
+def sample_frames(path, fps):
+    """Yields (timestamp_s, frame) at `fps`, like CameraStream with capture.max_fps."""
+    cap = cv2.VideoCapture(path)
+    next_t = 0.0
+    try:
+        while True:
+            if not cap.grab():
+                break
+            t = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+            if t + 1e-6 < next_t:
+                continue
+            ok, frame = cap.retrieve()
+            if ok:
+                next_t = t + 1.0 / fps
+                yield t, frame
+    finally:
+        cap.release()
+
+
+def export_backend(model_path, backend, imgsz, cache):
+    """Model file for a backend ("pt" = as is); other formats are exported once via Ultralytics."""
+    if backend == "pt":
+        return model_path
+    key = (model_path, backend, imgsz)
+    if key not in cache:
+        from ultralytics import YOLO
+        logger.info(f"Export {model_path} -> {backend} (imgsz {imgsz})...")
+        exported = str(YOLO(model_path).export(format=backend, imgsz=imgsz)).rstrip("/")
+        # Every export of a model/format gets the same name; keep one per imgsz
+        # (yolov8n.onnx -> yolov8n_640.onnx, yolov8n_openvino_model -> yolov8n_640_openvino_model)
+        stem = os.path.splitext(os.path.basename(model_path))[0]
+        target = os.path.join(os.path.dirname(exported),
+                              os.path.basename(exported).replace(stem, f"{stem}_{imgsz}", 1))
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        os.replace(exported, target)
+        cache[key] = target
+    return cache[key]
+
+
+def run_inference(model_file, imgsz, min_conf, clips, fps):
+    """
+    One pass per (model, backend, imgsz) at the lowest confidence of the grid.
+    Returns per-clip lists of (t, best target score) and the inference time per frame.
+    """
+    detector = AiDetector(model_path=model_file, confidence=min_conf, imgsz=imgsz)
+    logging.getLogger("ai_detector").setLevel(logging.ERROR)  # No per-detection warnings
+    # Warm-up so model initialisation is not counted as throughput
+    for clip in clips[:1]:
+        for _, frame in itertools.islice(sample_frames(clip["path"], fps), 3):
+            detector.detect_objects(frame)
+
+    scores, infer_s = [], []
+    for clip in clips:
+        clip_scores = []
+        for t, frame in sample_frames(clip["path"], fps):
+            t0 = time.perf_counter()
+            detections = detector.detect_objects(frame)
+            infer_s.append(time.perf_counter() - t0)
+            clip_scores.append((t, detections[0].score if detections else 0.0))
+        scores.append(clip_scores)
+    return scores, infer_s
+
+
+def in_event(t, events, grace=0.0):
+    return any(start - grace <= t <= end + grace for start, end in events)
+
+
+def evaluate(clips, scores, conf, threshold):
+    """Frame precision/recall plus alarm-level recall, false alarms and latency."""
+    tp = fp = fn = 0
+    events_total = events_hit = false_alarms = 0
+    latencies = []
+    for clip, clip_scores in zip(clips, scores):
+        events = clip["events"]
+        streak = 0
+        alarm = False
+        hit = set()
+        for t, score in clip_scores:
+            positive = score >= conf
+            truth = in_event(t, events)
+            tp += positive and truth
+            fp += positive and not truth
+            fn += (not positive) and truth
+
+            streak = streak + 1 if positive else 0
+            if streak >= threshold and not alarm:
+                alarm = True
+                # An alarm shortly after the vehicle left still belongs to that event
+                owner = next((i for i, (s, e) in enumerate(events) if s <= t <= e + 1.0), None)
+                if owner is None:
+                    false_alarms += 1
+                elif owner not in hit:
+                    hit.add(owner)
+                    latencies.append(t - events[owner][0])
+            elif streak == 0:
+                alarm = False
+        events_total += len(events)
+        events_hit += len(hit)
+
+    precision = tp / (tp + fp) if tp + fp else 1.0
+    recall = tp / (tp + fn) if tp + fn else 1.0
+    return {
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "alarm_recall": round(events_hit / events_total, 4) if events_total else 1.0,
+        "false_alarms": false_alarms,
+        "alarm_latency_s": round(sum(latencies) / len(latencies), 2) if latencies else None,
+    }
+
+
+def pareto_front(rows):
+    """Rows not dominated on (alarm recall ↑, precision ↑, fps ↑, alarm latency ↓)."""
+    def key(r):
+        latency = r["alarm_latency_s"] if r["alarm_latency_s"] is not None else float("inf")
+        return (r["alarm_recall"], r["precision"], r["fps"], -latency)
+
+    front = []
+    for r in rows:
+        kr = key(r)
+        dominated = any(all(a >= b for a, b in zip(key(o), kr)) and key(o) != kr for o in rows)
+        if not dominated:
+            front.append(r)
+    return sorted(front, key=lambda r: -r["fps"])
+
+
+def choose(front, min_recall, min_precision):
+    """Fastest Pareto setting that meets the recall/precision floor."""
+    ok = [r for r in front if r["alarm_recall"] >= min_recall and r["precision"] >= min_precision]
+    return max(ok, key=lambda r: r["fps"]) if ok else None
+
+
+def print_table(rows, title):
+    print(f"\n{title}")
+    print(f"{'model':<28}{'backend':<8}{'imgsz':>6}{'conf':>6}{'prec':>7}{'recall':>8}"
+          f"{'alarmR':>8}{'falseA':>7}{'lat_s':>7}{'fps':>7}")
+    for r in rows:
+        lat = f"{r['alarm_latency_s']:.2f}" if r["alarm_latency_s"] is not None else "-"
+        print(f"{os.path.basename(r['model']):<28}{r['backend']:<8}{r['imgsz']:>6}{r['conf']:>6.2f}"
+              f"{r['precision']:>7.3f}{r['recall']:>8.3f}{r['alarm_recall']:>8.3f}"
+              f"{r['false_alarms']:>7}{lat:>7}{r['fps']:>7.1f}")
+
+
+def csv_list(cast):
+    return lambda s: [cast(v) for v in s.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep AiDetector settings over a labelled clip set")
+    parser.add_argument("clips", help="Director cu clipuri și labels.json")
+    parser.add_argument("--models", type=csv_list(str), default=["yolov8n.pt"])
+    parser.add_argument("--backends", type=csv_list(str), default=["pt"], help="pt,onnx,ncnn,openvino...")
+    parser.add_argument("--imgsz", type=csv_list(int), default=[320, 480, 640])
+    parser.add_argument("--conf", type=csv_list(float), default=[0.25, 0.35, 0.45, 0.55])
+    parser.add_argument("--fps", type=float, default=5.0, help="Cadre analizate pe secundă (capture.max_fps)")
+    parser.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--min-recall", type=float, default=0.95, help="Recall minim la nivel de alarmă")
+    parser.add_argument("--min-precision", type=float, default=0.0)
+    parser.add_argument("--report", help="Salvează toate rezultatele (.csv sau .json)")
+    parser.add_argument("--write-config", action="store_true", help="Scrie setarea aleasă în config.json")
+    parser.add_argument("--config", default="config.json")
+    args = parser.parse_args()
+
+    clips = load_clip_set(args.clips)
+    if not clips:
+        logger.error("Niciun clip de evaluat.")
+        sys.exit(1)
+
+    rows, exports = [], {}
+    for model_path, backend, imgsz in itertools.product(args.models, args.backends, args.imgsz):
+        try:
+            model_file = export_backend(model_path, backend, imgsz, exports)
+            scores, infer_s = run_inference(model_file, imgsz, min(args.conf), clips, args.fps)
+        except Exception as e:
+            logger.error(f"[FAIL] {model_path}/{backend}/{imgsz}: {e}")
+            continue
+        fps = len(infer_s) / sum(infer_s) if infer_s else 0.0
+        logger.info(f"[OK] {model_path}/{backend}/{imgsz}: {len(infer_s)} cadre, {fps:.1f} FPS")
+        for conf in args.conf:
+            row = {"model": model_file, "backend": backend, "imgsz": imgsz, "conf": conf, "fps": round(fps, 2)}
+            row.update(evaluate(clips, scores, conf, args.threshold))
+            rows.append(row)
+
+    if not rows:
+        sys.exit(1)
+    print_table(rows, "Toate setările")
+    front = pareto_front(rows)
+    print_table(front, "Frontul Pareto (alarm recall, precizie, FPS, latență)")
+
+    if args.report:
+        if args.report.endswith(".json"):
+            with open(args.report, "w") as f:
+                json.dump({"rows": rows, "pareto": front}, f, indent=2)
+        else:
+            with open(args.report, "w", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=list(rows[0]) + ["pareto"])
+                writer.writeheader()
+                for r in rows:
+                    writer.writerow(dict(r, pareto=r in front))
+        logger.info(f"Raport salvat: {args.report}")
+
+    best = choose(front, args.min_recall, args.min_precision)
+    if best is None:
+        logger.warning(f"Nicio setare nu atinge recall ≥ {args.min_recall} și precizie ≥ {args.min_precision}.")
+        sys.exit(2)
+    print_table([best], "Setarea aleasă")
+
+    if args.write_config:
+        cm = ConfigManager(args.config)
+        ai = dict(cm.get_ai_settings(), model=best["model"], imgsz=best["imgsz"], confidence=best["conf"])
+        cm.update_settings("ai", ai)
+        logger.info(f"✅ config.json actualizat: model={best['model']} imgsz={best['imgsz']} conf={best['conf']}")
+
+
+if __name__ == "__main__":
+    main()
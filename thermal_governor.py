@@ -0,0 +1,198 @@
+"""
+thermal_governor.py - Thermal- and load-aware degradation ladder
+Reads the SoC temperature and CPU frequency from sysfs and the detection
+latency reported by the bay pipelines. When the Pi runs hot, throttles or falls
+behind, the governor steps down a ladder of cheaper settings (smaller input
+size, fewer frames per bay, motion gating for idle bays) and steps back up once
+there is headroom again. Levels are runtime overrides; config.json is untouched.
+
+`sysfs_root` is configurable so a fake tree can stand in for /sys:
+    <root>/class/thermal/thermal_zone0/temp                  millidegrees C
+    <root>/devices/system/cpu/cpu0/cpufreq/scaling_cur_freq  kHz
+    <root>/devices/system/cpu/cpu0/cpufreq/cpuinfo_max_freq  kHz
+"""
+
+import os
+import time
+import logging
+import threading
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+_TEMP = "class/thermal/thermal_zone0/temp"
+_CUR_FREQ = "devices/system/cpu/cpu0/cpufreq/scaling_cur_freq"
+_MAX_FREQ = "devices/system/cpu/cpu0/cpufreq/cpuinfo_max_freq"
+
+
+def _read_int(root, rel):
+    try:
+        with open(os.path.join(root, rel)) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+class MotionGate:
+    """Cheap per-bay change detector on a tiny grey thumbnail of the frame."""
+    def __init__(self, threshold=6.0, refresh_s=10.0):
+        self.threshold = threshold
+        self.refresh_s = refresh_s
+        self._last = {}  # bay -> (thumbnail, time of last full pass)
+
+    def should_process(self, bay, frame):
+        small = cv2.cvtColor(cv2.resize(frame, (64, 36), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        now = time.monotonic()
+        prev = self._last.get(bay)
+        if prev is not None and now - prev[1] < self.refresh_s and \
+                float(cv2.absdiff(small, prev[0]).mean()) < self.threshold:
+            return False
+        self._last[bay] = (small, now)
+        return True
+
+    def reset(self):
+        self._last.clear()
+
+
+class ThermalGovernor:
+    """
+    Level 0 runs the configured settings; level N applies ladder[N-1].
+    Steps down after `step_up_s` of pressure (hot, throttled or slow) and back up
+    after `step_down_s` of headroom (cool, full clock and fast).
+    """
+    def __init__(self, engine, sysfs_root="/sys", temp_high_c=78.0, temp_low_c=70.0,
+                 latency_high_ms=400.0, latency_low_ms=200.0, step_up_s=10.0, step_down_s=60.0,
+                 interval_s=2.0, ladder=(), motion_threshold=6.0, motion_refresh_s=10.0):
+        self.engine = engine
+        self.sysfs_root = sysfs_root
+        self.temp_high, self.temp_low = temp_high_c, temp_low_c
+        self.latency_high, self.latency_low = latency_high_ms, latency_low_ms
+        self.step_up_s, self.step_down_s = step_up_s, step_down_s
+        self.interval = interval_s
+        self.ladder = [dict(step) for step in ladder]
+        self.motion = MotionGate(motion_threshold, motion_refresh_s)
+        self.level = 0
+        self.latency_ms = None  # EWMA of per-frame detection latency
+        self.readings = {}
+        self._pressure_since = None
+        self._headroom_since = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, engine, cfg):
+        return cls(engine, cfg["sysfs_root"], cfg["temp_high_c"], cfg["temp_low_c"],
+                   cfg["latency_high_ms"], cfg["latency_low_ms"], cfg["step_up_s"], cfg["step_down_s"],
+                   cfg["interval_s"], cfg["ladder"], cfg["motion_threshold"], cfg["motion_refresh_s"])
+
+    # ── Inputs ───────────────────────────────────────────────────────────────
+    def record_latency(self, ms):
+        """Called by the bay pipelines after every detection."""
+        self.latency_ms = ms if self.latency_ms is None else 0.9 * self.latency_ms + 0.1 * ms
+
+    def read_sensors(self):
+        temp = _read_int(self.sysfs_root, _TEMP)
+        cur = _read_int(self.sysfs_root, _CUR_FREQ)
+        top = _read_int(self.sysfs_root, _MAX_FREQ)
+        self.readings = {
+            "temp_c": round(temp / 1000.0, 1) if temp is not None else None,
+            "freq_mhz": cur // 1000 if cur is not None else None,
+            # A low clock alone is just the ondemand governor idling; warm and slow means throttling
+            "throttled": bool(cur and top and cur < 0.9 * top and temp is not None
+                              and temp / 1000.0 >= self.temp_low),
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+        }
+        return self.readings
+
+    # ── Current level ────────────────────────────────────────────────────────
+    @property
+    def settings(self):
+        return self.ladder[self.level - 1] if self.level else {}
+
+    def motion_gated(self):
+        return bool(self.settings.get("motion_gate"))
+
+    def should_process(self, bay, frame, idle):
+        """False for a frame of an idle bay that can be skipped at this level."""
+        if not idle or not self.motion_gated():
+            return True
+        return self.motion.should_process(bay, frame)
+
+    def apply(self):
+        """Push the current level onto the detector and cameras (also after config reloads)."""
+        step = self.settings
+        ai_cfg = self.engine.config_mgr.get_ai_settings()
+        detector = getattr(self.engine, "detector", None)
+        if detector is not None:
+            detector.set_imgsz(min(ai_cfg["imgsz"], step.get("imgsz", ai_cfg["imgsz"])))
+        cameras = getattr(self.engine, "cameras", None)
+        if hasattr(cameras, "set_fps_cap"):
+            cameras.set_fps_cap(step.get("max_fps"))
+        if not step.get("motion_gate"):
+            self.motion.reset()
+
+    def _set_level(self, level, reason):
+        old, self.level = self.level, max(0, min(level, len(self.ladder)))
+        if self.level == old:
+            return
+        self.apply()
+        r = self.readings
+        msg = (f"nivel {old} -> {self.level} {self.settings or '(setări normale)'} — {reason} "
+               f"[{r.get('temp_c')}°C, {r.get('freq_mhz')} MHz, {r.get('latency_ms')} ms]")
+        if self.level > old:
+            logger.warning(f"🌡️ Degradare termică: {msg}")
+        else:
+            logger.info(f"❄️ Revenire: {msg}")
+
+    def check(self):
+        """One governor pass: read sensors and move at most one step on the ladder."""
+        r = self.read_sensors()
+        now = time.monotonic()
+        temp, latency = r["temp_c"], r["latency_ms"]
+        reasons = []
+        if temp is not None and temp >= self.temp_high:
+            reasons.append("temperatură")
+        if r["throttled"]:
+            reasons.append("frecvență redusă")
+        if latency is not None and latency >= self.latency_high:
+            reasons.append("latență")
+        headroom = not reasons and (temp is None or temp < self.temp_low) and \
+            (latency is None or latency < self.latency_low)
+
+        if reasons:
+            self._headroom_since = None
+            self._pressure_since = self._pressure_since or now
+            if now - self._pressure_since >= self.step_up_s and self.level < len(self.ladder):
+                self._set_level(self.level + 1, ", ".join(reasons))
+                self._pressure_since = now
+        elif headroom:
+            self._pressure_since = None
+            self._headroom_since = self._headroom_since or now
+            if now - self._headroom_since >= self.step_down_s and self.level > 0:
+                self._set_level(self.level - 1, "rezervă termică")
+                self._headroom_since = now
+        else:
+            # Between the thresholds: hold the current level
+            self._pressure_since = self._headroom_since = None
+
+    def get_status(self):
+        return dict(self.readings, level=self.level, max_level=len(self.ladder), settings=self.settings)
+
+    # ── Thread ───────────────────────────────────────────────────────────────
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Eroare guvernor termic: {e}")
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True, name="thermal-governor")
+        self._thread.start()
+        return self
+
+    def stop(self, restore=True):
+        self._stop.set()
+        if restore:
+            self._set_level(0, "guvernor oprit")
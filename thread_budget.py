@@ -0,0 +1,224 @@
+"""
+thread_budget.py - CPU core affinity and thread budget for the Pi 5
+Caps PyTorch, OpenCV and ONNX Runtime thread pools and pins the capture,
+inference, UI and I/O roles to their own cores so they stop oversubscribing
+a 4-core CPU. Threads created by a pinned thread (e.g. the torch/OpenMP pool
+spawned on the first inference) inherit its core mask.
+
+Measurement mode compares inference latency jitter across layouts:
+    python thread_budget.py --measure --frames 200
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+import statistics
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+HAS_AFFINITY = hasattr(os, "sched_setaffinity")
+
+_budget = {"enabled": False}
+_pinned = {}
+
+
+def apply_thread_budget(cfg):
+    """Apply the `performance` config section. Safe to call again on config change."""
+    global _budget
+    _budget = dict(cfg)
+    if not cfg.get("enabled"):
+        return
+
+    # Honoured by OpenMP/BLAS pools that are not initialised yet
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ.setdefault(var, str(cfg["torch_threads"]))
+
+    try:
+        import torch
+        torch.set_num_threads(int(cfg["torch_threads"]))
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            pass  # Only settable before the first parallel op; fine on hot reload
+    except ImportError:
+        pass
+
+    try:
+        import cv2
+        cv2.setNumThreads(int(cfg["opencv_threads"]))
+    except ImportError:
+        pass
+
+    _limit_onnxruntime(int(cfg["onnx_threads"]))
+    logger.info(f"🧵 Buget fire: torch={cfg['torch_threads']} opencv={cfg['opencv_threads']} "
+                f"onnx={cfg['onnx_threads']} afinitate={cfg.get('affinity') if HAS_AFFINITY else 'indisponibilă'}")
+
+
+def _limit_onnxruntime(threads):
+    """
+    Ultralytics creates its ONNX Runtime session without SessionOptions, so the
+    intra-op pool would default to all cores. Inject the budget into sessions
+    created without explicit options.
+    """
+    try:
+        import onnxruntime as ort
+    except ImportError:
+        return
+    session_cls = ort.InferenceSession
+    if getattr(session_cls, "_awg_threads", None) is not None:
+        session_cls._awg_threads = threads
+        return
+    original_init = session_cls.__init__
+
+    def __init__(self, path_or_bytes, sess_options=None, *args, **kwargs):
+        if sess_options is None:
+            sess_options = ort.SessionOptions()
+            sess_options.intra_op_num_threads = session_cls._awg_threads
+            sess_options.inter_op_num_threads = 1
+        original_init(self, path_or_bytes, sess_options, *args, **kwargs)
+
+    session_cls.__init__ = __init__
+    session_cls._awg_threads = threads
+
+
+def role_cores(role):
+    """Cores configured for `role` that exist on this machine, None when unpinned."""
+    if not _budget.get("enabled") or not HAS_AFFINITY:
+        return None
+    cores = {c for c in _budget.get("affinity", {}).get(role) or () if c < (os.cpu_count() or 1)}
+    return cores or None
+
+
+def pin_current_thread(role):
+    """Pin the calling thread to the cores configured for `role` (capture/inference/ui/io)."""
+    cores = role_cores(role)
+    if not cores:
+        return False
+    try:
+        os.sched_setaffinity(0, cores)  # pid 0 = calling thread on Linux
+    except OSError as e:
+        logger.warning(f"Afinitate {role} -> {sorted(cores)} eșuată: {e}")
+        return False
+    _pinned[threading.get_native_id()] = (role, sorted(cores))
+    return True
+
+
+def get_layout():
+    """Roles and cores of the threads pinned so far (for diagnostics)."""
+    return {f"{role}:{tid}": cores for tid, (role, cores) in _pinned.items()}
+
+
+# ── Measurement mode ─────────────────────────────────────────────────────────
+LAYOUTS = {
+    "implicit": {"enabled": False},
+    "torch4-fara-afinitate": {"enabled": True, "torch_threads": 4, "opencv_threads": 4, "onnx_threads": 4,
+                              "affinity": {}},
+    "torch3-inferenta-1-3": {"enabled": True, "torch_threads": 3, "opencv_threads": 1, "onnx_threads": 3,
+                             "affinity": {"capture": [0], "inference": [1, 2, 3], "ui": [0], "io": [0]}},
+    "torch2-inferenta-1-2": {"enabled": True, "torch_threads": 2, "opencv_threads": 1, "onnx_threads": 2,
+                             "affinity": {"capture": [0], "inference": [1, 2], "ui": [3], "io": [3]}},
+}
+
+
+def _capture_load(stop, resolution):
+    """Simulated decode/copy work of the capture threads (cv2 resize + colour conversion)."""
+    import cv2
+    import numpy as np
+    pin_current_thread("capture")
+    w, h = resolution
+    frame = np.random.default_rng(1).integers(0, 255, (h, w, 3), dtype=np.uint8)
+    while not stop.is_set():
+        small = cv2.resize(frame, (w // 2, h // 2))
+        cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        time.sleep(0.005)
+
+
+def _measure_worker(layout, model, frames, imgsz, capture_threads):
+    """Runs in a fresh process so thread pools are created under the layout being tested."""
+    apply_thread_budget(layout)
+    import numpy as np
+    from ai_detector import AiDetector
+    logging.getLogger("ai_detector").setLevel(logging.ERROR)
+
+    stop = threading.Event()
+    loaders = [threading.Thread(target=_capture_load, args=(stop, (1280, 720)), daemon=True)
+               for _ in range(capture_threads)]
+    for t in loaders:
+        t.start()
+
+    pin_current_thread("inference")
+    detector = AiDetector(model_path=model, imgsz=imgsz)
+    frame = np.random.default_rng(0).integers(0, 255, (720, 1280, 3), dtype=np.uint8)
+    for _ in range(5):
+        detector.detect_objects(frame)
+
+    latencies = []
+    for _ in range(frames):
+        t0 = time.perf_counter()
+        detector.detect_objects(frame)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    stop.set()
+
+    latencies.sort()
+    pick = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+    return {"p50": pick(50), "p95": pick(95), "p99": pick(99), "max": latencies[-1],
+            "stdev": statistics.pstdev(latencies), "fps": 1000 / statistics.mean(latencies)}
+
+
+def measure(layouts, model, frames, imgsz, capture_threads):
+    results = {}
+    for name, layout in layouts.items():
+        cmd = [sys.executable, os.path.abspath(__file__), "--_worker", json.dumps(layout),
+               "--model", model, "--frames", str(frames), "--imgsz", str(imgsz),
+               "--capture-threads", str(capture_threads)]
+        logger.info(f"⏱️ Măsurare layout: {name}")
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            logger.error(f"[FAIL] {name}: {proc.stderr.strip().splitlines()[-1:]}")
+            continue
+        results[name] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    print(f"\n{'layout':<26}{'p50':>8}{'p95':>8}{'p99':>8}{'max':>8}{'jitter':>8}{'fps':>7}")
+    for name, r in results.items():
+        print(f"{name:<26}{r['p50']:>8.1f}{r['p95']:>8.1f}{r['p99']:>8.1f}{r['max']:>8.1f}"
+              f"{r['stdev']:>8.1f}{r['fps']:>7.1f}")
+    if results:
+        best = min(results, key=lambda n: results[n]["p99"])
+        print(f"\nCel mai mic p99: {best}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Buget de fire și afinitate CPU")
+    parser.add_argument("--measure", action="store_true", help="Compară jitter-ul inferenței între layout-uri")
+    parser.add_argument("--model", default="yolov8n.pt")
+    parser.add_argument("--frames", type=int, default=100)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--capture-threads", type=int, default=4, help="Fire de captură simulate")
+    parser.add_argument("--config", default="config.json", help="Include layout-ul din config")
+    parser.add_argument("--_worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._worker:
+        print(json.dumps(_measure_worker(json.loads(args._worker), args.model, args.frames,
+                                         args.imgsz, args.capture_threads)))
+        return
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    layouts = dict(LAYOUTS)
+    if os.path.exists(args.config):
+        from config_manager import ConfigManager
+        layouts["config.json"] = dict(ConfigManager(args.config).get_performance_settings(), enabled=True)
+    if args.measure:
+        measure(layouts, args.model, args.frames, args.imgsz, args.capture_threads)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()